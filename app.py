@@ -6,18 +6,40 @@ from flask_cors import CORS
 import os
 import json
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
 from google.transit import gtfs_realtime_pb2
 from google.protobuf.json_format import MessageToDict
 from datetime import datetime
-import requests
 import shutil
+from app.core.feed_poller import FIRST_SNAPSHOT_TIMEOUT, get_feed_poller
+from app.core.feed_fetcher import get_feed_fetcher
+from app.core.feed_cache import cached_process, feed_cache, file_cache_key
+from app.core.columnar import decode_vehicle_columns
+from app.core.static_gtfs import get_static_gtfs
+from app.core.schedule_delays import decode_scheduled_trip_updates
+from app.core.feed_archive import get_feed_archive, read_feed
+from app.core.time_format import format_epoch, format_row_times
+from app.core.chart_renderer import ChartRenderer
+from app.utils.config_manager import get_source_id
+from app.api.data_routes import api_archive_timeline, api_stream
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
+# Live updates pushed as Server-Sent Events by the data API
+app.add_url_rule('/api/stream', view_func=api_stream)
+
+# Archived time span, used by the dashboard to scrub back in time
+app.add_url_rule('/api/archive/<feed_name>/timeline', view_func=api_archive_timeline)
+
+# Charts of the dashboard, rendered in the background once per snapshot
+chart_renderer = ChartRenderer(os.path.join('static', 'charts'), url_prefix='/static/charts/', labels={
+    'delay_distribution': {
+        'title': 'Distribution des retards',
+        'xlabel': 'Retard (minutes)',
+        'ylabel': 'Nombre de mises à jour'
+    }
+})
+
 # Configuration file path
 CONFIG_FILE = 'config/config.json'
 
@@ -60,54 +82,38 @@ def save_config(config):
         print(f"Error saving config: {e}")
         return False
 
-# Function to download GTFS-RT data from URL
-def download_gtfs_rt_from_url(url, file_path):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            return True
-        else:
-            print(f"Error downloading GTFS-RT from {url}: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"Error downloading GTFS-RT from {url}: {e}")
-        return False
-
-# Function to get GTFS-RT feed based on current configuration
-def get_gtfs_rt_feed(feed_type):
+# Function to get the latest GTFS-RT feed published by the background poller,
+# or the archived feed nearest to the 'at' epoch seconds
+def get_gtfs_rt_feed(feed_type, at=None):
+    if at is not None:
+        return get_archived_feed(feed_type, at)
+    poller = get_feed_poller()
+    chart_renderer.watch(poller.store)
+    poller.wait_until_ready(FIRST_SNAPSHOT_TIMEOUT)
+    return poller.store.get_feed(feed_type)
+
+# Function to get the archived feed of the current source nearest to a timestamp
+def get_archived_feed(feed_type, at):
+    archive = get_feed_archive()
     config = load_config()
-    current_source = config['sources'][config['current_source']]
-    
-    # Define GTFS-RT directory and file paths
-    GTFS_RT_DIR = 'data/gtfs_rt'
-    os.makedirs(GTFS_RT_DIR, exist_ok=True)
-    
-    file_map = {
-        'trip_update': os.path.join(GTFS_RT_DIR, 'TripUpdate.pb'),
-        'vehicle_position': os.path.join(GTFS_RT_DIR, 'VehiclePosition.pb'),
-        'alert': os.path.join(GTFS_RT_DIR, 'Alert.pb')
-    }
-    
-    if not current_source['use_local_files']:
-        # Download the file from URL
-        url_key = f"{feed_type}_url"
-        if url_key in current_source and current_source[url_key]:
-            file_path = file_map[feed_type]
-            download_gtfs_rt_from_url(current_source[url_key], file_path)
-    
-    return read_gtfs_rt_file(file_map[feed_type])
+    if archive is None or not 0 <= config['current_source'] < len(config['sources']):
+        return None
+    found = archive.find_nearest(get_source_id(config['sources'][config['current_source']]), feed_type, at)
+    return read_feed(found[1], found[2])[1] if found else None
 
-# Function to read GTFS-RT files
+# Function to read GTFS-RT files (parsed feeds are cached on path, mtime and size)
 def read_gtfs_rt_file(file_path):
     if not os.path.exists(file_path):
         print(f"Warning: GTFS-RT file not found: {file_path}")
         return None
     
-    feed = gtfs_realtime_pb2.FeedMessage()
-    with open(file_path, 'rb') as f:
-        feed.ParseFromString(f.read())
+    key = file_cache_key(file_path)
+    feed = feed_cache.get(key)
+    if feed is None:
+        feed = gtfs_realtime_pb2.FeedMessage()
+        with open(file_path, 'rb') as f:
+            feed.ParseFromString(f.read())
+        feed_cache.put(key, feed, weight=key[2])
     return feed
 
 # Function to convert feed to dictionary
@@ -121,112 +127,18 @@ def process_trip_updates(feed):
     if not feed:
         return None
     
-    trip_updates = []
-    for entity in feed.entity:
-        if entity.HasField('trip_update'):
-            trip_update = entity.trip_update
-            trip_id = trip_update.trip.trip_id if trip_update.trip.HasField('trip_id') else 'Unknown'
-            route_id = trip_update.trip.route_id if trip_update.trip.HasField('route_id') else 'Unknown'
-            
-            for stop_time_update in trip_update.stop_time_update:
-                stop_id = stop_time_update.stop_id if stop_time_update.HasField('stop_id') else 'Unknown'
-                delay_seconds = stop_time_update.departure.delay if stop_time_update.HasField('departure') and stop_time_update.departure.HasField('delay') else (
-                    stop_time_update.arrival.delay if stop_time_update.HasField('arrival') and stop_time_update.arrival.HasField('delay') else 0
-                )
-                delay_minutes = round(delay_seconds / 60, 1)
-                
-                # Format timestamps
-                arrival_time = None
-                departure_time = None
-                
-                if stop_time_update.HasField('arrival') and stop_time_update.arrival.HasField('time'):
-                    arrival_time = datetime.fromtimestamp(stop_time_update.arrival.time).strftime('%Y-%m-%d %H:%M:%S')
-                
-                if stop_time_update.HasField('departure') and stop_time_update.departure.HasField('time'):
-                    departure_time = datetime.fromtimestamp(stop_time_update.departure.time).strftime('%Y-%m-%d %H:%M:%S')
-                
-                trip_updates.append({
-                    'trip_id': trip_id,
-                    'route_id': route_id,
-                    'stop_id': stop_id,
-                    'delay_seconds': delay_seconds,
-                    'delay_minutes': delay_minutes,
-                    'arrival_time': arrival_time,
-                    'departure_time': departure_time
-                })
-    
-    return trip_updates
+    # Delays missing from the feed are computed from the static schedule
+    return cached_process(decode_scheduled_trip_updates, feed).to_records()
 
 # Process vehicle positions
 def process_vehicle_positions(feed):
     if not feed:
         return None
     
-    # Load routes data
-    routes_data = load_routes_data()
-    
-    vehicle_positions = []
-    for entity in feed.entity:
-        if entity.HasField('vehicle'):
-            vehicle = entity.vehicle
-            vehicle_id = vehicle.vehicle.id if vehicle.HasField('vehicle') and vehicle.vehicle.HasField('id') else 'Unknown'
-            trip_id = vehicle.trip.trip_id if vehicle.HasField('trip') and vehicle.trip.HasField('trip_id') else 'Unknown'
-            route_id = vehicle.trip.route_id if vehicle.HasField('trip') and vehicle.trip.HasField('route_id') else 'Unknown'
-            
-            # Get position info
-            latitude = vehicle.position.latitude if vehicle.HasField('position') and vehicle.position.HasField('latitude') else None
-            longitude = vehicle.position.longitude if vehicle.HasField('position') and vehicle.position.HasField('longitude') else None
-            bearing = vehicle.position.bearing if vehicle.HasField('position') and vehicle.position.HasField('bearing') else None
-            speed = vehicle.position.speed if vehicle.HasField('position') and vehicle.position.HasField('speed') else None
-            
-            # Get status
-            current_status = gtfs_realtime_pb2.VehiclePosition.VehicleStopStatus.Name(vehicle.current_status) if vehicle.HasField('current_status') else 'UNKNOWN'
-            
-            # Format timestamp
-            timestamp = datetime.fromtimestamp(vehicle.timestamp).strftime('%Y-%m-%d %H:%M:%S') if vehicle.HasField('timestamp') else None
-            
-            # Add route information if available
-            route_info = routes_data.get(route_id, {})
-            
-            vehicle_positions.append({
-                "vehicle_id": vehicle_id,
-                "trip_id": trip_id,
-                "route_id": route_id,
-                "latitude": latitude,
-                "longitude": longitude,
-                "bearing": bearing,
-                "speed": speed,
-                "current_status": current_status,
-                "timestamp": timestamp,
-                "route_short_name": route_info.get("route_short_name", ""),
-                "route_long_name": route_info.get("route_long_name", ""),
-                "route_color": route_info.get("route_color", ""),
-                "route_text_color": route_info.get("route_text_color", "")
-            })
-    
-    return vehicle_positions
-
-# Load routes data from CSV
-def load_routes_data():
-    routes_path = 'data/gtfs/routes.csv'
-    if not os.path.exists(routes_path):
-        print(f"Warning: Routes file not found: {routes_path}")
-        return {}
-    
-    try:
-        routes_df = pd.read_csv(routes_path)
-        routes_dict = {}
-        for _, row in routes_df.iterrows():
-            routes_dict[row['route_id']] = {
-                'route_short_name': row['route_short_name'] if 'route_short_name' in row and pd.notna(row['route_short_name']) else '',
-                'route_long_name': row['route_long_name'] if 'route_long_name' in row and pd.notna(row['route_long_name']) else '',
-                'route_color': row['route_color'] if 'route_color' in row and pd.notna(row['route_color']) else '',
-                'route_text_color': row['route_text_color'] if 'route_text_color' in row and pd.notna(row['route_text_color']) else ''
-            }
-        return routes_dict
-    except Exception as e:
-        print(f"Error loading routes data: {e}")
-        return {}
+    # Rows are built from the decoded columns, adding the route information from
+    # the static GTFS indexes, with the timestamps formatted in the agency timezone
+    rows = cached_process(decode_vehicle_columns, feed).to_records(get_static_gtfs().get_route)
+    return format_row_times(rows, ['timestamp'])
 
 # Process alerts
 def process_alerts(feed):
@@ -263,10 +175,10 @@ def process_alerts(feed):
             if alert.active_period:
                 for period in alert.active_period:
                     if period.HasField('start'):
-                        start_time = datetime.fromtimestamp(period.start).strftime('%Y-%m-%d %H:%M:%S')
+                        start_time = format_epoch(period.start)
                     
                     if period.HasField('end'):
-                        end_time = datetime.fromtimestamp(period.end).strftime('%Y-%m-%d %H:%M:%S')
+                        end_time = format_epoch(period.end)
             
             # Get affected entities
             affected_entities = []
@@ -306,41 +218,21 @@ def process_alerts(feed):
     
     return alerts
 
-# Generate delay distribution chart
-def generate_delay_chart(trip_updates):
-    if not trip_updates:
-        return None
-    
-    delays = [update['delay_minutes'] for update in trip_updates]
-    
-    plt.figure(figsize=(10, 6))
-    plt.hist(delays, bins=20, alpha=0.7, color='blue')
-    plt.axvline(x=0, color='red', linestyle='dashed', linewidth=1)
-    plt.xlabel('Retard (minutes)')
-    plt.ylabel('Nombre de mises à jour')
-    plt.title('Distribution des retards')
-    plt.tight_layout()
-    
-    # Save the chart to a file
-    chart_path = os.path.join('static', 'charts', 'delay_chart.png')
-    plt.savefig(chart_path)
-    plt.close()
-    
-    return 'delay_chart.png'
-
 # Generate stats for trip updates
-def get_trip_update_stats(trip_updates):
+# (the delays are read from the decoded columns the rows were built from)
+def get_trip_update_stats(trip_update_feed, trip_updates):
     if not trip_updates:
         return None
     
-    delays = [update['delay_minutes'] for update in trip_updates]
+    delays = cached_process(decode_scheduled_trip_updates, trip_update_feed).delay_minutes()
     
     return {
         'count': len(trip_updates),
-        'avg_delay_minutes': round(sum(delays) / len(delays), 1) if delays else 0,
-        'max_delay_minutes': round(max(delays), 1) if delays else 0,
-        'min_delay_minutes': round(min(delays), 1) if delays else 0,
-        'delay_chart': generate_delay_chart(trip_updates)
+        'avg_delay_minutes': round(float(delays.mean()), 1) if len(delays) else 0,
+        'max_delay_minutes': round(float(delays.max()), 1) if len(delays) else 0,
+        'min_delay_minutes': round(float(delays.min()), 1) if len(delays) else 0,
+        # URL of the chart once rendered, the dashboard keeps the previous one until then
+        'delay_chart': chart_renderer.get_chart('delay_distribution', trip_update_feed)
     }
 
 # Generate stats for vehicle positions
@@ -526,20 +418,24 @@ def api_config_test_source():
         # Only test URLs if not using local files
         # Use get() method with default value False if the key doesn't exist
         if not source.get('use_local_files', False):
+            urls = {}
             for feed_type in ['trip_update', 'vehicle_position', 'alert']:
                 url_key = f"{feed_type}_url"
                 if url_key in source and source[url_key]:
-                    try:
-                        response = requests.get(source[url_key])
-                        results[feed_type] = {
-                            'success': response.status_code == 200,
-                            'status_code': response.status_code
-                        }
-                    except Exception as e:
-                        results[feed_type] = {
-                            'success': False,
-                            'error': str(e)
-                        }
+                    urls[feed_type] = source[url_key]
+            
+            # Test all URLs at the same time
+            for feed_type, result in get_feed_fetcher().fetch_all(urls).items():
+                if result.status_code is not None:
+                    results[feed_type] = {
+                        'success': result.ok,
+                        'status_code': result.status_code
+                    }
+                else:
+                    results[feed_type] = {
+                        'success': False,
+                        'error': result.error
+                    }
         
         return jsonify({'success': True, 'results': results})
     except Exception as e:
@@ -555,11 +451,9 @@ def api_refresh_data():
         
         # Only download if not using local files
         if not current_source['use_local_files']:
-            for feed_type in ['trip_update', 'vehicle_position', 'alert']:
+            for feed_type, success in get_feed_poller().refresh().items():
                 url_key = f"{feed_type}_url"
                 if url_key in current_source and current_source[url_key]:
-                    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"data/gtfs_rt/{feed_type.title().replace('_', '')}.pb")
-                    success = download_gtfs_rt_from_url(current_source[url_key], file_path)
                     results[feed_type] = {'success': success}
         
         return jsonify({'success': True, 'results': results})
@@ -576,8 +470,8 @@ def api_trip_updates():
     
     # Read and process the trip updates
     trip_update_feed = read_gtfs_rt_file(trip_update_path)
-    trip_updates = process_trip_updates(trip_update_feed)
-    trip_stats = get_trip_update_stats(trip_updates)
+    trip_updates = cached_process(process_trip_updates, trip_update_feed)
+    trip_stats = get_trip_update_stats(trip_update_feed, trip_updates)
     
     return jsonify({
         'header': {
@@ -600,7 +494,7 @@ def api_vehicle_positions():
     
     # Read and process the vehicle positions
     vehicle_position_feed = read_gtfs_rt_file(vehicle_position_path)
-    vehicle_positions = process_vehicle_positions(vehicle_position_feed)
+    vehicle_positions = cached_process(process_vehicle_positions, vehicle_position_feed)
     vehicle_stats = get_vehicle_stats(vehicle_positions)
     
     return jsonify({
@@ -624,7 +518,7 @@ def api_alerts():
     
     # Read and process the alerts
     alert_feed = read_gtfs_rt_file(alert_path)
-    alerts = process_alerts(alert_feed)
+    alerts = cached_process(process_alerts, alert_feed)
     
     return jsonify({
         'header': {
@@ -640,25 +534,40 @@ def api_alerts():
 @app.route('/api/all-data')
 def api_all_data():
     current_dir = os.path.dirname(os.path.abspath(__file__))
+    # Epoch seconds of the archived snapshots to show instead of the live ones
+    at = request.args.get('at', type=int)
     
     # Trip updates
     trip_update_path = os.path.join(current_dir, 'data/gtfs_rt', 'TripUpdate.pb')
-    trip_update_feed = get_gtfs_rt_feed('trip_update')
-    trip_updates = process_trip_updates(trip_update_feed) if trip_update_feed else None
-    trip_stats = get_trip_update_stats(trip_updates) if trip_updates else None
+    trip_update_feed = get_gtfs_rt_feed('trip_update', at)
+    trip_updates = cached_process(process_trip_updates, trip_update_feed) if trip_update_feed else None
+    trip_stats = get_trip_update_stats(trip_update_feed, trip_updates) if trip_updates else None
+    if trip_stats and at is None:
+        # Rolling statistics over the last snapshots, updated by the poller
+        trip_stats['delay_windows'] = get_feed_poller().delay_stats.get_summaries()
     
     # Vehicle positions
     vehicle_position_path = os.path.join(current_dir, 'data/gtfs_rt', 'VehiclePosition.pb')
-    vehicle_position_feed = get_gtfs_rt_feed('vehicle_position')
-    vehicle_positions = process_vehicle_positions(vehicle_position_feed) if vehicle_position_feed else None
+    vehicle_position_feed = get_gtfs_rt_feed('vehicle_position', at)
+    vehicle_positions = cached_process(process_vehicle_positions, vehicle_position_feed) if vehicle_position_feed else None
     vehicle_stats = get_vehicle_stats(vehicle_positions) if vehicle_positions else None
     
     # Alerts
     alert_path = os.path.join(current_dir, 'data/gtfs_rt', 'Alert.pb')
-    alert_feed = get_gtfs_rt_feed('alert')
-    alerts = process_alerts(alert_feed) if alert_feed else None
+    alert_feed = get_gtfs_rt_feed('alert', at)
+    alerts = cached_process(process_alerts, alert_feed) if alert_feed else None
+    
+    # Snapshot ids let the dashboard resume the event stream from this data,
+    # archived data does not match any live snapshot
+    snapshot_ids = None
+    if at is None:
+        snapshot_ids = {}
+        for feed_type in ['trip_update', 'vehicle_position', 'alert']:
+            snapshot = get_feed_poller().store.get(feed_type)
+            snapshot_ids[feed_type] = snapshot.snapshot_id if snapshot else None
     
     return jsonify({
+        'snapshot_ids': snapshot_ids,
         'trip_updates': {
             'header': {
                 'version': trip_update_feed.header.gtfs_realtime_version if trip_update_feed else None,
@@ -705,6 +614,9 @@ if __name__ == '__main__':
     gtfs_rt_dir = os.path.join('data', 'gtfs_rt')
     if not os.path.exists(gtfs_rt_dir):
         os.makedirs(gtfs_rt_dir)
+    
+    # Load the static GTFS indexes before serving requests
+    get_static_gtfs()
         
     # Run the app
     app.run(debug=True)
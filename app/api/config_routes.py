@@ -6,7 +6,7 @@ from app.utils.config_manager import (
     load_config, save_config, add_source, 
     update_source, remove_source, set_current_source
 )
-import requests
+from app.core.feed_fetcher import get_feed_fetcher
 
 # Create a Blueprint for the config API routes
 config_api = Blueprint('config_api', __name__)
@@ -140,15 +140,14 @@ def api_config_test_source():
         'alert': False
     }
     
-    # Test each URL
-    for feed_type in results.keys():
-        url_key = f"{feed_type}_url"
-        if url_key in source and source[url_key]:
-            try:
-                response = requests.get(source[url_key], timeout=10)
-                results[feed_type] = response.status_code == 200
-            except Exception:
-                results[feed_type] = False
+    # Test all URLs at the same time
+    urls = {
+        feed_type: source[f"{feed_type}_url"]
+        for feed_type in results.keys()
+        if source.get(f"{feed_type}_url")
+    }
+    for feed_type, result in get_feed_fetcher().fetch_all(urls).items():
+        results[feed_type] = result.ok
     
     return jsonify({
         'status': 'success',
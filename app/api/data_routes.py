@@ -1,58 +1,82 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, jsonify, request, send_file
-from app.utils.config_manager import load_config, get_current_source
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from app.utils.config_manager import load_config, get_current_source, get_source_id, is_valid_source_id
 from app.core.gtfs_rt_reader import read_gtfs_rt_file, convert_to_dict
-import os
+from app.core.feed_poller import FIRST_SNAPSHOT_TIMEOUT, get_feed_poller
+from app.core.source_pollers import get_source_pollers
+from app.core.feed_archive import get_feed_archive, read_feed
+from app.core.feed_cache import cached_process
+from app.core.snapshot_store import FeedSnapshot
+from app.core.response_cache import render_json
+from app.core.snapshot_diff import diff_entities, get_entity_index
+from app.core.columnar import decode_vehicle_columns, trip_update_stats
+from app.core.schedule_delays import decode_scheduled_trip_updates
+from app.core.static_gtfs import get_static_gtfs
+from app.core.spatial_index import GridIndex
+from app.core.rolling_stats import GROUPS
+from app.core.chart_renderer import CHARTS, get_chart_renderer
+from app.core.export import EXPORT_FORMATS, ChunkSink, get_unavailable_format
+from app.core.export_jobs import DECODERS, PART_EXTENSIONS, get_export_jobs
+from app.core.histograms import (
+    DEFAULT_DELAY_BINS, MAX_BINS, delay_by_hour, delay_by_route, delay_histogram, vehicle_status_counts
+)
+from app.core.row_query import (
+    FILTER_FIELDS, MAX_PAGE_SIZE, RowIndex, decode_cursor, encode_cursor, filter_positions, index_codes,
+    index_rows, project_rows
+)
+from app.core.time_format import DEFAULT_TIME_FORMAT, TIME_FORMATS, format_row_times
+import json
+import zipfile
+import numpy as np
 import pandas as pd
-import requests
-import csv
 
 # Create a Blueprint for the data API routes
 data_api = Blueprint('data_api', __name__)
 
-# GTFS-RT file paths
-GTFS_RT_DIR = 'data/gtfs_rt'
-FILE_PATHS = {
-    'trip_update': os.path.join(GTFS_RT_DIR, 'TripUpdate.pb'),
-    'vehicle_position': os.path.join(GTFS_RT_DIR, 'VehiclePosition.pb'),
-    'alert': os.path.join(GTFS_RT_DIR, 'Alert.pb')
-}
 
-# Ensure GTFS-RT directory exists
-os.makedirs(GTFS_RT_DIR, exist_ok=True)
+def get_source_poller(source_id=None):
+    """
+    Get the poller serving a request
+    
+    Args:
+        source_id (str): Source of the /api/<source_id>/... routes, None for the current source
+        
+    Returns:
+        FeedPoller: Poller of the source, or None if the source is unknown
+    """
+    if source_id is None:
+        return get_feed_poller()
+    return get_source_pollers().get(source_id)
+
 
+def unknown_source_response(source_id):
+    """
+    Build the error response for a source that is not configured
+    """
+    return jsonify({'status': 'error', 'message': f'Unknown source: {source_id}'}), 404
 
-def download_gtfs_rt_from_url(url, file_path):
+
+def get_gtfs_rt_snapshot(feed_type, poller=None):
     """
-    Download GTFS-RT data from URL
+    Get the latest GTFS-RT snapshot published by the background poller
     
     Args:
-        url (str): URL to download from
-        file_path (str): Path to save the downloaded file
+        feed_type (str): Type of feed to get (trip_update, vehicle_position, alert)
+        poller (FeedPoller): Poller to read from, the current source's if omitted
         
     Returns:
-        bool: True if successful, False otherwise
+        FeedSnapshot: Latest snapshot, or None if none is available
     """
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            return True
-        else:
-            print(f"Error downloading GTFS-RT from {url}: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"Error downloading GTFS-RT from {url}: {e}")
-        return False
+    poller = poller or get_feed_poller()
+    poller.wait_until_ready(FIRST_SNAPSHOT_TIMEOUT)
+    return poller.store.get(feed_type)
 
 
 def get_gtfs_rt_feed(feed_type):
     """
-    Get GTFS-RT feed based on current configuration
+    Get the latest GTFS-RT feed published by the background poller
     
     Args:
         feed_type (str): Type of feed to get (trip_update, vehicle_position, alert)
@@ -60,24 +84,250 @@ def get_gtfs_rt_feed(feed_type):
     Returns:
         feed: GTFS-RT feed message
     """
-    current_source = get_current_source()
+    snapshot = get_gtfs_rt_snapshot(feed_type)
+    return snapshot.feed if snapshot else None
+
+
+def cached_json_response(key, build_payload, store=True):
+    """
+    Serve a JSON payload rendered once per snapshot, honouring If-None-Match
+    and Accept-Encoding
     
-    if not current_source['use_local_files']:
-        # Download the file from URL
-        url_key = f"{feed_type}_url"
-        if url_key in current_source and current_source[url_key]:
-            file_path = FILE_PATHS[feed_type]
-            download_gtfs_rt_from_url(current_source[url_key], file_path)
+    Args:
+        key (tuple): Cache key identifying the endpoint and the snapshots used
+        build_payload (callable): Function returning the payload on a cache miss
+        store (bool): Whether to keep the rendered response for later requests
+        
+    Returns:
+        Response: Flask response
+    """
+    rendered = render_json(key, build_payload, store)
+    
+    if request.if_none_match.contains(rendered.etag.strip('"')):
+        response = Response(status=304)
+    else:
+        coding, body = rendered.negotiate(request.headers.get('Accept-Encoding'))
+        response = Response(body, mimetype='application/json')
+        if coding:
+            response.headers['Content-Encoding'] = coding
     
-    return read_gtfs_rt_file(FILE_PATHS[feed_type])
+    response.headers['ETag'] = rendered.etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
-def process_trip_updates(feed):
+def get_time_format():
+    """
+    Get the time format requested with the 'time_format' query parameter
+    
+    Returns:
+        str: One of TIME_FORMATS, or None if the value is not supported
+    """
+    time_format = request.args.get('time_format', DEFAULT_TIME_FORMAT)
+    return time_format if time_format in TIME_FORMATS else None
+
+
+def invalid_time_format_response():
+    """
+    Build the error response for an unsupported 'time_format' parameter
+    
+    Returns:
+        tuple: (Flask response, status code)
+    """
+    return jsonify({
+        'status': 'error',
+        'message': f"Invalid time_format, expected one of: {', '.join(TIME_FORMATS)}"
+    }), 400
+
+
+def parse_coordinates(value, count):
+    """
+    Parse a comma-separated list of coordinates
+    
+    Args:
+        value (str): Query parameter value
+        count (int): Expected number of values
+        
+    Returns:
+        tuple: Floats, or None if the value is malformed
+    """
+    try:
+        values = tuple(float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    return values if len(values) == count and all(np.isfinite(values)) else None
+
+
+def get_spatial_query():
+    """
+    Parse the spatial query parameters of a request
+    
+    - bbox=min_lon,min_lat,max_lon,max_lat keeps the points inside the box
+    - near=lat,lon (or near_stop=<stop_id>) with radius=<meters> keeps the
+      points within the radius, nearest first
+    - k=<count> with near/near_stop keeps the k nearest points
+    
+    Returns:
+        tuple: (query dict or None if no spatial parameter, error message or None)
+    """
+    args = request.args
+    if 'bbox' in args:
+        bbox = parse_coordinates(args['bbox'], 4)
+        if bbox is None or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            return None, 'Invalid bbox, expected min_lon,min_lat,max_lon,max_lat'
+        return {'bbox': bbox}, None
+    
+    if 'near' in args:
+        near = parse_coordinates(args['near'], 2)
+        if near is None:
+            return None, 'Invalid near, expected lat,lon'
+    elif 'near_stop' in args:
+        stop = get_static_gtfs().stops.get(args['near_stop'])
+        if stop is None or stop.latitude is None or stop.longitude is None:
+            return None, f"Unknown stop: {args['near_stop']}"
+        near = (stop.latitude, stop.longitude)
+    else:
+        return None, None
+    
+    radius = args.get('radius', type=float)
+    k = args.get('k', type=int)
+    if (radius is None and k is None) or (radius is not None and radius <= 0) or (k is not None and k <= 0):
+        return None, 'A positive radius (meters) or k is required with near/near_stop'
+    return {'near': near, 'radius': radius, 'k': k}, None
+
+
+def run_spatial_query(index, query):
+    """
+    Run a parsed spatial query on an index
+    
+    Args:
+        index (GridIndex): Spatial index
+        query (dict): Query returned by get_spatial_query
+        
+    Returns:
+        tuple: (indices of the matching points, distances in meters or None)
+    """
+    if 'bbox' in query:
+        min_lon, min_lat, max_lon, max_lat = query['bbox']
+        return index.within_bbox(min_lat, min_lon, max_lat, max_lon), None
+    
+    latitude, longitude = query['near']
+    if query['k'] is not None:
+        return index.nearest(latitude, longitude, query['k'], query['radius'])
+    return index.within_radius(latitude, longitude, query['radius'])
+
+
+def select_rows(rows, indices, distances=None):
+    """
+    Select rows by index, adding their distance to the query location
+    
+    Args:
+        rows (list): Shared rows, not modified
+        indices (numpy.ndarray): Indices of the rows to keep
+        distances (numpy.ndarray): Distances in meters, or None
+        
+    Returns:
+        list: Selected rows
+    """
+    if distances is None:
+        return [rows[index] for index in indices.tolist()]
+    return [dict(rows[index], distance_m=round(distance, 1))
+            for index, distance in zip(indices.tolist(), distances.tolist())]
+
+
+def query_key(query):
+    """
+    Identify a spatial query for response caching
+    """
+    return tuple(sorted(query.items())) if query else ()
+
+
+def query_error(message):
+    """
+    Build the error response for invalid query parameters
+    """
+    return jsonify({'status': 'error', 'message': message}), 400
+
+
+# Export formats offered by each endpoint, besides JSON
+ENDPOINT_FORMATS = {
+    'trip_update': ('csv', 'parquet'),
+    'vehicle_position': ('csv', 'parquet', 'geojson'),
+    'stops': ('csv', 'parquet', 'geojson')
+}
+
+
+def get_export_format(endpoint):
+    """
+    Get the format requested with the 'format' query parameter
+    
+    Args:
+        endpoint (str): Key of ENDPOINT_FORMATS
+        
+    Returns:
+        tuple: (format name, None for JSON; error response or None)
+    """
+    export_format = request.args.get('format', 'json')
+    if export_format == 'json':
+        return None, None
+    if export_format not in ENDPOINT_FORMATS[endpoint]:
+        return None, query_error(f"Invalid format, expected json or one of: {', '.join(ENDPOINT_FORMATS[endpoint])}")
+    unavailable = get_unavailable_format(export_format)
+    if unavailable:
+        return None, (jsonify({'status': 'error', 'message': unavailable}), 501)
+    return export_format, None
+
+
+def export_response(rows, export_format, name, fields=None):
+    """
+    Stream rows as a file download, serialized chunk by chunk while sent
+    
+    Args:
+        rows (list): Rows to export, not modified
+        export_format (str): Key of EXPORT_FORMATS
+        name (str): File name without extension
+        fields (tuple): Exported fields, all if None
+        
+    Returns:
+        Response: Streamed Flask response
+    """
+    serialize, mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(stream_with_context(serialize(rows, fields)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}.{extension}"'})
+
+
+def feed_export_response(poller, source_id, feed_type, export_format, time_format, query, area_query=None):
+    """
+    Export the rows of the latest snapshot of a feed matching a request
+    
+    Args:
+        poller (FeedPoller): Poller of the source
+        source_id (str): Source identifier, None for the current source
+        feed_type (str): Type of feed
+        export_format (str): Key of EXPORT_FORMATS
+        time_format (str): Format of the timestamps
+        query (dict): Query returned by get_row_query
+        area_query (dict): Query returned by get_spatial_query, or None
+        
+    Returns:
+        Response: Streamed Flask response
+    """
+    if query['limit'] or query['cursor']:
+        return query_error('Pagination is not supported on exports')
+    snapshot = get_gtfs_rt_snapshot(feed_type, poller)
+    # The rows are shared with the JSON responses, only the selection is new
+    rows = query_rows_payload(feed_type, snapshot, time_format, dict(query, fields=None), area_query)[ROW_LISTS[feed_type]]
+    name = f"{source_id}_{ROW_LISTS[feed_type]}" if source_id else ROW_LISTS[feed_type]
+    return export_response(rows, export_format, name, query['fields'])
+
+
+def process_trip_updates(feed, time_format=DEFAULT_TIME_FORMAT):
     """
     Process trip updates from GTFS-RT feed
     
     Args:
         feed: GTFS-RT feed message
+        time_format (str): Format of the arrival/departure times (text, iso, epoch)
         
     Returns:
         list: Processed trip updates
@@ -85,93 +335,58 @@ def process_trip_updates(feed):
     if not feed:
         return []
     
-    trip_updates = []
-    for entity in feed.entity:
-        if entity.HasField('trip_update'):
-            trip_update = entity.trip_update
-            trip_id = trip_update.trip.trip_id if trip_update.trip.HasField('trip_id') else 'Unknown'
-            route_id = trip_update.trip.route_id if trip_update.trip.HasField('route_id') else 'Unknown'
-            
-            for stop_time_update in trip_update.stop_time_update:
-                stop_id = stop_time_update.stop_id if stop_time_update.HasField('stop_id') else 'Unknown'
-                delay_seconds = stop_time_update.departure.delay if stop_time_update.HasField('departure') and stop_time_update.departure.HasField('delay') else (
-                    stop_time_update.arrival.delay if stop_time_update.HasField('arrival') and stop_time_update.arrival.HasField('delay') else 0
-                )
-                delay_minutes = round(delay_seconds / 60, 1)
-                
-                # Format timestamps
-                arrival_time = None
-                departure_time = None
-                
-                if stop_time_update.HasField('arrival') and stop_time_update.arrival.HasField('time'):
-                    from datetime import datetime
-                    arrival_time = datetime.fromtimestamp(stop_time_update.arrival.time).strftime('%Y-%m-%d %H:%M:%S')
-                
-                if stop_time_update.HasField('departure') and stop_time_update.departure.HasField('time'):
-                    from datetime import datetime
-                    departure_time = datetime.fromtimestamp(stop_time_update.departure.time).strftime('%Y-%m-%d %H:%M:%S')
-                
-                trip_updates.append({
-                    'trip_id': trip_id,
-                    'route_id': route_id,
-                    'stop_id': stop_id,
-                    'delay_seconds': delay_seconds,
-                    'delay_minutes': delay_minutes,
-                    'arrival_time': arrival_time,
-                    'departure_time': departure_time
-                })
-    
-    return trip_updates
+    # Rows are built from the decoded columns, which are shared with the statistics;
+    # delays the producer left out are computed from the static schedule
+    return cached_process(decode_scheduled_trip_updates, feed).to_records(time_format)
 
 
-def process_vehicle_positions(feed):
+def process_vehicle_positions(feed, time_format=DEFAULT_TIME_FORMAT):
     """
     Process vehicle positions from GTFS-RT feed
     
     Args:
         feed: GTFS-RT feed message
+        time_format (str): Format of the vehicle timestamps (text, iso, epoch)
         
     Returns:
         list: Processed vehicle positions
     """
+    # Timestamps are kept as epoch seconds and only formatted on output
+    return format_row_times(cached_process(decode_vehicle_positions, feed), ['timestamp'], time_format)
+
+
+def build_vehicle_index(feed):
+    """
+    Build the spatial index of the vehicles of a feed (one per snapshot)
+    
+    Args:
+        feed: GTFS-RT feed message
+        
+    Returns:
+        GridIndex: Index whose point i is row i of decode_vehicle_positions
+    """
     if not feed:
-        return []
+        return GridIndex([], [])
+    columns = cached_process(decode_vehicle_columns, feed)
+    return GridIndex(columns.latitudes, columns.longitudes)
+
+
+def decode_vehicle_positions(feed):
+    """
+    Decode vehicle positions from GTFS-RT feed, keeping epoch timestamps
     
-    vehicle_positions = []
-    for entity in feed.entity:
-        if entity.HasField('vehicle'):
-            vehicle = entity.vehicle
-            vehicle_id = vehicle.vehicle.id if vehicle.HasField('vehicle') and vehicle.vehicle.HasField('id') else 'Unknown'
-            trip_id = vehicle.trip.trip_id if vehicle.HasField('trip') and vehicle.trip.HasField('trip_id') else 'Unknown'
-            route_id = vehicle.trip.route_id if vehicle.HasField('trip') and vehicle.trip.HasField('route_id') else 'Unknown'
-            
-            # Get position info
-            latitude = vehicle.position.latitude if vehicle.HasField('position') and vehicle.position.HasField('latitude') else None
-            longitude = vehicle.position.longitude if vehicle.HasField('position') and vehicle.position.HasField('longitude') else None
-            bearing = vehicle.position.bearing if vehicle.HasField('position') and vehicle.position.HasField('bearing') else None
-            speed = vehicle.position.speed if vehicle.HasField('position') and vehicle.position.HasField('speed') else None
-            
-            # Get status
-            from google.transit import gtfs_realtime_pb2
-            current_status = gtfs_realtime_pb2.VehiclePosition.VehicleStopStatus.Name(vehicle.current_status) if vehicle.HasField('current_status') else 'UNKNOWN'
-            
-            # Format timestamp
-            from datetime import datetime
-            timestamp = datetime.fromtimestamp(vehicle.timestamp).strftime('%Y-%m-%d %H:%M:%S') if vehicle.HasField('timestamp') else None
-            
-            vehicle_positions.append({
-                'vehicle_id': vehicle_id,
-                'trip_id': trip_id,
-                'route_id': route_id,
-                'latitude': latitude,
-                'longitude': longitude,
-                'bearing': bearing,
-                'speed': speed,
-                'current_status': current_status,
-                'timestamp': timestamp
-            })
+    Args:
+        feed: GTFS-RT feed message
+        
+    Returns:
+        list: Vehicle positions with the timestamp in epoch seconds
+    """
+    if not feed:
+        return []
     
-    return vehicle_positions
+    # Rows are built from the decoded columns, adding the route information
+    # from the static GTFS indexes
+    return cached_process(decode_vehicle_columns, feed).to_records(get_static_gtfs().get_route)
 
 
 def process_alerts(feed):
@@ -229,6 +444,7 @@ def process_alerts(feed):
                 affected_entities.append(entity_info)
             
             alerts.append({
+                'id': entity.id,
                 'header': header,
                 'description': description,
                 'cause': cause,
@@ -252,14 +468,9 @@ def api_refresh_data():
         'alert': False
     }
     
+    # Local files are picked up by the poller, only remote sources are refreshed
     if not current_source['use_local_files']:
-        for feed_type in results.keys():
-            url_key = f"{feed_type}_url"
-            if url_key in current_source and current_source[url_key]:
-                results[feed_type] = download_gtfs_rt_from_url(
-                    current_source[url_key], 
-                    FILE_PATHS[feed_type]
-                )
+        results.update(get_feed_poller().refresh())
     
     return jsonify({
         'status': 'success',
@@ -267,108 +478,279 @@ def api_refresh_data():
     })
 
 
-@data_api.route('/api/trip-updates', methods=['GET'])
-def api_trip_updates():
+@data_api.route('/api/metrics', methods=['GET'])
+@data_api.route('/api/<source_id>/metrics', methods=['GET'])
+def api_metrics(source_id=None):
     """
-    Get trip updates from GTFS-RT feed
+    Get the feed poller counters, including the share of skipped polls
     """
-    format_param = request.args.get('format', 'json')
-    
-    # Get trip updates
-    feed = get_gtfs_rt_feed('trip_update')
-    trip_updates = process_trip_updates(feed)
-    
-    if format_param == 'csv':
-        # Export as CSV
-        csv_path = 'output/csv/trip_updates.csv'
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-        df = pd.DataFrame(trip_updates)
-        df.to_csv(csv_path, index=False, quoting=csv.QUOTE_MINIMAL)
-        return send_file(csv_path, as_attachment=True)
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
     
+    archive = get_feed_archive()
     return jsonify({
         'status': 'success',
-        'feed_timestamp': feed.header.timestamp if feed else None,
-        'trip_updates': trip_updates
+        'feeds': poller.get_metrics(),
+        'trip_states': poller.trip_states.get_stats(),
+        'archive': archive.get_stats() if archive else None
     })
 
 
-@data_api.route('/api/vehicle-positions', methods=['GET'])
-def api_vehicle_positions():
+@data_api.route('/api/trip-states', methods=['GET'])
+@data_api.route('/api/<source_id>/trip-states', methods=['GET'])
+def api_trip_states(source_id=None):
     """
-    Get vehicle positions from GTFS-RT feed
+    Get the latest state of the trips of the trip update feed, with the
+    feed timestamp at which each trip and each of its stop time updates
+    last changed
+    
+    'trip_id' (comma-separated) selects trips, 'since' (epoch seconds) the
+    trips changed at or after that time.
     """
-    format_param = request.args.get('format', 'json')
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
     
-    # Get vehicle positions
-    feed = get_gtfs_rt_feed('vehicle_position')
-    vehicle_positions = process_vehicle_positions(feed)
+    trip_ids = request.args.get('trip_id')
+    since = request.args.get('since')
+    if since is not None:
+        if not since.isdigit():
+            return query_error('Invalid since, expected epoch seconds')
+        since = int(since)
     
-    if format_param == 'csv':
-        # Export as CSV
-        csv_path = 'output/csv/vehicle_positions.csv'
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-        df = pd.DataFrame(vehicle_positions)
-        df.to_csv(csv_path, index=False, quoting=csv.QUOTE_MINIMAL)
-        return send_file(csv_path, as_attachment=True)
+    poller.wait_until_ready(FIRST_SNAPSHOT_TIMEOUT)
+    trips = poller.trip_states.get_trips(set(trip_ids.split(',')) if trip_ids else None, since)
+    return jsonify({'status': 'success', 'trips': trips})
+
+
+@data_api.route('/api/stats/delays', methods=['GET'])
+@data_api.route('/api/<source_id>/stats/delays', methods=['GET'])
+def api_delay_stats(source_id=None):
+    """
+    Get the rolling delay statistics of the network, or of each route or stop
+    
+    'group' is 'all' (default), 'route' or 'stop'; 'window' restricts the
+    response to one window (e.g. '5m', '1h', '1d'). The statistics are
+    updated once per trip update snapshot, and reading them does not depend
+    on the number of snapshots covered.
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    delay_stats = poller.delay_stats
+    group = request.args.get('group', 'all')
+    if group not in GROUPS:
+        return query_error(f"Invalid group, expected one of: {', '.join(GROUPS)}")
+    windows = delay_stats.get_windows()
+    window = request.args.get('window')
+    if window is not None:
+        if window not in windows:
+            return query_error(f"Invalid window, expected one of: {', '.join(windows)}")
+        windows = [window]
+    
+    def build_payload():
+        return {
+            'status': 'success',
+            'as_of': delay_stats.last_timestamp,
+            'group': group,
+            'windows': {
+                name: delay_stats.get_summary(name) if group == 'all' else delay_stats.get_group(name, group)
+                for name in windows
+            }
+        }
+    
+    key = (source_id, 'delay-stats', id(delay_stats), delay_stats.version, group, window)
+    return cached_json_response(key, build_payload)
+
+
+@data_api.route('/api/charts', methods=['GET'])
+@data_api.route('/api/<source_id>/charts', methods=['GET'])
+def api_charts(source_id=None):
+    """
+    Get the URLs of the charts of the latest snapshots
+    
+    Charts are rendered in the background once per snapshot; a chart not
+    rendered yet is reported as None, and the client asks again later.
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    renderer = get_chart_renderer()
+    renderer.watch(poller.store)
+    snapshots = {}
+    charts = {}
+    for name, (feed_type, _, _) in CHARTS.items():
+        snapshot = snapshots.setdefault(feed_type, get_gtfs_rt_snapshot(feed_type, poller))
+        charts[name] = renderer.get_chart(name, snapshot.feed) if snapshot else None
     
     return jsonify({
         'status': 'success',
-        'feed_timestamp': feed.header.timestamp if feed else None,
-        'vehicle_positions': vehicle_positions
+        'snapshot_ids': {feed_type: snapshot.snapshot_id if snapshot else None for feed_type, snapshot in snapshots.items()},
+        'charts': charts
     })
 
 
-@data_api.route('/api/alerts', methods=['GET'])
-def api_alerts():
+def get_bins_query():
     """
-    Get alerts from GTFS-RT feed
+    Parse the binning parameters of the delay histogram
+    
+    - bins: number of equal-width bins, or comma-separated increasing edges in minutes
+    - range=min,max: bounds in minutes of the equal-width bins, the data range if omitted
+    
+    Returns:
+        tuple: (bins as an int or a tuple of edges, range tuple or None, error message or None)
+    """
+    args = request.args
+    value = args.get('bins', str(DEFAULT_DELAY_BINS))
+    if ',' in value:
+        edges = parse_coordinates(value, len(value.split(',')))
+        if edges is None or not 2 <= len(edges) <= MAX_BINS + 1 or any(np.diff(edges) <= 0):
+            return None, None, f"Invalid bins, expected 2 to {MAX_BINS + 1} increasing edges"
+        if 'range' in args:
+            return None, None, 'range only applies to a number of bins'
+        return edges, None, None
+    
+    bins = args.get('bins', DEFAULT_DELAY_BINS, type=int)
+    if bins is None or not 0 < bins <= MAX_BINS:
+        return None, None, f"Invalid bins, expected 1 to {MAX_BINS} or a list of edges"
+    value_range = None
+    if 'range' in args:
+        value_range = parse_coordinates(args['range'], 2)
+        if value_range is None or value_range[0] >= value_range[1]:
+            return None, None, 'Invalid range, expected min,max in minutes'
+    return bins, value_range, None
+
+
+# Feed type and aggregation of each histogram, taking the decoded columns,
+# the selected positions (None for all) and the binning parameters
+HISTOGRAMS = {
+    'delay': ('trip_update', lambda columns, positions, bins, value_range: delay_histogram(
+        columns if positions is None else columns.select(positions), bins, value_range)),
+    'delay-by-route': ('trip_update', lambda columns, positions, bins, value_range: delay_by_route(
+        columns if positions is None else columns.select(positions))),
+    'delay-by-hour': ('trip_update', lambda columns, positions, bins, value_range: delay_by_hour(
+        columns if positions is None else columns.select(positions))),
+    'vehicle-status': ('vehicle_position', lambda columns, positions, bins, value_range: vehicle_status_counts(
+        columns, positions))
+}
+
+# Decoded columns each histogram reads
+HISTOGRAM_DECODERS = {
+    'trip_update': decode_scheduled_trip_updates,
+    'vehicle_position': decode_vehicle_columns
+}
+
+
+@data_api.route('/api/histograms/<name>', methods=['GET'])
+@data_api.route('/api/<source_id>/histograms/<name>', methods=['GET'])
+def api_histogram(name, source_id=None):
+    """
+    Get pre-binned aggregates of the latest snapshot, for the client to draw
+    
+    - delay: delay histogram (see get_bins_query)
+    - delay-by-route: count, average and max delay per route
+    - delay-by-hour: count and average delay per local hour of departure
+    - vehicle-status: number of vehicles per stop status
+    
+    The row filters of the feed endpoints apply. Aggregates are computed
+    vectorized on the decoded columns and cached per snapshot.
     """
-    # Get alerts
-    feed = get_gtfs_rt_feed('alert')
-    alerts = process_alerts(feed)
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    if name not in HISTOGRAMS:
+        return jsonify({'status': 'error', 'message': f'Unknown histogram: {name}'}), 404
+    
+    feed_type, aggregate = HISTOGRAMS[name]
+    query, error = get_row_query([feed_type])
+    if error:
+        return query_error(error)
+    if query['fields'] or query['limit'] or query['cursor']:
+        return query_error('Only row filters apply to histograms')
+    bins, value_range = None, None
+    if name == 'delay':
+        bins, value_range, error = get_bins_query()
+        if error:
+            return query_error(error)
+    
+    snapshot = get_gtfs_rt_snapshot(feed_type, poller)
+    
+    def build_payload():
+        data = None
+        if snapshot:
+            columns = cached_process(HISTOGRAM_DECODERS[feed_type], snapshot.feed)
+            positions = select_positions(feed_type, snapshot.feed, query)[0] if is_row_query(query) else None
+            data = aggregate(columns, positions, bins, value_range)
+        return {
+            'status': 'success',
+            'snapshot_id': snapshot.snapshot_id if snapshot else None,
+            'feed_timestamp': snapshot.feed_timestamp if snapshot else None,
+            'histogram': name,
+            'data': data
+        }
+    
+    key = (source_id, 'histogram', name, bins, value_range, row_query_key(query)) + snapshot_key(snapshot)
+    return cached_json_response(key, build_payload, store=not is_row_query(query))
+
+
+@data_api.route('/api/sources', methods=['GET'])
+def api_sources():
+    """
+    List the sources served under /api/<source_id>/, with their latest snapshots
+    """
+    source_pollers = get_source_pollers()
+    sources = []
+    for source_id, source in source_pollers.get_sources().items():
+        poller = source_pollers.get(source_id)
+        snapshots = {feed_type: poller.store.get(feed_type) for feed_type in PROCESSORS} if poller else {}
+        sources.append({
+            'id': source_id,
+            'name': source.get('name'),
+            'feeds': {
+                feed_type: {
+                    'snapshot_id': snapshot.snapshot_id if snapshot else None,
+                    'feed_timestamp': snapshot.feed_timestamp if snapshot else None
+                }
+                for feed_type, snapshot in snapshots.items()
+            }
+        })
     
     return jsonify({
         'status': 'success',
-        'feed_timestamp': feed.header.timestamp if feed else None,
-        'alerts': alerts
+        'sources': sources
     })
 
 
-@data_api.route('/api/all-data', methods=['GET'])
-def api_all_data():
+def get_trip_update_stats(feed, positions=None):
     """
-    Get all GTFS-RT data (trip updates, vehicle positions, and alerts)
+    Compute delay and trip/route statistics for trip updates
+    
+    Args:
+        feed: GTFS-RT feed message
+        positions (numpy.ndarray): Positions of the updates to describe, all if None
+        
+    Returns:
+        dict: Trip update statistics
     """
-    # Get all data
-    trip_update_feed = get_gtfs_rt_feed('trip_update')
-    vehicle_position_feed = get_gtfs_rt_feed('vehicle_position')
-    alert_feed = get_gtfs_rt_feed('alert')
-    
-    # Process data
-    trip_updates = process_trip_updates(trip_update_feed)
-    vehicle_positions = process_vehicle_positions(vehicle_position_feed)
-    alerts = process_alerts(alert_feed)
-    
-    # Get statistics for trip updates
-    trip_update_stats = {}
-    if trip_updates:
-        df = pd.DataFrame(trip_updates)
-        # Delay statistics
-        if 'delay_minutes' in df.columns:
-            trip_update_stats['delay'] = {
-                'average': round(df['delay_minutes'].mean(), 1) if not df['delay_minutes'].empty else 0,
-                'max': round(df['delay_minutes'].max(), 1) if not df['delay_minutes'].empty else 0,
-                'min': round(df['delay_minutes'].min(), 1) if not df['delay_minutes'].empty else 0,
-                'median': round(df['delay_minutes'].median(), 1) if not df['delay_minutes'].empty else 0
-            }
-        # Trip/Route statistics
-        if 'trip_id' in df.columns:
-            trip_update_stats['trips'] = len(df['trip_id'].unique())
-        if 'route_id' in df.columns:
-            trip_update_stats['routes'] = len(df['route_id'].unique())
+    if not feed:
+        return {}
+    columns = cached_process(decode_scheduled_trip_updates, feed)
+    return trip_update_stats(columns if positions is None else columns.select(positions))
+
+
+def get_vehicle_stats(vehicle_positions):
+    """
+    Compute vehicle and status statistics for vehicle positions
     
-    # Get statistics for vehicle positions
+    Args:
+        vehicle_positions (list): Processed vehicle positions
+        
+    Returns:
+        dict: Vehicle statistics
+    """
     vehicle_stats = {}
     if vehicle_positions:
         df = pd.DataFrame(vehicle_positions)
@@ -378,22 +760,900 @@ def api_all_data():
         # Status counts
         if 'current_status' in df.columns and not df['current_status'].empty:
             vehicle_stats['status'] = df['current_status'].value_counts().to_dict()
+    return vehicle_stats
+
+
+# Processing function of each feed type
+PROCESSORS = {
+    'trip_update': process_trip_updates,
+    'vehicle_position': process_vehicle_positions,
+    'alert': process_alerts
+}
+
+# Feed type of each feed name used in the API paths
+FEED_NAMES = {
+    'trip-updates': 'trip_update',
+    'vehicle-positions': 'vehicle_position',
+    'alerts': 'alert'
+}
+
+
+# Seconds between two keep-alive comments on an idle event stream
+STREAM_KEEPALIVE = 15
+
+# Milliseconds a disconnected event stream client waits before reconnecting
+STREAM_RETRY_MS = 5000
+
+
+def snapshot_key(*snapshots):
+    """
+    Identify a combination of snapshots for response caching
     
-    return jsonify({
+    Returns:
+        tuple: Snapshot ids (None for a missing snapshot)
+    """
+    return tuple(snapshot.snapshot_id if snapshot else None for snapshot in snapshots)
+
+
+# Name of the row list of each feed type in the responses
+ROW_LISTS = {
+    'trip_update': 'trip_updates',
+    'vehicle_position': 'vehicle_positions',
+    'alert': 'alerts'
+}
+
+
+def processor_args(feed_type, time_format):
+    """
+    Get the extra arguments of the processing function of a feed type
+    
+    Returns:
+        tuple: (time_format,) except for alerts, which carry no timestamps
+    """
+    return (time_format,) if feed_type != 'alert' else ()
+
+
+def index_trip_updates(feed):
+    """
+    Index the trip update rows of a feed on their route, trip and stop
+    
+    The interned id columns are grouped directly, without a pass per row.
+    
+    Args:
+        feed: GTFS-RT feed message
+        
+    Returns:
+        RowIndex: Row index
+    """
+    columns = cached_process(decode_scheduled_trip_updates, feed)
+    return RowIndex(len(columns), {
+        'route_id': index_codes(columns.route_codes, columns.route_ids),
+        'trip_id': index_codes(columns.trip_codes, columns.trip_ids),
+        'stop_id': index_codes(columns.stop_codes, columns.stop_ids)
+    })
+
+
+def index_vehicle_positions(feed):
+    """
+    Index the vehicle position rows of a feed on their route, trip and vehicle
+    """
+    return index_rows(cached_process(decode_vehicle_positions, feed), FILTER_FIELDS['vehicle_position'])
+
+
+def index_alerts(feed):
+    """
+    Index the alert rows of a feed on the routes, trips and stops they affect
+    """
+    return index_rows(cached_process(process_alerts, feed), FILTER_FIELDS['alert'], 'affected_entities')
+
+
+# Row index builder of each feed type, run once per snapshot
+INDEXERS = {
+    'trip_update': index_trip_updates,
+    'vehicle_position': index_vehicle_positions,
+    'alert': index_alerts
+}
+
+
+def get_row_query(feed_types):
+    """
+    Parse the filtering, projection and pagination parameters of a request
+    
+    - route_id, trip_id, stop_id, vehicle_id: comma-separated accepted values
+    - min_delay, max_delay: delay bounds in seconds (trip updates)
+    - fields: comma-separated fields to return
+    - limit, cursor: page size and the next_cursor of the previous page
+    
+    Args:
+        feed_types (list): Feed types served by the endpoint
+        
+    Returns:
+        tuple: (query dict, error message or None)
+    """
+    args = request.args
+    allowed = {field for feed_type in feed_types for field in FILTER_FIELDS[feed_type]}
+    query = {'filters': {}, 'min_delay': None, 'max_delay': None, 'fields': None, 'limit': None, 'cursor': None}
+    
+    for field in ('route_id', 'trip_id', 'stop_id', 'vehicle_id'):
+        if field in args:
+            if field not in allowed:
+                return None, f"Cannot filter on {field}"
+            query['filters'][field] = tuple(value for value in args[field].split(',') if value)
+    
+    for name in ('min_delay', 'max_delay', 'limit'):
+        if name in args:
+            query[name] = args.get(name, type=int)
+            if query[name] is None:
+                return None, f"Invalid {name}, expected an integer"
+    if (query['min_delay'] is not None or query['max_delay'] is not None) and 'trip_update' not in feed_types:
+        return None, 'Delay filters only apply to trip updates'
+    if query['limit'] is not None and not 0 < query['limit'] <= MAX_PAGE_SIZE:
+        return None, f"Invalid limit, expected 1 to {MAX_PAGE_SIZE}"
+    
+    if args.get('fields'):
+        query['fields'] = tuple(field for field in args['fields'].split(',') if field)
+    if 'cursor' in args:
+        query['cursor'] = decode_cursor(args['cursor'])
+        if query['cursor'] is None:
+            return None, 'Invalid cursor'
+    return query, None
+
+
+def is_row_query(query):
+    """
+    Check whether a query selects or reshapes rows
+    """
+    return bool(query['filters'] or query['fields'] or query['limit'] or query['cursor'] or
+                query['min_delay'] is not None or query['max_delay'] is not None)
+
+
+def row_query_key(query):
+    """
+    Identify a row query for response caching
+    """
+    return tuple((name, tuple(sorted(value.items())) if isinstance(value, dict) else value)
+                 for name, value in sorted(query.items()))
+
+
+def select_positions(feed_type, feed, query, area=None):
+    """
+    Get the positions of the rows of a feed matching a row query
+    
+    Args:
+        feed_type (str): Type of feed
+        feed: GTFS-RT feed message
+        query (dict): Query returned by get_row_query
+        area (tuple): Optional (indices, distances) of a spatial query, whose
+            order (nearest first) is kept
+        
+    Returns:
+        tuple: (int64 row positions, distances in meters or None)
+    """
+    if not feed:
+        return np.zeros(0, dtype=np.int64), None
+    
+    mask = None
+    if feed_type == 'trip_update' and (query['min_delay'] is not None or query['max_delay'] is not None):
+        columns = cached_process(decode_scheduled_trip_updates, feed)
+        # Updates whose delay is neither reported nor scheduled never match
+        mask = columns.delay_known.copy()
+        if query['min_delay'] is not None:
+            mask &= columns.delay_seconds >= query['min_delay']
+        if query['max_delay'] is not None:
+            mask &= columns.delay_seconds <= query['max_delay']
+    
+    filters = {field: values for field, values in query['filters'].items() if field in FILTER_FIELDS[feed_type]}
+    if not filters and mask is None and area is not None:
+        return area
+    positions = filter_positions(cached_process(INDEXERS[feed_type], feed), filters, mask)
+    if area is None:
+        return positions, None
+    
+    indices, distances = area
+    keep = np.isin(indices, positions)
+    return indices[keep], distances[keep] if distances is not None else None
+
+
+def query_rows_payload(feed_type, snapshot, time_format, query, area_query=None):
+    """
+    Build the payload of a feed endpoint, applying the row and spatial queries
+    
+    Args:
+        feed_type (str): Type of feed
+        snapshot (FeedSnapshot): Snapshot to read
+        time_format (str): Format of the timestamps
+        query (dict): Query returned by get_row_query
+        area_query (dict): Query returned by get_spatial_query, or None
+        
+    Returns:
+        dict: Payload
+    """
+    feed = snapshot.feed if snapshot else None
+    rows = cached_process(PROCESSORS[feed_type], feed, *processor_args(feed_type, time_format))
+    payload = {
         'status': 'success',
-        'feed_timestamps': {
-            'trip_update': trip_update_feed.header.timestamp if trip_update_feed else None,
-            'vehicle_position': vehicle_position_feed.header.timestamp if vehicle_position_feed else None,
-            'alert': alert_feed.header.timestamp if alert_feed else None
-        },
-        'trip_updates': trip_updates,
-        'vehicle_positions': vehicle_positions,
-        'alerts': alerts,
-        'statistics': {
-            'trip_updates': trip_update_stats,
-            'vehicles': vehicle_stats,
-            'alerts': {
-                'count': len(alerts)
+        'snapshot_id': snapshot.snapshot_id if snapshot else None,
+        'feed_timestamp': feed.header.timestamp if feed else None
+    }
+    if not is_row_query(query) and not area_query:
+        payload[ROW_LISTS[feed_type]] = rows
+        return payload
+    
+    area = run_spatial_query(cached_process(build_vehicle_index, feed), area_query) if area_query else None
+    positions, distances = select_positions(feed_type, feed, query, area)
+    
+    # Only the requested page of the matching rows is built and serialized
+    offset = query['cursor'][1] if query['cursor'] else 0
+    end = offset + query['limit'] if query['limit'] else len(positions)
+    payload['total'] = len(positions)
+    if query['limit']:
+        payload['next_cursor'] = encode_cursor(snapshot.snapshot_id, end) if snapshot and end < len(positions) else None
+    page = select_rows(rows, positions[offset:end], distances[offset:end] if distances is not None else None)
+    payload[ROW_LISTS[feed_type]] = project_rows(page, query['fields'])
+    return payload
+
+
+def get_query_snapshot(feed_type, query, poller):
+    """
+    Get the snapshot a request reads: the one pinned by its cursor, or the latest
+    
+    Returns:
+        tuple: (snapshot, error response or None)
+    """
+    if not query['cursor']:
+        return get_gtfs_rt_snapshot(feed_type, poller), None
+    snapshot = poller.store.get_by_id(feed_type, query['cursor'][0])
+    if snapshot is None:
+        return None, (jsonify({'status': 'error', 'message': 'Cursor expired, restart from the first page'}), 410)
+    return snapshot, None
+
+
+def feed_response(poller, source_id, feed_type, name, time_format, query, area_query=None):
+    """
+    Serve the JSON rows of a feed for a parsed request
+    
+    Args:
+        poller (FeedPoller): Poller of the source
+        source_id (str): Source identifier, None for the current source
+        feed_type (str): Type of feed
+        name (str): Endpoint name used in the cache key
+        time_format (str): Format of the timestamps
+        query (dict): Query returned by get_row_query
+        area_query (dict): Query returned by get_spatial_query, or None
+        
+    Returns:
+        Response: Flask response
+    """
+    snapshot, error = get_query_snapshot(feed_type, query, poller)
+    if error:
+        return error
+    
+    def build_payload():
+        return query_rows_payload(feed_type, snapshot, time_format, query, area_query)
+    
+    key = (source_id, name, time_format, row_query_key(query), query_key(area_query)) + snapshot_key(snapshot)
+    # Filtered responses are one-off and are not kept in the response cache
+    return cached_json_response(key, build_payload, store=not (is_row_query(query) or area_query))
+
+
+@data_api.route('/api/trip-updates', methods=['GET'])
+@data_api.route('/api/<source_id>/trip-updates', methods=['GET'])
+def api_trip_updates(source_id=None):
+    """
+    Get trip updates from GTFS-RT feed
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    export_format, error = get_export_format('trip_update')
+    if error:
+        return error
+    time_format = get_time_format()
+    if time_format is None:
+        return invalid_time_format_response()
+    query, error = get_row_query(['trip_update'])
+    if error:
+        return query_error(error)
+    
+    if export_format:
+        return feed_export_response(poller, source_id, 'trip_update', export_format, time_format, query)
+    
+    return feed_response(poller, source_id, 'trip_update', 'trip-updates', time_format, query)
+
+
+@data_api.route('/api/vehicle-positions', methods=['GET'])
+@data_api.route('/api/<source_id>/vehicle-positions', methods=['GET'])
+def api_vehicle_positions(source_id=None):
+    """
+    Get vehicle positions from GTFS-RT feed
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    export_format, error = get_export_format('vehicle_position')
+    if error:
+        return error
+    time_format = get_time_format()
+    if time_format is None:
+        return invalid_time_format_response()
+    area_query, error = get_spatial_query()
+    if error:
+        return query_error(error)
+    query, error = get_row_query(['vehicle_position'])
+    if error:
+        return query_error(error)
+    
+    if export_format:
+        return feed_export_response(poller, source_id, 'vehicle_position', export_format, time_format, query,
+                                    area_query)
+    
+    return feed_response(poller, source_id, 'vehicle_position', 'vehicle-positions', time_format, query, area_query)
+
+
+def build_stop_rows(static_gtfs):
+    """
+    Build the rows of the static stops, in stop code order
+    
+    Args:
+        static_gtfs (StaticGTFS): Static model
+        
+    Returns:
+        list: One dict per stop
+    """
+    return [
+        {
+            'stop_id': stop.stop_id,
+            'stop_code': stop.code,
+            'stop_name': stop.name,
+            'latitude': stop.latitude,
+            'longitude': stop.longitude
+        }
+        for stop in (static_gtfs.stops[stop_id] for stop_id in static_gtfs.strings['stop_id'])
+    ]
+
+
+@data_api.route('/api/stops', methods=['GET'])
+def api_stops():
+    """
+    Get the static GTFS stops, optionally restricted to an area
+    """
+    export_format, error = get_export_format('stops')
+    if error:
+        return error
+    query, error = get_spatial_query()
+    if error:
+        return query_error(error)
+    
+    static_gtfs = get_static_gtfs()
+    if export_format:
+        stops = build_stop_rows(static_gtfs)
+        if query:
+            stops = select_rows(stops, *run_spatial_query(static_gtfs.get_stop_index(), query))
+        return export_response(stops, export_format, 'stops')
+    
+    def build_payload():
+        stops = build_stop_rows(static_gtfs)
+        if query:
+            stops = select_rows(stops, *run_spatial_query(static_gtfs.get_stop_index(), query))
+        return {
+            'status': 'success',
+            'stops': stops
+        }
+    
+    key = ('stops', static_gtfs.load_id, query_key(query))
+    return cached_json_response(key, build_payload, store=query is None)
+
+
+@data_api.route('/api/alerts', methods=['GET'])
+@data_api.route('/api/<source_id>/alerts', methods=['GET'])
+def api_alerts(source_id=None):
+    """
+    Get alerts from GTFS-RT feed
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    query, error = get_row_query(['alert'])
+    if error:
+        return query_error(error)
+    
+    return feed_response(poller, source_id, 'alert', 'alerts', DEFAULT_TIME_FORMAT, query)
+
+
+@data_api.route('/api/all-data', methods=['GET'])
+@data_api.route('/api/<source_id>/all-data', methods=['GET'])
+def api_all_data(source_id=None):
+    """
+    Get all GTFS-RT data (trip updates, vehicle positions, and alerts)
+    
+    Each filter applies to the lists having that field; the statistics
+    describe the filtered rows. Pagination is only offered by the
+    single-feed endpoints. With 'at' (epoch seconds), the archived
+    snapshots nearest to that time are returned instead of the live ones.
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    time_format = get_time_format()
+    if time_format is None:
+        return invalid_time_format_response()
+    query, error = get_row_query(list(PROCESSORS))
+    if error:
+        return query_error(error)
+    if query['limit'] or query['cursor']:
+        return query_error('Pagination is not supported on all-data')
+    at = request.args.get('at', type=int)
+    if at is None and 'at' in request.args:
+        return query_error('Invalid at, expected epoch seconds')
+    
+    # Get all data
+    if at is None:
+        trip_update_snapshot = get_gtfs_rt_snapshot('trip_update', poller)
+        vehicle_position_snapshot = get_gtfs_rt_snapshot('vehicle_position', poller)
+        alert_snapshot = get_gtfs_rt_snapshot('alert', poller)
+        snapshots_key = snapshot_key(trip_update_snapshot, vehicle_position_snapshot, alert_snapshot)
+    else:
+        archive, archive_source_id, error = get_archive_source(source_id)
+        if error:
+            return error
+        (trip_update_snapshot, trip_update_location), (vehicle_position_snapshot, vehicle_position_location), \
+            (alert_snapshot, alert_location) = [
+                get_archived_snapshot(archive, archive_source_id, feed_type, at)
+                for feed_type in ('trip_update', 'vehicle_position', 'alert')
+            ]
+        snapshots_key = ('archive', trip_update_location, vehicle_position_location, alert_location)
+    
+    def build_payload():
+        trip_update_feed = trip_update_snapshot.feed if trip_update_snapshot else None
+        vehicle_position_feed = vehicle_position_snapshot.feed if vehicle_position_snapshot else None
+        alert_feed = alert_snapshot.feed if alert_snapshot else None
+        
+        # Process data
+        trip_updates = cached_process(process_trip_updates, trip_update_feed, time_format)
+        vehicle_positions = cached_process(process_vehicle_positions, vehicle_position_feed, time_format)
+        alerts = cached_process(process_alerts, alert_feed)
+        trip_update_positions = None
+        
+        if is_row_query(query):
+            trip_update_positions = select_positions('trip_update', trip_update_feed, query)[0]
+            trip_updates = select_rows(trip_updates, trip_update_positions)
+            vehicle_positions = select_rows(vehicle_positions,
+                                            select_positions('vehicle_position', vehicle_position_feed, query)[0])
+            alerts = select_rows(alerts, select_positions('alert', alert_feed, query)[0])
+        
+        return {
+            'status': 'success',
+            # Archived snapshots have no id to resume the live updates from
+            'snapshot_ids': None if at is not None else {
+                'trip_update': trip_update_snapshot.snapshot_id if trip_update_snapshot else None,
+                'vehicle_position': vehicle_position_snapshot.snapshot_id if vehicle_position_snapshot else None,
+                'alert': alert_snapshot.snapshot_id if alert_snapshot else None
+            },
+            'feed_timestamps': {
+                'trip_update': trip_update_feed.header.timestamp if trip_update_feed else None,
+                'vehicle_position': vehicle_position_feed.header.timestamp if vehicle_position_feed else None,
+                'alert': alert_feed.header.timestamp if alert_feed else None
+            },
+            'trip_updates': project_rows(trip_updates, query['fields']),
+            'vehicle_positions': project_rows(vehicle_positions, query['fields']),
+            'alerts': project_rows(alerts, query['fields']),
+            'statistics': {
+                'trip_updates': get_trip_update_stats(trip_update_feed, trip_update_positions),
+                'delay_windows': poller.delay_stats.get_summaries() if at is None else None,
+                'vehicles': get_vehicle_stats(vehicle_positions),
+                'alerts': {
+                    'count': len(alerts)
+                }
             }
         }
-    })
+    
+    # The rolling statistics are updated just before a trip update snapshot is published
+    key = ((source_id, 'all-data', time_format, row_query_key(query), poller.delay_stats.version) +
+           snapshots_key)
+    return cached_json_response(key, build_payload, store=not is_row_query(query))
+
+
+@data_api.route('/api/<feed_name>/changes', methods=['GET'])
+@data_api.route('/api/<source_id>/<feed_name>/changes', methods=['GET'])
+def api_changes(feed_name, source_id=None):
+    """
+    Get the entities added, changed or removed since a client's snapshot
+    
+    The client passes the snapshot id it last received as 'since'. When that
+    snapshot is no longer kept, the full data is returned instead.
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    feed_type = FEED_NAMES.get(feed_name)
+    if feed_type is None:
+        return jsonify({'status': 'error', 'message': f'Unknown feed: {feed_name}'}), 404
+    
+    time_format = get_time_format()
+    if time_format is None:
+        return invalid_time_format_response()
+    
+    since = request.args.get('since', type=int)
+    poller.wait_until_ready(FIRST_SNAPSHOT_TIMEOUT)
+    snapshot = poller.store.get(feed_type)
+    base = poller.store.get_by_id(feed_type, since) if since is not None else None
+    
+    key, build_payload = changes_payload(feed_type, snapshot, base, time_format,
+                                         get_changed_entities(poller, feed_type, base))
+    return cached_json_response((source_id,) + key, build_payload)
+
+
+def get_changed_entities(poller, feed_type, base):
+    """
+    Get the trips whose content changed since a client's trip update snapshot
+    
+    Returns:
+        set: Trip ids, or None to compare every entity (other feed types,
+            full data, or a snapshot older than the trip states remember)
+    """
+    if feed_type != 'trip_update' or base is None:
+        return None
+    return poller.trip_states.changed_since(base.snapshot_id)
+
+
+def changes_payload(feed_type, snapshot, base, time_format=DEFAULT_TIME_FORMAT, changed_entities=None):
+    """
+    Prepare the changes between two snapshots of a feed type
+    
+    Args:
+        feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+        snapshot (FeedSnapshot): Latest snapshot
+        base (FeedSnapshot): Snapshot known by the client, or None for full data
+        time_format (str): Format of the timestamps in the rows (text, iso, epoch)
+        changed_entities (set): Only entities that may differ, all if None
+        
+    Returns:
+        tuple: (response cache key, function building the payload)
+    """
+    processor = PROCESSORS[feed_type]
+    # Alerts carry no timestamps and take no time format
+    args = (time_format,) if feed_type != 'alert' else ()
+    
+    def build_payload():
+        rows = cached_process(processor, snapshot.feed if snapshot else None, *args)
+        payload = {
+            'status': 'success',
+            'feed_type': feed_type,
+            'snapshot_id': snapshot.snapshot_id if snapshot else None,
+            'since': base.snapshot_id if base else None,
+            'full': base is None or snapshot is None
+        }
+        if payload['full']:
+            payload['data'] = rows
+        else:
+            base_rows = cached_process(processor, base.feed, *args)
+            payload.update(diff_entities(get_entity_index(base, base_rows, time_format),
+                                         get_entity_index(snapshot, rows, time_format), changed_entities))
+        return payload
+    
+    key = ('changes', feed_type, time_format, base.snapshot_id if base else None) + snapshot_key(snapshot)
+    return key, build_payload
+
+
+@data_api.route('/api/stream', methods=['GET'])
+@data_api.route('/api/<source_id>/stream', methods=['GET'])
+def api_stream(source_id=None):
+    """
+    Push the changes of each new snapshot as Server-Sent Events
+    
+    One event is sent per new snapshot, named after the feed type and holding
+    the same payload as the changes endpoints. The client passes the snapshot
+    ids it already has as 'trip_update', 'vehicle_position' and 'alert'
+    query parameters; reconnecting clients are resumed from Last-Event-ID.
+    """
+    poller = get_source_poller(source_id)
+    if poller is None:
+        return unknown_source_response(source_id)
+    
+    time_format = get_time_format()
+    if time_format is None:
+        return invalid_time_format_response()
+    
+    known_ids = {feed_type: request.args.get(feed_type, type=int) for feed_type in PROCESSORS}
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id:
+        for feed_type, value in zip(PROCESSORS, last_event_id.split(':')):
+            known_ids[feed_type] = int(value) if value.isdigit() else None
+    
+    poller.wait_until_ready(FIRST_SNAPSHOT_TIMEOUT)
+    store = poller.store
+    
+    def generate():
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            snapshots = store.wait_for_change(known_ids, STREAM_KEEPALIVE)
+            if not snapshots:
+                # Comment line keeping proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            
+            for snapshot in snapshots:
+                base = store.get_by_id(snapshot.feed_type, known_ids[snapshot.feed_type])
+                key, build_payload = changes_payload(snapshot.feed_type, snapshot, base, time_format,
+                                                     get_changed_entities(poller, snapshot.feed_type, base))
+                rendered = render_json((source_id,) + key, build_payload)
+                known_ids[snapshot.feed_type] = snapshot.snapshot_id
+                
+                event_id = ':'.join(str(known_ids[feed_type] or '') for feed_type in PROCESSORS)
+                yield (f"id: {event_id}\nevent: {snapshot.feed_type}\n"
+                       f"data: {rendered.body.decode('utf-8')}\n\n")
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def get_archive_source(source_id):
+    """
+    Resolve the archive and the source of an archive request
+    
+    Args:
+        source_id (str): Source of the /api/<source_id>/archive/... routes, None for the current source
+        
+    Returns:
+        tuple: (FeedArchive, source identifier, error response or None)
+    """
+    archive = get_feed_archive()
+    if archive is None:
+        return None, None, (jsonify({'status': 'error', 'message': 'Archive is not enabled'}), 404)
+    if source_id is None:
+        current_source = get_current_source()
+        if current_source is None:
+            return None, None, (jsonify({'status': 'error', 'message': 'No current source'}), 404)
+        source_id = get_source_id(current_source)
+    elif not is_valid_source_id(source_id):
+        return None, None, (jsonify({'status': 'error', 'message': f'Unknown source: {source_id}'}), 404)
+    return archive, source_id, None
+
+
+def get_archived_snapshot(archive, source_id, feed_type, timestamp):
+    """
+    Get the archived feed nearest to a timestamp as a snapshot without id
+    
+    Returns:
+        tuple: (FeedSnapshot or None, (segment path, offset) or None)
+    """
+    found = archive.find_nearest(source_id, feed_type, timestamp)
+    if found is None:
+        return None, None
+    _, segment_path, offset = found
+    feed_timestamp, feed = read_feed(segment_path, offset)
+    return FeedSnapshot(None, feed_type, feed, feed_timestamp), (segment_path, offset)
+
+
+def archived_rows(feed_type, feed, time_format, query):
+    """
+    Build the rows of an archived feed, applying a row query
+    
+    Args:
+        feed_type (str): Type of feed
+        feed: Archived GTFS-RT feed message
+        time_format (str): Format of the timestamps
+        query (dict): Query returned by get_row_query
+        
+    Returns:
+        list: Rows
+    """
+    rows = cached_process(PROCESSORS[feed_type], feed, *processor_args(feed_type, time_format))
+    if is_row_query(query):
+        rows = project_rows(select_rows(rows, select_positions(feed_type, feed, query)[0]), query['fields'])
+    return rows
+
+
+def parse_archive_request(feed_name, source_id):
+    """
+    Parse the parameters shared by the archive endpoints
+    
+    Returns:
+        tuple: (dict with archive, source_id, feed_type, time_format and query, error response or None)
+    """
+    feed_type = FEED_NAMES.get(feed_name)
+    if feed_type is None:
+        return None, (jsonify({'status': 'error', 'message': f'Unknown feed: {feed_name}'}), 404)
+    archive, source_id, error = get_archive_source(source_id)
+    if error:
+        return None, error
+    time_format = get_time_format()
+    if time_format is None:
+        return None, invalid_time_format_response()
+    query, error = get_row_query([feed_type])
+    if error:
+        return None, query_error(error)
+    if query['limit'] or query['cursor']:
+        return None, query_error('Pagination is not supported on archived feeds')
+    return {
+        'archive': archive,
+        'source_id': source_id,
+        'feed_type': feed_type,
+        'time_format': time_format,
+        'query': query
+    }, None
+
+
+@data_api.route('/api/archive/<feed_name>/timeline', methods=['GET'])
+@data_api.route('/api/<source_id>/archive/<feed_name>/timeline', methods=['GET'])
+def api_archive_timeline(feed_name, source_id=None):
+    """
+    Get the time span archived for a feed
+    """
+    feed_type = FEED_NAMES.get(feed_name)
+    if feed_type is None:
+        return jsonify({'status': 'error', 'message': f'Unknown feed: {feed_name}'}), 404
+    archive, source_id, error = get_archive_source(source_id)
+    if error:
+        return error
+    
+    return jsonify(dict(
+        {'status': 'success', 'source_id': source_id, 'feed_type': feed_type},
+        **archive.get_timeline(source_id, feed_type)
+    ))
+
+
+@data_api.route('/api/archive/<feed_name>/at', methods=['GET'])
+@data_api.route('/api/<source_id>/archive/<feed_name>/at', methods=['GET'])
+def api_archive_at(feed_name, source_id=None):
+    """
+    Get the archived snapshot nearest to the 'timestamp' parameter (epoch seconds)
+    
+    The row filters and fields of the live endpoints apply.
+    """
+    request_info, error = parse_archive_request(feed_name, source_id)
+    if error:
+        return error
+    timestamp = request.args.get('timestamp', type=int)
+    if timestamp is None:
+        return query_error('Invalid timestamp, expected epoch seconds')
+    
+    archive, source_id, feed_type = request_info['archive'], request_info['source_id'], request_info['feed_type']
+    time_format, query = request_info['time_format'], request_info['query']
+    found = archive.find_nearest(source_id, feed_type, timestamp)
+    if found is None:
+        return jsonify({'status': 'error', 'message': 'No archived snapshot'}), 404
+    _, segment_path, offset = found
+    
+    def build_payload():
+        feed_timestamp, feed = read_feed(segment_path, offset)
+        return {
+            'status': 'success',
+            'source_id': source_id,
+            'feed_type': feed_type,
+            'requested_timestamp': timestamp,
+            'feed_timestamp': feed_timestamp,
+            ROW_LISTS[feed_type]: archived_rows(feed_type, feed, time_format, query)
+        }
+    
+    # The response of an archived snapshot never changes, whatever timestamp led to it
+    key = ('archive', source_id, feed_type, segment_path, offset, time_format, row_query_key(query))
+    return cached_json_response(key, build_payload, store=not is_row_query(query))
+
+
+@data_api.route('/api/archive/<feed_name>/replay', methods=['GET'])
+@data_api.route('/api/<source_id>/archive/<feed_name>/replay', methods=['GET'])
+def api_archive_replay(feed_name, source_id=None):
+    """
+    Stream the archived snapshots between 'start' and 'end' (epoch seconds)
+    as newline-delimited JSON, one line per snapshot
+    
+    With 'step' (seconds), snapshots closer than that to the previous
+    streamed one are skipped.
+    """
+    request_info, error = parse_archive_request(feed_name, source_id)
+    if error:
+        return error
+    start = request.args.get('start', type=int)
+    end = request.args.get('end', type=int)
+    step = request.args.get('step', 0, type=int)
+    if start is None or end is None or end < start:
+        return query_error('Invalid range, expected start <= end in epoch seconds')
+    
+    archive, source_id, feed_type = request_info['archive'], request_info['source_id'], request_info['feed_type']
+    time_format, query = request_info['time_format'], request_info['query']
+    records = archive.iter_range(source_id, feed_type, start, end)
+    
+    def generate():
+        previous = None
+        for timestamp, segment_path, offset in records:
+            if previous is not None and timestamp - previous < step:
+                continue
+            previous = timestamp
+            feed_timestamp, feed = read_feed(segment_path, offset)
+            line = {'feed_timestamp': feed_timestamp, ROW_LISTS[feed_type]: archived_rows(feed_type, feed, time_format, query)}
+            yield json.dumps(line, separators=(',', ':')) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+# Bytes read from a part file per chunk of a streamed job download
+DOWNLOAD_CHUNK_BYTES = 1 << 20
+
+
+@data_api.route('/api/export-jobs', methods=['POST'])
+@data_api.route('/api/<source_id>/export-jobs', methods=['POST'])
+def api_submit_export_job(source_id=None):
+    """
+    Start exporting the archived snapshots of a feed between 'start' and
+    'end' (epoch seconds), as Parquet ('format': 'parquet', the default) or
+    gzipped CSV ('format': 'csv')
+    
+    Submitting the same export again returns the existing job, resumed if
+    it did not finish.
+    """
+    params = request.get_json(silent=True) or {}
+    feed_type = FEED_NAMES.get(params.get('feed'))
+    if feed_type not in DECODERS:
+        return query_error(f"Invalid feed, expected one of: {', '.join(name for name, value in FEED_NAMES.items() if value in DECODERS)}")
+    start, end = params.get('start'), params.get('end')
+    if not isinstance(start, int) or not isinstance(end, int) or end < start:
+        return query_error('Invalid range, expected start <= end in epoch seconds')
+    export_format = params.get('format', 'parquet')
+    if export_format not in PART_EXTENSIONS:
+        return query_error(f"Invalid format, expected one of: {', '.join(PART_EXTENSIONS)}")
+    unavailable = get_unavailable_format(export_format)
+    if unavailable:
+        return jsonify({'status': 'error', 'message': unavailable}), 501
+    _, source_id, error = get_archive_source(source_id)
+    if error:
+        return error
+    
+    job = get_export_jobs().submit(source_id, feed_type, start, end, export_format)
+    return jsonify({'status': 'success', 'job': job}), 202
+
+
+@data_api.route('/api/export-jobs', methods=['GET'])
+def api_export_jobs():
+    """
+    List the export jobs, most recent first
+    """
+    return jsonify({'status': 'success', 'jobs': get_export_jobs().list()})
+
+
+@data_api.route('/api/export-jobs/<job_id>', methods=['GET'])
+def api_export_job(job_id):
+    """
+    Get the state and progress of an export job
+    """
+    job = get_export_jobs().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown export job: {job_id}'}), 404
+    return jsonify({'status': 'success', 'job': job})
+
+
+@data_api.route('/api/export-jobs/<job_id>/download', methods=['GET'])
+def api_export_job_download(job_id):
+    """
+    Download the files of a finished export job as a zip archive of its
+    date partitions, streamed while it is built
+    """
+    export_jobs = get_export_jobs()
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown export job: {job_id}'}), 404
+    if job['state'] != 'done':
+        return jsonify({'status': 'error', 'message': f"Export job is {job['state']}"}), 409
+    files = export_jobs.iter_files(job_id)
+    
+    def generate():
+        # Parts are already compressed, so they are stored as they are
+        sink = ChunkSink()
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for name, path in files:
+                with open(path, 'rb') as source, archive.open(name, 'w', force_zip64=True) as target:
+                    for chunk in iter(lambda: source.read(DOWNLOAD_CHUNK_BYTES), b''):
+                        target.write(chunk)
+                        yield sink.drain()
+                yield sink.drain()
+        yield sink.drain()
+    
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="export-{job_id}.zip"'})
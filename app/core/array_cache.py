@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Name of the file describing the content of a cache directory
+MANIFEST_FILE = 'manifest.json'
+
+# Separator between the strings of a string table (cannot appear in CSV text)
+STRING_SEPARATOR = '\0'
+
+
+def encode_strings(values):
+    """
+    Encode a list of strings into a single UTF-8 byte array
+
+    Args:
+        values (list): Strings to encode
+
+    Returns:
+        numpy.ndarray: uint8 array of the separator-joined strings
+    """
+    return np.frombuffer(STRING_SEPARATOR.join(values).encode('utf-8'), dtype=np.uint8)
+
+
+def decode_strings(data, count):
+    """
+    Decode a string table encoded by encode_strings
+
+    Args:
+        data (numpy.ndarray): uint8 array
+        count (int): Number of strings in the table
+
+    Returns:
+        list: Decoded strings
+    """
+    if count == 0:
+        return []
+    return data.tobytes().decode('utf-8').split(STRING_SEPARATOR)
+
+
+def write_array_cache(cache_dir, arrays, strings, metadata=None):
+    """
+    Write NumPy arrays and string tables to a cache directory
+
+    The directory is written next to its final location and renamed into
+    place, so concurrent readers never see a partial cache.
+
+    Args:
+        cache_dir (str): Final cache directory
+        arrays (dict): Array name -> numpy.ndarray
+        strings (dict): String table name -> list of strings
+        metadata (dict): Extra JSON-serializable values stored in the manifest
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(temp_dir, f"{name}.npy"), np.ascontiguousarray(values))
+        for name, values in strings.items():
+            np.save(os.path.join(temp_dir, f"{name}.str.npy"), encode_strings(values))
+
+        manifest = {
+            'arrays': sorted(arrays),
+            'strings': {name: len(values) for name, values in strings.items()},
+            'metadata': metadata or {}
+        }
+        with open(os.path.join(temp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+
+        try:
+            os.replace(temp_dir, cache_dir)
+        except OSError:
+            # Another process already wrote the same cache
+            if not os.path.exists(os.path.join(cache_dir, MANIFEST_FILE)):
+                raise
+    finally:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def load_array_cache(cache_dir):
+    """
+    Load a cache directory written by write_array_cache
+
+    Arrays are memory-mapped read-only, so processes loading the same cache
+    share its pages.
+
+    Args:
+        cache_dir (str): Cache directory
+
+    Returns:
+        tuple: (arrays dict, strings dict, metadata dict), or None if there
+            is no complete cache in the directory
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode='r')
+            for name in manifest['arrays']
+        }
+        strings = {
+            name: decode_strings(np.load(os.path.join(cache_dir, f"{name}.str.npy"), mmap_mode='r'), count)
+            for name, count in manifest['strings'].items()
+        }
+    except Exception as e:
+        print(f"Error loading array cache from {cache_dir}: {e}")
+        return None
+    return arrays, strings, manifest['metadata']
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import hashlib
+import threading
+from collections import deque
+import numpy as np
+from app.core.feed_cache import LRUCache, cached_process
+from app.core.columnar import decode_vehicle_columns
+from app.core.schedule_delays import decode_scheduled_trip_updates
+from app.core.visualizations import save_delay_chart, save_vehicle_position_map
+
+# Directory of the charts rendered for the data API, served at /output/charts/
+CHARTS_DIR = 'output/charts'
+
+# Rendered files kept per chart; older ones are deleted
+MAX_CHART_FILES = 16
+
+# Parsed feeds whose chart file name is remembered
+CHART_CACHE_ENTRIES = 32
+
+# Seconds a watcher waits for a new snapshot before checking again
+WATCH_TIMEOUT = 60
+
+
+def get_delay_values(feed):
+    """
+    Get the plotted data of the delay distribution chart
+
+    Returns:
+        tuple: (delays in minutes,), or None if there is nothing to plot
+    """
+    delays = cached_process(decode_scheduled_trip_updates, feed).delay_minutes()
+    return (delays,) if len(delays) else None
+
+
+def get_position_values(feed):
+    """
+    Get the plotted data of the vehicle positions chart
+
+    Returns:
+        tuple: (longitudes, latitudes) of the located vehicles, or None if there is nothing to plot
+    """
+    columns = cached_process(decode_vehicle_columns, feed)
+    located = ~(np.isnan(columns.longitudes) | np.isnan(columns.latitudes))
+    if not located.any():
+        return None
+    return columns.longitudes[located], columns.latitudes[located]
+
+
+# Charts rendered for each snapshot: name -> (feed type, data function, drawing function)
+CHARTS = {
+    'delay_distribution': ('trip_update', get_delay_values, save_delay_chart),
+    'vehicle_positions': ('vehicle_position', get_position_values, save_vehicle_position_map)
+}
+
+
+def chart_digest(values):
+    """
+    Identify the plotted data of a chart
+
+    Args:
+        values (tuple): Arrays returned by the data function
+
+    Returns:
+        str: Hex digest of the arrays
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for array in values:
+        digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ChartRenderer:
+    """
+    Renders the charts of each new snapshot in a background thread
+
+    Request handlers only look up the file rendered for their feed, they
+    never draw. Files are named after a digest of the plotted data, so a
+    file is written once and never changes: concurrent readers cannot see
+    another snapshot's chart, unchanged data is not drawn again, and
+    browsers can cache the images.
+    """
+
+    def __init__(self, directory=CHARTS_DIR, url_prefix='/output/charts/', labels=None, keep=MAX_CHART_FILES):
+        """
+        Args:
+            directory (str): Directory the charts are written to
+            url_prefix (str): Prefix of the chart URLs returned by get_chart
+            labels (dict): Title and axis labels per chart name, the defaults if omitted
+            keep (int): Rendered files kept per chart
+        """
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.labels = labels or {}
+        self.keep = keep
+        self._files = LRUCache(CHART_CACHE_ENTRIES)
+        self._history = {name: deque() for name in CHARTS}
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._watched = set()
+        self._thread = None
+
+    def get_chart(self, name, feed):
+        """
+        Get the URL of a chart of a feed, scheduling its rendering if needed
+
+        Args:
+            name (str): Chart name, a key of CHARTS
+            feed: GTFS-RT feed message
+
+        Returns:
+            str: URL of the chart, or None until it is rendered or if there is nothing to plot
+        """
+        if feed is None:
+            return None
+        entry = self._files.get((name, id(feed)))
+        # The entry holds a reference to its feed, so the id cannot have been reused
+        if entry is not None and entry[0] is feed:
+            return self.url_prefix + entry[1] if entry[1] else None
+        self.submit(name, feed)
+        return None
+
+    def submit(self, name, feed):
+        """
+        Schedule the rendering of a chart of a feed
+
+        Args:
+            name (str): Chart name, a key of CHARTS
+            feed: GTFS-RT feed message
+        """
+        with self._lock:
+            if (name, id(feed)) in self._pending:
+                return
+            self._pending.add((name, id(feed)))
+            self._start()
+        self._queue.put((name, feed))
+
+    def watch(self, store):
+        """
+        Render the charts of every new snapshot published to a store
+
+        Args:
+            store (SnapshotStore): Store to watch
+        """
+        with self._lock:
+            if id(store) in self._watched:
+                return
+            self._watched.add(id(store))
+        threading.Thread(target=self._watch, args=(store,), name='chart-watcher', daemon=True).start()
+
+    def render(self, name, feed):
+        """
+        Render a chart of a feed now, unless the same data was already rendered
+
+        Args:
+            name (str): Chart name, a key of CHARTS
+            feed: GTFS-RT feed message
+
+        Returns:
+            str: File name of the chart, or None if there is nothing to plot
+        """
+        _, get_values, save_chart = CHARTS[name]
+        values = get_values(feed)
+        file_name = None
+        if values is not None:
+            file_name = f"{name}-{chart_digest(values)}.png"
+            path = os.path.join(self.directory, file_name)
+            if not os.path.exists(path):
+                os.makedirs(self.directory, exist_ok=True)
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                save_chart(*values, temp_path, labels=self.labels.get(name))
+                # Readers only ever see complete files
+                os.replace(temp_path, path)
+            self._keep(name, file_name)
+        self._files.put((name, id(feed)), (feed, file_name))
+        return file_name
+
+    def _keep(self, name, file_name):
+        history = self._history[name]
+        if file_name in history:
+            history.remove(file_name)
+        history.append(file_name)
+        while len(history) > self.keep:
+            try:
+                os.remove(os.path.join(self.directory, history.popleft()))
+            except OSError:
+                pass
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='chart-renderer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            name, feed = self._queue.get()
+            try:
+                self.render(name, feed)
+            except Exception as e:
+                print(f"Error rendering {name} chart: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard((name, id(feed)))
+
+    def _watch(self, store):
+        feed_types = {feed_type for feed_type, _, _ in CHARTS.values()}
+        known_ids = {feed_type: None for feed_type in feed_types}
+        while True:
+            for snapshot in store.wait_for_change(known_ids, WATCH_TIMEOUT):
+                known_ids[snapshot.feed_type] = snapshot.snapshot_id
+                for name, (feed_type, _, _) in CHARTS.items():
+                    if feed_type == snapshot.feed_type:
+                        self.submit(name, snapshot.feed)
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_chart_renderer():
+    """
+    Get the process-wide renderer of the data API charts
+
+    Returns:
+        ChartRenderer: Shared renderer, writing to CHARTS_DIR
+    """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ChartRenderer()
+    return _renderer
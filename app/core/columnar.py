@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from array import array
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+from app.core.time_format import DEFAULT_TIME_FORMAT, MISSING, format_epochs
+
+# Name of each vehicle stop status code
+VEHICLE_STATUS_NAMES = {code: name for name, code in gtfs_realtime_pb2.VehiclePosition.VehicleStopStatus.items()}
+
+
+class TripUpdateColumns:
+    """
+    Stop time updates of a trip update feed decoded into typed arrays
+
+    Identifiers are interned: each id column holds int32 codes into a table
+    of unique strings, so filters and statistics run on NumPy arrays and
+    strings are only built when rows are serialized.
+
+    Attributes:
+        trip_ids (list): Table of unique trip ids
+        route_ids (list): Table of unique route ids
+        stop_ids (list): Table of unique stop ids
+        trip_codes (numpy.ndarray): int32 index into trip_ids, one per update
+        route_codes (numpy.ndarray): int32 index into route_ids
+        stop_codes (numpy.ndarray): int32 index into stop_ids
+        stop_sequences (numpy.ndarray): int32 stop sequence, MISSING if absent
+        start_dates (numpy.ndarray): int32 trip start date (YYYYMMDD), MISSING if absent
+        delay_seconds (numpy.ndarray): int32 delay, 0 if unknown
+        delay_known (numpy.ndarray): bool, True where delay_seconds is known
+        arrival_times (numpy.ndarray): int64 epoch seconds, MISSING if absent
+        departure_times (numpy.ndarray): int64 epoch seconds, MISSING if absent
+    """
+
+    __slots__ = ('trip_ids', 'route_ids', 'stop_ids', 'trip_codes', 'route_codes',
+                 'stop_codes', 'stop_sequences', 'start_dates', 'delay_seconds',
+                 'delay_known', 'arrival_times', 'departure_times')
+
+    COLUMNS = ('trip_codes', 'route_codes', 'stop_codes', 'stop_sequences', 'start_dates',
+               'delay_seconds', 'delay_known', 'arrival_times', 'departure_times')
+
+    # (id table, code column) pairs, the tables in constructor order
+    TABLES = (('trip_ids', 'trip_codes'), ('route_ids', 'route_codes'), ('stop_ids', 'stop_codes'))
+
+    def __init__(self, trip_ids, route_ids, stop_ids, **columns):
+        self.trip_ids = trip_ids
+        self.route_ids = route_ids
+        self.stop_ids = stop_ids
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.delay_seconds)
+
+    def delay_minutes(self):
+        """
+        Get the delays in minutes, rounded to one decimal
+
+        Returns:
+            numpy.ndarray: float64 delays in minutes
+        """
+        # Python's round() is applied once per distinct delay, as np.round
+        # rounds some halves differently (e.g. -171s gives -2.8 instead of -2.9)
+        unique_delays, inverse = np.unique(self.delay_seconds, return_inverse=True)
+        rounded = np.array([round(delay / 60, 1) for delay in unique_delays.tolist()], dtype=np.float64)
+        return rounded[inverse.ravel()]
+
+    def select(self, mask):
+        """
+        Get the subset of updates matching a boolean mask or an index array
+
+        Args:
+            mask (numpy.ndarray): Boolean mask or integer indices
+
+        Returns:
+            TripUpdateColumns: Selected updates, sharing the id tables
+        """
+        return TripUpdateColumns(
+            self.trip_ids, self.route_ids, self.stop_ids,
+            **{name: getattr(self, name)[mask] for name in self.COLUMNS}
+        )
+
+    def to_records(self, time_format=DEFAULT_TIME_FORMAT):
+        """
+        Build the processed rows, one dict per stop time update
+
+        Args:
+            time_format (str): Format of the arrival/departure times (text, iso, epoch)
+
+        Returns:
+            list: Rows with the same fields as process_trip_updates
+        """
+        if not len(self):
+            return []
+
+        trip_ids = np.array(self.trip_ids, dtype=object)[self.trip_codes].tolist()
+        route_ids = np.array(self.route_ids, dtype=object)[self.route_codes].tolist()
+        stop_ids = np.array(self.stop_ids, dtype=object)[self.stop_codes].tolist()
+
+        return [
+            {
+                'trip_id': trip_id,
+                'route_id': route_id,
+                'stop_id': stop_id,
+                'delay_seconds': delay_seconds,
+                'delay_minutes': delay_minutes,
+                'arrival_time': arrival_time,
+                'departure_time': departure_time
+            }
+            for trip_id, route_id, stop_id, delay_seconds, delay_minutes, arrival_time, departure_time in zip(
+                trip_ids, route_ids, stop_ids,
+                self.delay_seconds.tolist(), self.delay_minutes().tolist(),
+                format_epochs(self.arrival_times, time_format),
+                format_epochs(self.departure_times, time_format)
+            )
+        ]
+
+
+class VehiclePositionColumns:
+    """
+    Vehicle positions of a feed decoded into typed arrays
+
+    Attributes:
+        vehicle_ids (list): Table of unique vehicle ids
+        trip_ids (list): Table of unique trip ids
+        route_ids (list): Table of unique route ids
+        vehicle_codes (numpy.ndarray): int32 index into vehicle_ids, one per vehicle
+        trip_codes (numpy.ndarray): int32 index into trip_ids
+        route_codes (numpy.ndarray): int32 index into route_ids
+        latitudes (numpy.ndarray): float64 latitude, NaN if absent
+        longitudes (numpy.ndarray): float64 longitude, NaN if absent
+        bearings (numpy.ndarray): float64 bearing, NaN if absent
+        speeds (numpy.ndarray): float64 speed, NaN if absent
+        status_codes (numpy.ndarray): int8 VehicleStopStatus, MISSING if absent
+        timestamps (numpy.ndarray): int64 epoch seconds, MISSING if absent
+    """
+
+    __slots__ = ('vehicle_ids', 'trip_ids', 'route_ids', 'vehicle_codes', 'trip_codes', 'route_codes',
+                 'latitudes', 'longitudes', 'bearings', 'speeds', 'status_codes', 'timestamps')
+
+    COLUMNS = ('vehicle_codes', 'trip_codes', 'route_codes', 'latitudes', 'longitudes', 'bearings',
+               'speeds', 'status_codes', 'timestamps')
+
+    # (id table, code column) pairs, the tables in constructor order
+    TABLES = (('vehicle_ids', 'vehicle_codes'), ('trip_ids', 'trip_codes'), ('route_ids', 'route_codes'))
+
+    def __init__(self, vehicle_ids, trip_ids, route_ids, **columns):
+        self.vehicle_ids = vehicle_ids
+        self.trip_ids = trip_ids
+        self.route_ids = route_ids
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.vehicle_codes)
+
+    def to_records(self, get_route=None):
+        """
+        Build the vehicle rows, keeping the timestamps in epoch seconds
+
+        Args:
+            get_route (callable): (route_id, trip_id) -> static Route or None,
+                used to add the route names and colors
+
+        Returns:
+            list: Rows with the same fields as the vehicle positions API
+        """
+        if not len(self):
+            return []
+
+        def optional(values):
+            return [None if value != value else value for value in values.tolist()]
+
+        vehicle_ids = np.array(self.vehicle_ids, dtype=object)[self.vehicle_codes].tolist()
+        trip_ids = np.array(self.trip_ids, dtype=object)[self.trip_codes].tolist()
+        route_ids = np.array(self.route_ids, dtype=object)[self.route_codes].tolist()
+        statuses = [VEHICLE_STATUS_NAMES.get(code, 'UNKNOWN') for code in self.status_codes.tolist()]
+        timestamps = [None if value == MISSING else value for value in self.timestamps.tolist()]
+
+        rows = []
+        for vehicle_id, trip_id, route_id, latitude, longitude, bearing, speed, status, timestamp in zip(
+                vehicle_ids, trip_ids, route_ids, optional(self.latitudes), optional(self.longitudes),
+                optional(self.bearings), optional(self.speeds), statuses, timestamps):
+            route = get_route(route_id, trip_id) if get_route else None
+            rows.append({
+                'vehicle_id': vehicle_id,
+                'trip_id': trip_id,
+                'route_id': route_id,
+                'latitude': latitude,
+                'longitude': longitude,
+                'bearing': bearing,
+                'speed': speed,
+                'current_status': status,
+                'timestamp': timestamp,
+                'route_short_name': route.short_name if route else '',
+                'route_long_name': route.long_name if route else '',
+                'route_color': route.color if route else '',
+                'route_text_color': route.text_color if route else ''
+            })
+        return rows
+
+
+def concat_columns(parts):
+    """
+    Concatenate decoded columns (e.g. the shards of one feed), merging the
+    id tables
+
+    The merged tables list the ids in order of first appearance, so
+    concatenating the shards of a feed gives the same result as decoding
+    the whole feed at once.
+
+    Args:
+        parts (list): TripUpdateColumns or VehiclePositionColumns of the same class
+
+    Returns:
+        Columns of the same class
+    """
+    if len(parts) == 1:
+        return parts[0]
+
+    cls = type(parts[0])
+    tables = []
+    codes = {}
+    for table_name, code_name in cls.TABLES:
+        merged = {}
+        remapped = []
+        for part in parts:
+            mapping = np.array([merged.setdefault(value, len(merged)) for value in getattr(part, table_name)],
+                               dtype=np.int32)
+            part_codes = getattr(part, code_name)
+            remapped.append(mapping[part_codes] if len(part_codes) else part_codes)
+        tables.append(list(merged))
+        codes[code_name] = np.concatenate(remapped)
+
+    columns = {
+        name: codes[name] if name in codes else np.concatenate([getattr(part, name) for part in parts])
+        for name in cls.COLUMNS
+    }
+    return cls(*tables, **columns)
+
+
+def compact_columns(columns):
+    """
+    Drop the ids no row refers to from the id tables, keeping the others in
+    order of first appearance as decoding does
+
+    Args:
+        columns: TripUpdateColumns or VehiclePositionColumns, e.g. a selection
+
+    Returns:
+        Columns of the same class
+    """
+    cls = type(columns)
+    tables = []
+    values = {name: getattr(columns, name) for name in cls.COLUMNS}
+    for table_name, code_name in cls.TABLES:
+        table = getattr(columns, table_name)
+        codes = values[code_name]
+        used, first = np.unique(codes, return_index=True)
+        used = used[np.argsort(first, kind='stable')]
+        mapping = np.zeros(len(table), dtype=np.int32)
+        mapping[used] = np.arange(len(used), dtype=np.int32)
+        tables.append([table[code] for code in used.tolist()])
+        values[code_name] = mapping[codes]
+    return cls(*tables, **values)
+
+
+def decode_trip_updates(feed):
+    """
+    Decode the stop time updates of a feed into typed columns
+
+    Args:
+        feed: GTFS-RT feed message
+
+    Returns:
+        TripUpdateColumns: Decoded stop time updates
+    """
+    return decode_trip_update_messages(
+        entity.trip_update for entity in (feed.entity if feed else []) if entity.HasField('trip_update')
+    )
+
+
+def decode_trip_update_messages(trip_updates):
+    """
+    Decode the stop time updates of trip update messages into typed columns
+
+    Args:
+        trip_updates: Iterable of TripUpdate messages
+
+    Returns:
+        TripUpdateColumns: Decoded stop time updates, in message order
+    """
+    trip_table = {}
+    route_table = {}
+    stop_table = {}
+    trip_codes = array('i')
+    route_codes = array('i')
+    stop_codes = array('i')
+    stop_sequences = array('i')
+    start_dates = array('i')
+    delay_seconds = array('i')
+    delay_known = array('b')
+    arrival_times = array('q')
+    departure_times = array('q')
+
+    for trip_update in trip_updates:
+        trip = trip_update.trip
+        trip_id = trip.trip_id if trip.HasField('trip_id') else 'Unknown'
+        route_id = trip.route_id if trip.HasField('route_id') else 'Unknown'
+        trip_code = trip_table.setdefault(trip_id, len(trip_table))
+        route_code = route_table.setdefault(route_id, len(route_table))
+        start_date = int(trip.start_date) if trip.start_date.isdigit() else MISSING
+
+        for stop_time_update in trip_update.stop_time_update:
+            stop_id = stop_time_update.stop_id if stop_time_update.HasField('stop_id') else 'Unknown'
+            has_arrival = stop_time_update.HasField('arrival')
+            has_departure = stop_time_update.HasField('departure')
+            arrival = stop_time_update.arrival
+            departure = stop_time_update.departure
+
+            if has_departure and departure.HasField('delay'):
+                delay, known = departure.delay, 1
+            elif has_arrival and arrival.HasField('delay'):
+                delay, known = arrival.delay, 1
+            else:
+                delay, known = 0, 0
+
+            trip_codes.append(trip_code)
+            route_codes.append(route_code)
+            stop_codes.append(stop_table.setdefault(stop_id, len(stop_table)))
+            stop_sequences.append(stop_time_update.stop_sequence
+                                  if stop_time_update.HasField('stop_sequence') else MISSING)
+            start_dates.append(start_date)
+            delay_seconds.append(delay)
+            delay_known.append(known)
+            arrival_times.append(arrival.time if has_arrival and arrival.HasField('time') else MISSING)
+            departure_times.append(departure.time if has_departure and departure.HasField('time') else MISSING)
+
+    return TripUpdateColumns(
+        list(trip_table), list(route_table), list(stop_table),
+        trip_codes=np.frombuffer(trip_codes, dtype=np.int32),
+        route_codes=np.frombuffer(route_codes, dtype=np.int32),
+        stop_codes=np.frombuffer(stop_codes, dtype=np.int32),
+        stop_sequences=np.frombuffer(stop_sequences, dtype=np.int32),
+        start_dates=np.frombuffer(start_dates, dtype=np.int32),
+        delay_seconds=np.frombuffer(delay_seconds, dtype=np.int32),
+        delay_known=np.frombuffer(delay_known, dtype=np.int8).astype(bool),
+        arrival_times=np.frombuffer(arrival_times, dtype=np.int64),
+        departure_times=np.frombuffer(departure_times, dtype=np.int64)
+    )
+
+
+def decode_vehicle_columns(feed):
+    """
+    Decode the vehicle positions of a feed into typed columns
+
+    Args:
+        feed: GTFS-RT feed message
+
+    Returns:
+        VehiclePositionColumns: Decoded vehicle positions
+    """
+    vehicle_table = {}
+    trip_table = {}
+    route_table = {}
+    vehicle_codes = array('i')
+    trip_codes = array('i')
+    route_codes = array('i')
+    latitudes = array('d')
+    longitudes = array('d')
+    bearings = array('d')
+    speeds = array('d')
+    status_codes = array('b')
+    timestamps = array('q')
+    nan = float('nan')
+
+    for entity in (feed.entity if feed else []):
+        if not entity.HasField('vehicle'):
+            continue
+        vehicle = entity.vehicle
+        has_trip = vehicle.HasField('trip')
+        vehicle_id = vehicle.vehicle.id if vehicle.HasField('vehicle') and vehicle.vehicle.HasField('id') else 'Unknown'
+        trip_id = vehicle.trip.trip_id if has_trip and vehicle.trip.HasField('trip_id') else 'Unknown'
+        route_id = vehicle.trip.route_id if has_trip and vehicle.trip.HasField('route_id') else 'Unknown'
+
+        vehicle_codes.append(vehicle_table.setdefault(vehicle_id, len(vehicle_table)))
+        trip_codes.append(trip_table.setdefault(trip_id, len(trip_table)))
+        route_codes.append(route_table.setdefault(route_id, len(route_table)))
+        if vehicle.HasField('position'):
+            position = vehicle.position
+            latitudes.append(position.latitude if position.HasField('latitude') else nan)
+            longitudes.append(position.longitude if position.HasField('longitude') else nan)
+            bearings.append(position.bearing if position.HasField('bearing') else nan)
+            speeds.append(position.speed if position.HasField('speed') else nan)
+        else:
+            latitudes.append(nan)
+            longitudes.append(nan)
+            bearings.append(nan)
+            speeds.append(nan)
+        status_codes.append(vehicle.current_status if vehicle.HasField('current_status') else MISSING)
+        timestamps.append(vehicle.timestamp if vehicle.HasField('timestamp') else MISSING)
+
+    return VehiclePositionColumns(
+        list(vehicle_table), list(trip_table), list(route_table),
+        vehicle_codes=np.frombuffer(vehicle_codes, dtype=np.int32),
+        trip_codes=np.frombuffer(trip_codes, dtype=np.int32),
+        route_codes=np.frombuffer(route_codes, dtype=np.int32),
+        latitudes=np.frombuffer(latitudes, dtype=np.float64),
+        longitudes=np.frombuffer(longitudes, dtype=np.float64),
+        bearings=np.frombuffer(bearings, dtype=np.float64),
+        speeds=np.frombuffer(speeds, dtype=np.float64),
+        status_codes=np.frombuffer(status_codes, dtype=np.int8),
+        timestamps=np.frombuffer(timestamps, dtype=np.int64)
+    )
+
+
+def trip_update_stats(columns):
+    """
+    Compute delay and trip/route statistics on decoded trip updates
+
+    Args:
+        columns (TripUpdateColumns): Decoded stop time updates
+
+    Returns:
+        dict: Trip update statistics
+    """
+    if not len(columns):
+        return {}
+
+    delay_minutes = columns.delay_minutes()
+    return {
+        'delay': {
+            'average': round(float(delay_minutes.mean()), 1),
+            'max': round(float(delay_minutes.max()), 1),
+            'min': round(float(delay_minutes.min()), 1),
+            'median': round(float(np.median(delay_minutes)), 1)
+        },
+        'trips': int(np.unique(columns.trip_codes).size),
+        'routes': int(np.unique(columns.route_codes).size)
+    }
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import csv
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Rows serialized per chunk of a streamed export
+EXPORT_CHUNK_ROWS = 5000
+
+# Compression of the Parquet column chunks
+PARQUET_COMPRESSION = 'zstd'
+
+
+def get_fields(rows, fields=None):
+    """
+    Get the exported fields, in order
+
+    Args:
+        rows (list): Rows (dicts)
+        fields (tuple): Requested fields, those of the first row if None
+
+    Returns:
+        list: Field names
+    """
+    if fields:
+        return list(fields)
+    return list(rows[0]) if rows else []
+
+
+def iter_chunks(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Split rows into consecutive slices
+    """
+    for start in range(0, len(rows), chunk_rows):
+        yield rows[start:start + chunk_rows]
+
+
+def iter_csv(rows, fields=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Serialize rows as CSV, one chunk of rows at a time
+
+    Args:
+        rows (list): Rows (dicts), not modified
+        fields (tuple): Columns, those of the first row if None
+        chunk_rows (int): Rows per yielded chunk
+
+    Yields:
+        str: CSV text, starting with the header line
+    """
+    fields = get_fields(rows, fields)
+    if not fields:
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore', quoting=csv.QUOTE_MINIMAL)
+    writer.writeheader()
+    for chunk in iter_chunks(rows, chunk_rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def to_feature(row, fields):
+    """
+    Build the GeoJSON feature of a row located by its 'latitude' and 'longitude'
+    """
+    latitude = row.get('latitude')
+    longitude = row.get('longitude')
+    geometry = None
+    if latitude is not None and longitude is not None:
+        geometry = {'type': 'Point', 'coordinates': [longitude, latitude]}
+    return {
+        'type': 'Feature',
+        'geometry': geometry,
+        'properties': {field: row.get(field) for field in fields if field not in ('latitude', 'longitude')}
+    }
+
+
+def iter_geojson(rows, fields=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Serialize located rows as a GeoJSON FeatureCollection of points, one
+    chunk of features at a time
+
+    Args:
+        rows (list): Rows (dicts) with 'latitude' and 'longitude', not modified
+        fields (tuple): Properties, the fields of the first row if None
+        chunk_rows (int): Features per yielded chunk
+
+    Yields:
+        str: Parts of the GeoJSON document
+    """
+    fields = get_fields(rows, fields)
+    yield '{"type":"FeatureCollection","features":['
+    separator = ''
+    for chunk in iter_chunks(rows, chunk_rows):
+        yield separator + ','.join(json.dumps(to_feature(row, fields), separators=(',', ':')) for row in chunk)
+        separator = ','
+    yield ']}'
+
+
+class ChunkSink:
+    """
+    Write-only file collecting the bytes written by the Parquet writer, so
+    that they are sent as soon as each row group is complete
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        """
+        Get and forget the bytes written since the previous call
+        """
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema(rows, fields):
+    """
+    Infer the Arrow schema of rows from the first non-null value of each
+    field (string for fields that are always null)
+    """
+    columns = []
+    for field in fields:
+        value = next((row[field] for row in rows if row.get(field) is not None), None)
+        columns.append((field, pa.array([value]).type if value is not None else pa.string()))
+    return pa.schema(columns)
+
+
+def iter_parquet(rows, fields=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Serialize rows as a Parquet file, one row group per chunk of rows
+
+    Args:
+        rows (list): Rows (dicts), not modified
+        fields (tuple): Columns, those of the first row if None
+        chunk_rows (int): Rows per row group
+
+    Yields:
+        bytes: Parts of the Parquet file
+    """
+    fields = get_fields(rows, fields)
+    if not fields:
+        return
+    schema = parquet_schema(rows, fields)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression=PARQUET_COMPRESSION)
+    try:
+        for chunk in iter_chunks(rows, chunk_rows):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# Serializer, MIME type and file extension of each export format
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'geojson': (iter_geojson, 'application/geo+json', 'geojson'),
+    'parquet': (iter_parquet, 'application/vnd.apache.parquet', 'parquet')
+}
+
+
+def get_unavailable_format(export_format):
+    """
+    Check whether the dependency of an export format is installed (pyarrow,
+    listed in requirements.txt, may be missing from a partial install)
+
+    Returns:
+        str: Error message, or None if the format can be exported
+    """
+    if export_format == 'parquet' and pq is None:
+        return 'Parquet export requires pyarrow, install the packages of requirements.txt'
+    return None
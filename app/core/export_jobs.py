@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import csv
+import gzip
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+from app.utils.config_manager import load_config
+from app.core.columnar import VEHICLE_STATUS_NAMES, decode_trip_updates, decode_vehicle_columns
+from app.core.export import PARQUET_COMPRESSION
+from app.core.feed_archive import get_feed_archive, get_segment_start, read_record
+from app.core.parallel_decode import WORKER_START_METHOD
+from app.core.time_format import MISSING
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Directory of the export jobs: <job_id>/job.json and <job_id>/date=<YYYY-MM-DD>/part-*.<extension>
+EXPORTS_DIR = 'data/exports'
+
+# Export job identifiers, as built by get_job_id, also used as directory names
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{16}')
+
+# Worker processes scanning archived segments when 'export_workers' is not configured
+DEFAULT_EXPORT_WORKERS = 2
+
+# File extension of the parts of each export format
+PART_EXTENSIONS = {
+    'parquet': 'parquet',
+    'csv': 'csv.gz'
+}
+
+# Rows of the snapshots buffered into each Parquet row group of a part
+PARQUET_ROW_GROUP_ROWS = 100000
+
+# Decoding function of each exportable feed type
+DECODERS = {
+    'trip_update': decode_trip_updates,
+    'vehicle_position': decode_vehicle_columns
+}
+
+
+def optional(values, absent):
+    """
+    Get a null mask of the absent values of an array (MISSING or NaN)
+
+    Returns:
+        numpy.ndarray: bool, True where absent
+    """
+    if absent is None:
+        return np.isnan(values)
+    return values == absent
+
+
+def get_export_columns(feed_type, columns, feed_timestamp):
+    """
+    Describe the exported columns of a decoded feed
+
+    Identifier columns are (codes, table) pairs, the other columns
+    (values, null mask or None) pairs, so that both writers keep the
+    arrays as they are.
+
+    Args:
+        feed_type (str): Key of DECODERS
+        columns: Decoded feed
+        feed_timestamp (int): Timestamp of the archived snapshot
+
+    Returns:
+        list: (name, kind, data) with kind 'ids' or 'values'
+    """
+    size = len(columns)
+    exported = [('feed_timestamp', 'values', (np.full(size, feed_timestamp, dtype=np.int64), None))]
+    for table, codes in columns.TABLES:
+        exported.append((table[:-1], 'ids', (getattr(columns, codes), getattr(columns, table))))
+
+    if feed_type == 'trip_update':
+        exported += [
+            ('stop_sequence', 'values', (columns.stop_sequences, optional(columns.stop_sequences, MISSING))),
+            ('start_date', 'values', (columns.start_dates, optional(columns.start_dates, MISSING))),
+            ('delay', 'values', (columns.delay_seconds, ~columns.delay_known)),
+            ('arrival_time', 'values', (columns.arrival_times, optional(columns.arrival_times, MISSING))),
+            ('departure_time', 'values', (columns.departure_times, optional(columns.departure_times, MISSING)))
+        ]
+    else:
+        status_codes = sorted(VEHICLE_STATUS_NAMES)
+        # Status codes become codes into the table of status names, absent ones the last entry
+        status_positions = np.searchsorted(status_codes, columns.status_codes)
+        status_positions[~np.isin(columns.status_codes, status_codes)] = len(status_codes)
+        exported += [
+            (name, 'values', (getattr(columns, attribute), optional(getattr(columns, attribute), None)))
+            for name, attribute in (('latitude', 'latitudes'), ('longitude', 'longitudes'),
+                                    ('bearing', 'bearings'), ('speed', 'speeds'))
+        ]
+        exported += [
+            ('current_status', 'ids', (status_positions.astype(np.int32),
+                                       [VEHICLE_STATUS_NAMES[code] for code in status_codes] + ['UNKNOWN'])),
+            ('timestamp', 'values', (columns.timestamps, optional(columns.timestamps, MISSING)))
+        ]
+    return exported
+
+
+def to_arrow_table(exported):
+    """
+    Build an Arrow table from exported columns, dictionary-encoding the identifiers
+    """
+    arrays = []
+    for _, kind, (values, extra) in exported:
+        if kind == 'ids':
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(values, pa.int32()), pa.array(extra, pa.string())))
+        else:
+            arrays.append(pa.array(values, mask=extra))
+    return pa.Table.from_arrays(arrays, names=[name for name, _, _ in exported])
+
+
+def write_row_group(writer, tables):
+    """
+    Write the buffered Arrow tables of several snapshots as one Parquet row group
+    """
+    table = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+    writer.write_table(table, row_group_size=max(table.num_rows, 1))
+
+
+def to_csv_rows(exported):
+    """
+    Build the CSV rows of exported columns, absent values left empty
+    """
+    lists = []
+    for _, kind, (values, extra) in exported:
+        if kind == 'ids':
+            lists.append(np.array(extra, dtype=object)[values].tolist())
+        else:
+            column = values.tolist()
+            if extra is not None:
+                for position in np.flatnonzero(extra).tolist():
+                    column[position] = None
+            lists.append(column)
+    return zip(*lists)
+
+
+def export_segment(segment_path, offsets, feed_type, export_format, part_path):
+    """
+    Export archived snapshots of one segment to a part file (run in the worker processes)
+
+    Snapshots are decoded one at a time. CSV rows are written per
+    snapshot; Parquet tables are buffered up to PARQUET_ROW_GROUP_ROWS
+    rows and written as one row group, so a worker's memory stays bounded
+    while the parts keep few, large row groups. The part is written under
+    a temporary name and renamed once complete, so an existing part is
+    always whole.
+
+    Args:
+        segment_path (str): Path of the archived segment
+        offsets (list): Offsets of the records to export, in order
+        feed_type (str): Key of DECODERS
+        export_format (str): Key of PART_EXTENSIONS
+        part_path (str): Path of the part file
+
+    Returns:
+        dict: Number of snapshots and rows and size of the part in bytes
+    """
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    temp_path = f"{part_path}.{os.getpid()}.tmp"
+    snapshots = 0
+    rows = 0
+    writer = None
+    buffered = []
+    buffered_rows = 0
+    try:
+        for offset in offsets:
+            timestamp, content = read_record(segment_path, offset)
+            feed = gtfs_realtime_pb2.FeedMessage()
+            feed.ParseFromString(content)
+            exported = get_export_columns(feed_type, DECODERS[feed_type](feed), timestamp)
+            if export_format == 'parquet':
+                table = to_arrow_table(exported)
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_path, table.schema, compression=PARQUET_COMPRESSION)
+                buffered.append(table.cast(writer.schema))
+                buffered_rows += table.num_rows
+                if buffered_rows >= PARQUET_ROW_GROUP_ROWS:
+                    write_row_group(writer, buffered)
+                    buffered = []
+                    buffered_rows = 0
+            else:
+                if writer is None:
+                    writer = gzip.open(temp_path, 'wt', newline='', encoding='utf-8')
+                    csv_writer = csv.writer(writer)
+                    csv_writer.writerow([name for name, _, _ in exported])
+                csv_writer.writerows(to_csv_rows(exported))
+            snapshots += 1
+            rows += len(exported[0][2][0])
+        if buffered:
+            write_row_group(writer, buffered)
+    except Exception:
+        # No partial part is left behind for the retry
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if writer is None:
+        return {'snapshots': 0, 'rows': 0, 'bytes': 0}
+    writer.close()
+    os.replace(temp_path, part_path)
+    return {'snapshots': snapshots, 'rows': rows, 'bytes': os.path.getsize(part_path)}
+
+
+def get_job_id(source_id, feed_type, start, end, export_format):
+    """
+    Identify an export job by its parameters, so that submitting the same
+    export again resumes or returns the existing job
+    """
+    key = json.dumps([source_id, feed_type, start, end, export_format]).encode()
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+
+class ExportJobs:
+    """
+    Asynchronous exports of archived snapshots over long time ranges
+
+    A job lists the archived segments overlapping its range, and each
+    segment becomes one part file, partitioned by UTC date
+    (date=YYYY-MM-DD/part-<segment>.<extension>), exported by a pool of
+    worker processes. Progress is saved in job.json after every part:
+    parts already written are skipped when a job is resumed, e.g. after a
+    restart or a failure.
+    """
+
+    def __init__(self, directory=EXPORTS_DIR, archive=None, max_workers=DEFAULT_EXPORT_WORKERS):
+        """
+        Args:
+            directory (str): Directory of the jobs
+            archive (FeedArchive): Archive to export from, the configured one if omitted
+            max_workers (int): Number of worker processes
+        """
+        self.directory = directory
+        self.archive = archive
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._threads = {}
+
+    def get_job_dir(self, job_id):
+        """
+        Get the directory of a job
+        """
+        return os.path.join(self.directory, job_id)
+
+    def _save(self, job):
+        path = os.path.join(self.get_job_dir(job['job_id']), 'job.json')
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(job, f, indent=4)
+        os.replace(f"{path}.tmp", path)
+
+    def _load(self, job_id):
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            with open(os.path.join(self.get_job_dir(job_id), 'job.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, job_id):
+        """
+        Get the status and progress of a job
+
+        Returns:
+            dict: Job state, or None if the job is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._describe(job)
+        job = self._load(job_id)
+        return self._describe(job) if job else None
+
+    def list(self):
+        """
+        Get every job, most recent first
+
+        Returns:
+            list: Job states
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = [self.get(job_id) for job_id in os.listdir(self.directory)]
+        return sorted((job for job in jobs if job), key=lambda job: job['created_at'], reverse=True)
+
+    def _describe(self, job):
+        job = dict(job, parts=list(job['parts']))
+        elapsed = job['elapsed_seconds']
+        job['progress'] = round(job['segments_done'] / job['segments_total'], 3) if job['segments_total'] else None
+        job['rows_per_second'] = round(job['rows'] / elapsed) if elapsed else None
+        job['snapshots_per_second'] = round(job['snapshots'] / elapsed, 1) if elapsed else None
+        return job
+
+    def submit(self, source_id, feed_type, start, end, export_format='parquet'):
+        """
+        Start an export job, or resume the one with the same parameters
+
+        Args:
+            source_id (str): Source identifier
+            feed_type (str): Key of DECODERS
+            start (int): First epoch second, included
+            end (int): Last epoch second, included (capped to the current time when planned)
+            export_format (str): Key of PART_EXTENSIONS
+
+        Returns:
+            dict: Job state
+        """
+        job_id = get_job_id(source_id, feed_type, start, end, export_format)
+        with self._lock:
+            job = self._jobs.get(job_id) or self._load(job_id)
+            if job is None:
+                os.makedirs(self.get_job_dir(job_id), exist_ok=True)
+                job = {
+                    'job_id': job_id,
+                    'source_id': source_id,
+                    'feed_type': feed_type,
+                    'start': start,
+                    'end': end,
+                    'format': export_format,
+                    'state': 'queued',
+                    'error': None,
+                    'created_at': int(time.time()),
+                    'segments_total': None,
+                    'segments_done': 0,
+                    'snapshots': 0,
+                    'rows': 0,
+                    'bytes': 0,
+                    'elapsed_seconds': 0,
+                    'parts': []
+                }
+                self._save(job)
+            self._jobs[job_id] = job
+            if job['state'] != 'done':
+                self._start(job)
+            return self._describe(job)
+
+    def resume(self):
+        """
+        Resume the jobs left unfinished by a previous process
+
+        Returns:
+            list: Identifiers of the resumed jobs
+        """
+        resumed = []
+        if not os.path.isdir(self.directory):
+            return resumed
+        for job_id in os.listdir(self.directory):
+            job = self._load(job_id)
+            if job is not None and job['state'] in ('queued', 'running'):
+                with self._lock:
+                    self._jobs[job_id] = job
+                    self._start(job)
+                resumed.append(job_id)
+        return resumed
+
+    def wait(self, job_id, timeout=None):
+        """
+        Block until a job's worker thread has finished
+
+        Returns:
+            dict: Job state
+        """
+        thread = self._threads.get(job_id)
+        if thread is not None:
+            thread.join(timeout)
+        return self.get(job_id)
+
+    def _start(self, job):
+        thread = self._threads.get(job['job_id'])
+        if thread is not None and thread.is_alive():
+            return
+        job['state'] = 'running'
+        job['error'] = None
+        if self._executor is None:
+            # Not forked: the pool is started from a job thread of the multithreaded server
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+        thread = threading.Thread(target=self._run, args=(job,), name=f"export-{job['job_id']}", daemon=True)
+        self._threads[job['job_id']] = thread
+        thread.start()
+
+    def _plan(self, job):
+        archive = self.archive or get_feed_archive()
+        if archive is None:
+            raise RuntimeError('Archive is not enabled')
+        # Snapshots still queued for writing are part of the range
+        archive.flush()
+        # Snapshots archived after the planning are left out, even if the requested end is later
+        end = min(job['end'], int(time.time()))
+        offsets = {}
+        for _, segment_path, offset in archive.iter_range(job['source_id'], job['feed_type'], job['start'], end):
+            offsets.setdefault(segment_path, []).append(offset)
+
+        extension = PART_EXTENSIONS[job['format']]
+        plan = []
+        for segment_path, segment_offsets in offsets.items():
+            date = datetime.fromtimestamp(get_segment_start(segment_path), timezone.utc).strftime('%Y-%m-%d')
+            segment_name = os.path.basename(segment_path).rsplit('.', 1)[0]
+            part = f"date={date}/part-{segment_name}.{extension}"
+            plan.append((segment_path, segment_offsets, part))
+        return plan
+
+    def _run(self, job):
+        started = time.monotonic()
+        elapsed = job['elapsed_seconds']
+        try:
+            plan = self._plan(job)
+            done = set(job['parts'])
+            job_dir = self.get_job_dir(job['job_id'])
+            with self._lock:
+                job['segments_total'] = len(plan)
+                job['segments_done'] = len([part for _, _, part in plan if part in done])
+                self._save(job)
+
+            futures = {
+                self._executor.submit(export_segment, segment_path, offsets, job['feed_type'], job['format'],
+                                      os.path.join(job_dir, part)): part
+                for segment_path, offsets, part in plan
+                if part not in done
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                with self._lock:
+                    if result['snapshots']:
+                        job['parts'].append(futures[future])
+                    job['segments_done'] += 1
+                    job['snapshots'] += result['snapshots']
+                    job['rows'] += result['rows']
+                    job['bytes'] += result['bytes']
+                    job['elapsed_seconds'] = round(elapsed + time.monotonic() - started, 3)
+                    self._save(job)
+            state, error = 'done', None
+        except Exception as e:
+            print(f"Error exporting archive for job {job['job_id']}: {e}")
+            state, error = 'failed', str(e)
+
+        with self._lock:
+            job['state'] = state
+            job['error'] = error
+            job['elapsed_seconds'] = round(elapsed + time.monotonic() - started, 3)
+            self._save(job)
+
+    def iter_files(self, job_id):
+        """
+        Get the part files of a finished job
+
+        Returns:
+            list: (path inside the job directory, absolute path) pairs, in partition order
+        """
+        job = self.get(job_id)
+        job_dir = self.get_job_dir(job_id)
+        return [(part, os.path.join(job_dir, part)) for part in sorted(job['parts'])]
+
+
+_export_jobs = None
+_export_jobs_lock = threading.Lock()
+
+
+def get_export_jobs():
+    """
+    Get the process-wide export jobs, resuming the unfinished ones on first use
+
+    The number of worker processes is set by 'export_workers' in the configuration.
+
+    Returns:
+        ExportJobs: Shared export jobs
+    """
+    global _export_jobs
+    with _export_jobs_lock:
+        if _export_jobs is None:
+            _export_jobs = ExportJobs(max_workers=load_config().get('export_workers', DEFAULT_EXPORT_WORKERS))
+            _export_jobs.resume()
+    return _export_jobs
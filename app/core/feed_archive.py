@@ -0,0 +1,659 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import hashlib
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from app.utils.config_manager import is_valid_source_id, load_config
+from app.core.feed_cache import feed_cache
+from app.core.gtfs_rt_reader import parse_gtfs_rt_content
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+# Root directory of the archive: <source_id>/<feed_type>/<sequence>-<first timestamp>.seg
+ARCHIVE_DIR = 'data/archive'
+
+# Extensions of the segment files and of their timestamp indexes
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+# Header of each record of a segment: feed timestamp, codec, payload length
+RECORD_HEADER = struct.Struct('<qBI')
+
+# Entry of a segment index, one per record, in append order
+INDEX_ENTRY = np.dtype([('timestamp', '<i8'), ('offset', '<u8')])
+
+# Codec byte of each compression
+CODECS = {'none': 0, 'zlib': 1, 'zstd': 2}
+
+# Archive settings, overridden by the 'archive' section of the configuration
+DEFAULT_ARCHIVE_CONFIG = {
+    'enabled': False,
+    'directory': ARCHIVE_DIR,
+    'compression': 'zstd' if zstd else 'zlib',
+    'level': 3,
+    # A new segment is started after this many seconds or bytes
+    'segment_seconds': 3600,
+    'segment_bytes': 64 * 1024 * 1024,
+    # Segments are deleted when older than this many days (None keeps them)
+    'retention_days': 7,
+    # Segments are deleted, oldest first, while a stream exceeds this size (None for no limit)
+    'max_bytes': None
+}
+
+# Number of snapshots waiting to be written before new ones are dropped
+ARCHIVE_QUEUE_SIZE = 256
+
+
+def compress(content, compression, level=3):
+    """
+    Compress a serialized feed
+
+    Args:
+        content (bytes): Serialized feed
+        compression (str): 'zstd', 'zlib' or 'none'
+        level (int): Compression level
+
+    Returns:
+        tuple: (codec byte, payload)
+    """
+    if compression == 'zstd' and zstd is not None:
+        return CODECS['zstd'], zstd.ZstdCompressor(level=level).compress(content)
+    if compression in ('zstd', 'zlib'):
+        return CODECS['zlib'], zlib.compress(content, level)
+    return CODECS['none'], content
+
+
+def decompress(codec, payload):
+    """
+    Decompress the payload of a record
+
+    Args:
+        codec (int): Codec byte of the record
+        payload (bytes): Compressed payload
+
+    Returns:
+        bytes: Serialized feed
+    """
+    if codec == CODECS['zstd']:
+        if zstd is None:
+            raise RuntimeError('zstandard is required to read zstd-compressed records')
+        return zstd.ZstdDecompressor().decompress(payload)
+    if codec == CODECS['zlib']:
+        return zlib.decompress(payload)
+    return bytes(payload)
+
+
+def get_index_path(segment_path):
+    """
+    Get the path of the timestamp index of a segment
+    """
+    return segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def get_segment_sequence(segment_path):
+    """
+    Get the sequence number of a segment from its name
+    """
+    return int(os.path.basename(segment_path).split('-', 1)[0])
+
+
+def get_segment_start(segment_path):
+    """
+    Get the timestamp of the first record of a segment from its name
+    """
+    return int(os.path.basename(segment_path)[:-len(SEGMENT_SUFFIX)].split('-', 1)[1])
+
+
+def find_nearest(segments, timestamp):
+    """
+    Find the archived record nearest to a timestamp
+
+    The segment is found by binary search over the start timestamps in the
+    segment names, then the record by binary search over that segment's
+    index, so only one index is read whatever the length of the archive.
+    Records are assumed to be appended in timestamp order.
+
+    Args:
+        segments (list): Segment paths, oldest first
+        timestamp (int): Requested epoch seconds
+
+    Returns:
+        tuple: (record timestamp, segment path, offset), or None if there is no record
+    """
+    if not segments:
+        return None
+    starts = [get_segment_start(path) for path in segments]
+    position = bisect.bisect_right(starts, timestamp) - 1
+    if position < 0:
+        return starts[0], segments[0], 0
+
+    candidates = []
+    index = read_index(segments[position])
+    after = int(np.searchsorted(index['timestamp'], timestamp, side='right'))
+    if after > 0:
+        candidates.append((int(index['timestamp'][after - 1]), segments[position], int(index['offset'][after - 1])))
+    if after < len(index):
+        candidates.append((int(index['timestamp'][after]), segments[position], int(index['offset'][after])))
+    elif position + 1 < len(segments):
+        # The first record of a segment is at offset 0
+        candidates.append((starts[position + 1], segments[position + 1], 0))
+    if not candidates:
+        return None
+    return min(candidates, key=lambda candidate: abs(candidate[0] - timestamp))
+
+
+def iter_range(segments, start, end):
+    """
+    Iterate over the archived records between two timestamps
+
+    Args:
+        segments (list): Segment paths, oldest first
+        start (int): First epoch second, included
+        end (int): Last epoch second, included
+
+    Yields:
+        tuple: (record timestamp, segment path, offset)
+    """
+    starts = [get_segment_start(path) for path in segments]
+    first = max(bisect.bisect_right(starts, start) - 1, 0)
+    for path, segment_start in zip(segments[first:], starts[first:]):
+        if segment_start > end:
+            return
+        index = read_index(path)
+        selected = index[(index['timestamp'] >= start) & (index['timestamp'] <= end)]
+        for timestamp, offset in zip(selected['timestamp'].tolist(), selected['offset'].tolist()):
+            yield timestamp, path, offset
+
+
+def read_feed(segment_path, offset):
+    """
+    Read and parse an archived feed, reusing the parsed feed on repeated reads
+
+    Returning the same feed object lets the processed rows be cached too,
+    e.g. while the dashboard scrubs around the same snapshots.
+
+    Args:
+        segment_path (str): Path of the segment
+        offset (int): Offset of the record
+
+    Returns:
+        tuple: (record timestamp, parsed feed or None)
+    """
+    key = ('archive', segment_path, offset)
+    cached = feed_cache.get(key)
+    if cached is not None:
+        return cached
+    timestamp, content = read_record(segment_path, offset)
+    cached = (timestamp, parse_gtfs_rt_content(content))
+    feed_cache.put(key, cached, weight=len(content))
+    return cached
+
+
+def read_index(segment_path):
+    """
+    Read the timestamp index of a segment
+
+    Args:
+        segment_path (str): Path of the segment
+
+    Returns:
+        numpy.ndarray: INDEX_ENTRY records, empty if the index is missing
+    """
+    try:
+        with open(get_index_path(segment_path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return np.zeros(0, dtype=INDEX_ENTRY)
+    # An entry being written is ignored
+    return np.frombuffer(data[:len(data) - len(data) % INDEX_ENTRY.itemsize], dtype=INDEX_ENTRY)
+
+
+def scan_segment(segment_path):
+    """
+    Read the record headers of a segment, stopping at a truncated record
+
+    Args:
+        segment_path (str): Path of the segment
+
+    Returns:
+        tuple: (INDEX_ENTRY array of the complete records, end offset of the last one)
+    """
+    entries = []
+    size = os.path.getsize(segment_path)
+    offset = 0
+    with open(segment_path, 'rb') as f:
+        while offset + RECORD_HEADER.size <= size:
+            f.seek(offset)
+            timestamp, _, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            if offset + RECORD_HEADER.size + length > size:
+                break
+            entries.append((timestamp, offset))
+            offset += RECORD_HEADER.size + length
+    return np.array(entries, dtype=INDEX_ENTRY), offset
+
+
+def recover_segment(segment_path):
+    """
+    Bring a segment and its index back to a consistent state after a crash
+
+    A partially written record is cut off and the index is rebuilt from the
+    record headers if it does not list every record.
+
+    Args:
+        segment_path (str): Path of the segment
+
+    Returns:
+        numpy.ndarray: INDEX_ENTRY records of the segment
+    """
+    entries, end = scan_segment(segment_path)
+    if end != os.path.getsize(segment_path):
+        with open(segment_path, 'r+b') as f:
+            f.truncate(end)
+    index = read_index(segment_path)
+    if len(index) != len(entries) or not np.array_equal(index, entries):
+        with open(get_index_path(segment_path), 'wb') as f:
+            f.write(entries.tobytes())
+    return entries
+
+
+def read_record(segment_path, offset):
+    """
+    Read one archived feed
+
+    Args:
+        segment_path (str): Path of the segment
+        offset (int): Offset of the record, from the segment index
+
+    Returns:
+        tuple: (feed timestamp, serialized feed)
+    """
+    with open(segment_path, 'rb') as f:
+        f.seek(offset)
+        timestamp, codec, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        return timestamp, decompress(codec, f.read(length))
+
+
+def iter_segment(segment_path):
+    """
+    Iterate over the archived feeds of a segment, in append order
+
+    Yields:
+        tuple: (feed timestamp, serialized feed)
+    """
+    index = read_index(segment_path)
+    with open(segment_path, 'rb') as f:
+        for offset in index['offset'].tolist():
+            f.seek(offset)
+            timestamp, codec, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            yield timestamp, decompress(codec, f.read(length))
+
+
+class ArchiveStream:
+    """
+    Append-only segments of one feed type of one source
+
+    Only the last segment is written to. Each record is appended to the
+    segment file, then its (timestamp, offset) entry to the index file, so
+    a reader trusting the index never sees a partial record.
+    """
+
+    __slots__ = ('directory', 'segment_path', 'segment_file', 'index_file', 'segment_start',
+                 'segment_size', 'last_timestamp', 'last_digest')
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Directory of the stream's segments
+        """
+        self.directory = directory
+        self.segment_path = None
+        self.segment_file = None
+        self.index_file = None
+        self.segment_start = None
+        self.segment_size = 0
+        self.last_timestamp = None
+        self.last_digest = None
+
+        os.makedirs(directory, exist_ok=True)
+        segments = self.list_segments()
+        if segments:
+            # Appending resumes in the last segment left by a previous run
+            entries = recover_segment(segments[-1])
+            self._open(segments[-1], int(entries['timestamp'][0]) if len(entries) else None)
+            if len(entries):
+                self.last_timestamp = int(entries['timestamp'][-1])
+
+    def list_segments(self):
+        """
+        Get the segments of the stream, oldest first
+
+        Returns:
+            list: Segment paths
+        """
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _open(self, segment_path, segment_start):
+        self.close()
+        self.segment_path = segment_path
+        self.segment_file = open(segment_path, 'ab')
+        self.index_file = open(get_index_path(segment_path), 'ab')
+        self.segment_start = segment_start
+        self.segment_size = self.segment_file.tell()
+
+    def append(self, timestamp, codec, payload, segment_seconds, segment_bytes):
+        """
+        Append a record, starting a new segment when the current one is full
+
+        Args:
+            timestamp (int): Feed timestamp
+            codec (int): Codec byte of the payload
+            payload (bytes): Compressed feed
+            segment_seconds (int): Time span of a segment
+            segment_bytes (int): Size of a segment
+
+        Returns:
+            bool: True if a new segment was started
+        """
+        rotated = (self.segment_file is None or
+                   (self.segment_start is not None and timestamp - self.segment_start >= segment_seconds) or
+                   self.segment_size + RECORD_HEADER.size + len(payload) > segment_bytes)
+        if rotated:
+            # The sequence number keeps the names sorted in append order
+            sequence = get_segment_sequence(self.segment_path) + 1 if self.segment_path else 0
+            self._open(os.path.join(self.directory, f"{sequence:08d}-{timestamp:011d}{SEGMENT_SUFFIX}"), timestamp)
+
+        offset = self.segment_size
+        self.segment_file.write(RECORD_HEADER.pack(timestamp, codec, len(payload)))
+        self.segment_file.write(payload)
+        self.segment_file.flush()
+        self.index_file.write(np.array([(timestamp, offset)], dtype=INDEX_ENTRY).tobytes())
+        self.index_file.flush()
+        self.segment_size += RECORD_HEADER.size + len(payload)
+        self.last_timestamp = timestamp
+        if self.segment_start is None:
+            self.segment_start = timestamp
+        return rotated
+
+    def close(self):
+        """
+        Close the files of the current segment
+        """
+        for f in (self.segment_file, self.index_file):
+            if f is not None:
+                f.close()
+        self.segment_file = None
+        self.index_file = None
+
+
+class FeedArchive:
+    """
+    Append-only archive of every distinct feed snapshot, per source and feed type
+
+    Pollers hand the raw protobuf of each published snapshot to submit(),
+    which only queues it: a single writer thread compresses and appends it,
+    so polling never waits on the disk. Segments are rotated by age and
+    size, and whole segments are deleted by the retention policy.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, compression=DEFAULT_ARCHIVE_CONFIG['compression'],
+                 level=DEFAULT_ARCHIVE_CONFIG['level'], segment_seconds=DEFAULT_ARCHIVE_CONFIG['segment_seconds'],
+                 segment_bytes=DEFAULT_ARCHIVE_CONFIG['segment_bytes'],
+                 retention_days=DEFAULT_ARCHIVE_CONFIG['retention_days'], max_bytes=None):
+        """
+        Args:
+            directory (str): Root directory of the archive
+            compression (str): 'zstd' (zlib if zstandard is not installed), 'zlib' or 'none'
+            level (int): Compression level
+            segment_seconds (int): Time span after which a new segment is started
+            segment_bytes (int): Size after which a new segment is started
+            retention_days (float): Age after which segments are deleted, None to keep them
+            max_bytes (int): Size above which a stream's oldest segments are deleted, None for no limit
+        """
+        self.directory = directory
+        self.compression = compression
+        self.level = level
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self._streams = {}
+        self._queue = queue.Queue(ARCHIVE_QUEUE_SIZE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'archived': 0, 'duplicates': 0, 'dropped': 0, 'errors': 0,
+                       'bytes_in': 0, 'bytes_out': 0, 'segments_deleted': 0}
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def get_stats(self):
+        """
+        Get the archive counters and compression ratio
+
+        Returns:
+            dict: Counters
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['compression_ratio'] = round(stats['bytes_in'] / stats['bytes_out'], 2) if stats['bytes_out'] else None
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def get_stream_dir(self, source_id, feed_type):
+        """
+        Get the directory of the segments of a source's feed type
+        """
+        if not is_valid_source_id(source_id):
+            raise ValueError(f"Invalid source identifier: {source_id!r}")
+        return os.path.join(self.directory, source_id, feed_type)
+
+    def list_segments(self, source_id, feed_type):
+        """
+        Get the segments of a source's feed type, oldest first
+
+        Returns:
+            list: Segment paths
+        """
+        directory = self.get_stream_dir(source_id, feed_type)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def find_nearest(self, source_id, feed_type, timestamp):
+        """
+        Find the archived snapshot of a source's feed type nearest to a timestamp
+
+        Returns:
+            tuple: (record timestamp, segment path, offset), or None if nothing is archived
+        """
+        return find_nearest(self.list_segments(source_id, feed_type), timestamp)
+
+    def iter_range(self, source_id, feed_type, start, end):
+        """
+        Iterate over the archived snapshots of a source's feed type between two timestamps
+
+        Yields:
+            tuple: (record timestamp, segment path, offset)
+        """
+        return iter_range(self.list_segments(source_id, feed_type), start, end)
+
+    def get_timeline(self, source_id, feed_type):
+        """
+        Get the time span archived for a source's feed type
+
+        Returns:
+            dict: First and last record timestamps and number of segments
+        """
+        segments = self.list_segments(source_id, feed_type)
+        last_index = read_index(segments[-1]) if segments else None
+        return {
+            'first_timestamp': get_segment_start(segments[0]) if segments else None,
+            'last_timestamp': int(last_index['timestamp'][-1]) if last_index is not None and len(last_index) else None,
+            'segments': len(segments)
+        }
+
+    def submit(self, source_id, feed_type, timestamp, content):
+        """
+        Queue a snapshot for archiving, without blocking
+
+        Args:
+            source_id (str): Source identifier
+            feed_type (str): Type of feed
+            timestamp (int): Feed timestamp (epoch seconds)
+            content (bytes): Serialized feed
+
+        Returns:
+            bool: False if the queue is full and the snapshot was dropped
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((source_id, feed_type, timestamp, content))
+            return True
+        except queue.Full:
+            print(f"Error archiving {feed_type} of {source_id}: archive queue is full")
+            self._count('dropped')
+            return False
+
+    def append(self, source_id, feed_type, timestamp, content):
+        """
+        Compress and write a snapshot, unless it repeats the previous one
+
+        Args:
+            source_id (str): Source identifier
+            feed_type (str): Type of feed
+            timestamp (int): Feed timestamp (epoch seconds)
+            content (bytes): Serialized feed
+
+        Returns:
+            bool: True if the snapshot was written
+        """
+        key = (source_id, feed_type)
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = ArchiveStream(self.get_stream_dir(source_id, feed_type))
+
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+        if digest == stream.last_digest or (timestamp == stream.last_timestamp and stream.last_digest is None):
+            self._count('duplicates')
+            return False
+
+        codec, payload = compress(content, self.compression, self.level)
+        rotated = stream.append(int(timestamp), codec, payload, self.segment_seconds, self.segment_bytes)
+        stream.last_digest = digest
+        self._count('archived')
+        self._count('bytes_in', len(content))
+        self._count('bytes_out', RECORD_HEADER.size + len(payload))
+        if rotated:
+            self.apply_retention(stream)
+        return True
+
+    def apply_retention(self, stream, now=None):
+        """
+        Delete the segments of a stream that are too old or over the size limit
+
+        The segment being written is never deleted.
+
+        Args:
+            stream (ArchiveStream): Stream to clean up
+            now (float): Current epoch seconds, the current time if None
+
+        Returns:
+            int: Number of deleted segments
+        """
+        now = time.time() if now is None else now
+        segments = [path for path in stream.list_segments() if path != stream.segment_path]
+        deleted = []
+        if self.retention_days is not None:
+            limit = now - self.retention_days * 86400
+            for path in segments:
+                index = read_index(path)
+                if not len(index) or index['timestamp'][-1] < limit:
+                    deleted.append(path)
+        if self.max_bytes is not None:
+            remaining = [path for path in segments if path not in deleted]
+            total = stream.segment_size + sum(os.path.getsize(path) for path in remaining)
+            for path in remaining:
+                if total <= self.max_bytes:
+                    break
+                total -= os.path.getsize(path)
+                deleted.append(path)
+
+        for path in deleted:
+            for file_path in (path, get_index_path(path)):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+        self._count('segments_deleted', len(deleted))
+        return len(deleted)
+
+    def flush(self):
+        """
+        Wait until every queued snapshot is written
+        """
+        self._queue.join()
+
+    def start(self):
+        """
+        Start the writer thread if it is not running yet
+
+        Pollers of several sources share the archive, so the check and the
+        start are atomic: a second writer would append to the same segments.
+        """
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='gtfs-rt-archive', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            source_id, feed_type, timestamp, content = self._queue.get()
+            try:
+                self.append(source_id, feed_type, timestamp, content)
+            except Exception as e:
+                print(f"Error archiving {feed_type} of {source_id}: {e}")
+                self._count('errors')
+            finally:
+                self._queue.task_done()
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_feed_archive():
+    """
+    Get the process-wide feed archive
+
+    The archive is enabled by the 'archive' section of the configuration,
+    e.g. {"enabled": true, "retention_days": 30}; see DEFAULT_ARCHIVE_CONFIG.
+
+    Returns:
+        FeedArchive: Shared archive, or None if archiving is disabled
+    """
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            settings = dict(DEFAULT_ARCHIVE_CONFIG, **load_config().get('archive', {}))
+            if not settings.pop('enabled'):
+                return None
+            _archive = FeedArchive(**settings)
+    return _archive
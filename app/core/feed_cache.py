@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from collections import OrderedDict
+
+# Maximum number of parsed feeds kept in memory, and their total size on disk
+FEED_CACHE_ENTRIES = 16
+FEED_CACHE_BYTES = 256 * 1024 * 1024
+
+# Maximum number of processed row lists kept in memory
+ROWS_CACHE_ENTRIES = 32
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and weight
+    """
+
+    def __init__(self, max_entries, max_weight=None):
+        """
+        Args:
+            max_entries (int): Maximum number of entries
+            max_weight (int): Maximum total weight of the entries, unbounded if None
+        """
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self._entries = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Get a cached value and mark it as recently used
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, weight=1):
+        """
+        Store a value, evicting the least recently used entries if needed
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            weight (int): Weight of the value (e.g. its size in bytes)
+        """
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._weight -= previous[1]
+            self._entries[key] = (value, weight)
+            self._weight += weight
+
+            while self._entries and (
+                    len(self._entries) > self.max_entries or
+                    (self.max_weight is not None and self._weight > self.max_weight and len(self._entries) > 1)):
+                _, (_, evicted_weight) = self._entries.popitem(last=False)
+                self._weight -= evicted_weight
+
+    def clear(self):
+        """
+        Drop every entry
+        """
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# Parsed feeds keyed by (path, mtime, size)
+feed_cache = LRUCache(FEED_CACHE_ENTRIES, FEED_CACHE_BYTES)
+
+# Processed row lists keyed by (processor, feed)
+rows_cache = LRUCache(ROWS_CACHE_ENTRIES)
+
+
+def file_cache_key(file_path):
+    """
+    Build a cache key that changes whenever the file is rewritten
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        tuple: (absolute path, mtime in nanoseconds, size in bytes)
+
+    Raises:
+        OSError: If the file cannot be stat'ed
+    """
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def process_key(processor, feed, args):
+    """
+    Build the rows cache key of a processing function applied to a feed
+    """
+    return (processor.__module__, processor.__qualname__, id(feed)) + tuple(args)
+
+
+def cached_process(processor, feed, *args):
+    """
+    Run a processing function on a feed, reusing the previous result if the
+    same feed object was already processed with the same arguments
+
+    The returned rows are shared between callers and must not be modified.
+
+    Args:
+        processor (callable): Function turning a feed into a list of rows
+        feed: GTFS-RT feed message
+        *args: Extra (hashable) arguments passed to the processor
+
+    Returns:
+        list: Rows returned by the processor
+    """
+    if feed is None:
+        return processor(feed, *args)
+
+    key = process_key(processor, feed, args)
+    entry = rows_cache.get(key)
+    # The entry holds a reference to its feed, so the id cannot have been reused
+    if entry is not None and entry[0] is feed:
+        return entry[1]
+
+    rows = processor(feed, *args)
+    rows_cache.put(key, (feed, rows))
+    return rows
+
+
+def prime_process(processor, feed, rows, *args):
+    """
+    Store the result of a processing function computed elsewhere (e.g. in a
+    worker process), so that cached_process returns it for this feed
+
+    Args:
+        processor (callable): Function the rows were computed with
+        feed: GTFS-RT feed message the rows were computed from
+        rows: Result of processor(feed, *args)
+        *args: Extra arguments the rows were computed with
+    """
+    rows_cache.put(process_key(processor, feed, args), (feed, rows))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds allowed to establish a connection to the producer
+CONNECT_TIMEOUT = 5
+
+# Seconds allowed between two bytes received from the producer
+READ_TIMEOUT = 15
+
+# Seconds allowed to download all the feeds of a source
+TOTAL_DEADLINE = 30
+
+# Number of hosts kept in the connection pool, and connections kept per host
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 4
+
+# Number of feeds downloaded at the same time
+MAX_WORKERS = 6
+
+# Size of the chunks read from the response body
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchResult:
+    """
+    Outcome of a single feed download
+
+    Attributes:
+        url (str): Requested URL
+        status_code (int): HTTP status code, or None if no response was received
+        content (bytes): Response body, or None on failure or when not modified
+        error (str): Error message, or None on success
+        elapsed (float): Seconds spent on the download
+        not_modified (bool): True if the producer answered 304 or sent the
+            same body as the previous download
+    """
+
+    __slots__ = ('url', 'status_code', 'content', 'error', 'elapsed', 'not_modified')
+
+    def __init__(self, url, status_code=None, content=None, error=None, elapsed=0.0,
+                 not_modified=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.error = error
+        self.elapsed = elapsed
+        self.not_modified = not_modified
+
+    @property
+    def ok(self):
+        """
+        True if the feed was downloaded successfully or is known to be unchanged
+        """
+        return self.status_code in (200, 304) and self.error is None
+
+
+class FeedFetcher:
+    """
+    Download GTFS-RT feeds concurrently over pooled keep-alive connections
+
+    Every download is bounded by a connect timeout, a read timeout and a
+    deadline covering the whole batch, so a hung producer cannot block the
+    caller indefinitely.
+
+    Conditional downloads remember the ETag, Last-Modified and body hash of
+    each URL and report unchanged feeds as not modified, so that callers can
+    skip writing and parsing them.
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 total_deadline=TOTAL_DEADLINE, max_workers=MAX_WORKERS):
+        """
+        Args:
+            connect_timeout (float): Seconds allowed to connect
+            read_timeout (float): Seconds allowed between two received bytes
+            total_deadline (float): Seconds allowed for a whole batch
+            max_workers (int): Number of concurrent downloads
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_deadline = total_deadline
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gtfs-rt-fetch')
+        self._validators = {}
+        self._validators_lock = threading.Lock()
+
+    def forget(self, url):
+        """
+        Drop the validators of a URL so that its next download is unconditional
+
+        Args:
+            url (str): URL to forget
+        """
+        with self._validators_lock:
+            self._validators.pop(url, None)
+
+    def _conditional_headers(self, url):
+        with self._validators_lock:
+            validators = self._validators.get(url, {})
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def _is_unchanged(self, url, response, content):
+        """
+        Record the validators of a fresh response and compare its body hash
+        with the previous one
+
+        Returns:
+            bool: True if the body is identical to the previous download
+        """
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+        with self._validators_lock:
+            previous = self._validators.get(url, {})
+            self._validators[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'hash': digest
+            }
+        return previous.get('hash') == digest
+
+    def fetch(self, url, deadline=None, conditional=False):
+        """
+        Download a single URL
+
+        Args:
+            url (str): URL to download from
+            deadline (float): time.monotonic() value after which the download is aborted
+            conditional (bool): Send validators and detect unchanged bodies
+
+        Returns:
+            FetchResult: Outcome of the download
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.total_deadline
+        start = time.monotonic()
+        headers = self._conditional_headers(url) if conditional else {}
+
+        try:
+            with self.session.get(url, stream=True, headers=headers,
+                                  timeout=(self.connect_timeout, self.read_timeout)) as response:
+                if conditional and response.status_code == 304:
+                    return FetchResult(url, response.status_code, not_modified=True,
+                                       elapsed=time.monotonic() - start)
+
+                if response.status_code != 200:
+                    return FetchResult(url, response.status_code,
+                                       error=f"HTTP {response.status_code}",
+                                       elapsed=time.monotonic() - start)
+
+                chunks = []
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if time.monotonic() > deadline:
+                        return FetchResult(url, response.status_code, error='Deadline exceeded',
+                                           elapsed=time.monotonic() - start)
+                    chunks.append(chunk)
+
+                content = b''.join(chunks)
+                if conditional and self._is_unchanged(url, response, content):
+                    return FetchResult(url, response.status_code, not_modified=True,
+                                       elapsed=time.monotonic() - start)
+
+                return FetchResult(url, response.status_code, content=content,
+                                   elapsed=time.monotonic() - start)
+        except Exception as e:
+            return FetchResult(url, error=str(e), elapsed=time.monotonic() - start)
+
+    def fetch_all(self, urls, conditional=False):
+        """
+        Download several URLs at the same time
+
+        Args:
+            urls (dict): URL to download, keyed by feed type
+            conditional (bool): Send validators and detect unchanged bodies
+
+        Returns:
+            dict: FetchResult keyed by feed type
+        """
+        deadline = time.monotonic() + self.total_deadline
+        futures = {
+            feed_type: self._executor.submit(self.fetch, url, deadline, conditional)
+            for feed_type, url in urls.items()
+        }
+        wait(futures.values(), timeout=self.total_deadline)
+
+        results = {}
+        for feed_type, future in futures.items():
+            if future.done():
+                results[feed_type] = future.result()
+            else:
+                future.cancel()
+                results[feed_type] = FetchResult(urls[feed_type], error='Deadline exceeded',
+                                                 elapsed=self.total_deadline)
+        return results
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_feed_fetcher():
+    """
+    Get the process-wide feed fetcher
+
+    Returns:
+        FeedFetcher: Shared feed fetcher
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = FeedFetcher()
+    return _fetcher
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+from app.utils.config_manager import get_current_source, get_source_id
+from app.core.gtfs_rt_reader import read_gtfs_rt_file, parse_gtfs_rt_content, read_header_timestamp
+from app.core.feed_fetcher import get_feed_fetcher
+from app.core.snapshot_store import SnapshotStore
+from app.core.parallel_decode import get_parallel_decoder
+from app.core.feed_archive import get_feed_archive
+from app.core.feed_cache import cached_process
+from app.core.schedule_delays import decode_scheduled_trip_updates
+from app.core.rolling_stats import RollingDelayStats
+from app.core.trip_state import TripStateStore
+
+# Feed types handled by the poller
+FEED_TYPES = ['trip_update', 'vehicle_position', 'alert']
+
+# GTFS-RT file paths
+GTFS_RT_DIR = 'data/gtfs_rt'
+FILE_PATHS = {
+    'trip_update': os.path.join(GTFS_RT_DIR, 'TripUpdate.pb'),
+    'vehicle_position': os.path.join(GTFS_RT_DIR, 'VehiclePosition.pb'),
+    'alert': os.path.join(GTFS_RT_DIR, 'Alert.pb')
+}
+
+# Seconds between two polls when the source does not set 'poll_interval'
+DEFAULT_POLL_INTERVAL = 30
+
+# Counters kept per feed type by the poller
+METRIC_NAMES = ['polls', 'published', 'skipped_not_modified', 'skipped_same_timestamp', 'errors']
+
+# Seconds an API handler waits for the very first poll cycle to complete
+FIRST_SNAPSHOT_TIMEOUT = 15
+
+
+def save_feed_file(content, file_path):
+    """
+    Write downloaded GTFS-RT content to disk
+    
+    Args:
+        content (bytes): Serialized GTFS-RT feed message
+        file_path (str): Path to save the content to
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(content)
+
+
+def download_gtfs_rt_from_url(url, file_path):
+    """
+    Download GTFS-RT data from URL
+
+    Args:
+        url (str): URL to download from
+        file_path (str): Path to save the downloaded file
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    result = get_feed_fetcher().fetch(url)
+    if not result.ok:
+        print(f"Error downloading GTFS-RT from {url}: {result.error}")
+        return False
+    save_feed_file(result.content, file_path)
+    return True
+
+
+class FeedPoller:
+    """
+    Background scheduler fetching the feeds of the current source, or of a
+    fixed source
+
+    Each feed is fetched and parsed once per poll interval, whatever the
+    number of clients, and published to a SnapshotStore that the API
+    handlers read from. Remote feeds are fetched conditionally: a feed the
+    producer reports as not modified, or whose body or header timestamp did
+    not change, is neither written nor parsed nor published again.
+    """
+
+    def __init__(self, store=None, interval=None, fetcher=None, source=None, file_paths=None, decoder=None,
+                 archive=None):
+        """
+        Args:
+            store (SnapshotStore): Store to publish to (a new one if omitted)
+            interval (float): Poll interval in seconds, overriding the source's
+            fetcher (FeedFetcher): Fetcher to download with (the shared one if omitted)
+            source (dict): Source to poll, the configured current source if omitted
+            file_paths (dict): Feed file path per feed type, FILE_PATHS if omitted
+            decoder (ParallelDecoder): Worker processes decoding the new feeds
+                before they are published, None to decode on first request
+            archive (FeedArchive): Archive recording every published feed, if any
+        """
+        self.store = store or SnapshotStore()
+        self.fetcher = fetcher or get_feed_fetcher()
+        self._interval = interval
+        self._fixed_source = source
+        self._file_paths = file_paths
+        self.decoder = decoder
+        self.archive = archive
+        self.delay_stats = RollingDelayStats()
+        self.trip_states = TripStateStore()
+        self._source = None
+        self._thread = None
+        self._poll_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._ready_event = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            feed_type: {name: 0 for name in METRIC_NAMES}
+            for feed_type in FEED_TYPES
+        }
+
+    def _count(self, feed_type, name):
+        with self._metrics_lock:
+            self._metrics[feed_type][name] += 1
+
+    def get_metrics(self):
+        """
+        Get the poll counters and skip rate of each feed type
+
+        Returns:
+            dict: Counters keyed by feed type, plus the overall skip rate
+        """
+        with self._metrics_lock:
+            metrics = {feed_type: dict(counters) for feed_type, counters in self._metrics.items()}
+
+        total_polls = 0
+        total_skipped = 0
+        for counters in metrics.values():
+            skipped = counters['skipped_not_modified'] + counters['skipped_same_timestamp']
+            counters['skip_rate'] = round(skipped / counters['polls'], 3) if counters['polls'] else 0
+            total_polls += counters['polls']
+            total_skipped += skipped
+
+        metrics['skip_rate'] = round(total_skipped / total_polls, 3) if total_polls else 0
+        return metrics
+
+    def get_interval(self, source):
+        """
+        Get the poll interval to apply for a source
+
+        Args:
+            source (dict): Source configuration
+
+        Returns:
+            float: Poll interval in seconds
+        """
+        if self._interval is not None:
+            return self._interval
+        if source:
+            return source.get('poll_interval', DEFAULT_POLL_INTERVAL)
+        return DEFAULT_POLL_INTERVAL
+
+    def poll_once(self):
+        """
+        Fetch, parse and publish every feed of the current source once
+
+        Returns:
+            dict: Success flag per feed type
+        """
+        with self._poll_lock:
+            source = self._fixed_source or get_current_source()
+            results = {feed_type: False for feed_type in FEED_TYPES}
+            if source is None:
+                return results
+
+            # Snapshots of a previous source must not be served for the new one
+            if self._source is None or source.get('name') != self._source.get('name'):
+                self.store.clear()
+                self.delay_stats.clear()
+                self.trip_states.clear()
+            self._source = source
+
+            # Remote feeds of the source are downloaded all at once
+            fetched = {}
+            if not source.get('use_local_files', False):
+                urls = {
+                    feed_type: source[f"{feed_type}_url"]
+                    for feed_type in FEED_TYPES
+                    if source.get(f"{feed_type}_url")
+                }
+                # A feed missing from the store must be downloaded in full
+                for feed_type, url in urls.items():
+                    if self.store.get(feed_type) is None:
+                        self.fetcher.forget(url)
+                fetched = self.fetcher.fetch_all(urls, conditional=True)
+
+            # With a decoder, the new feeds of all types are decoded together
+            # in the worker processes before being published
+            pending = [] if self.decoder else None
+            for feed_type in FEED_TYPES:
+                results[feed_type] = self._publish_feed(feed_type, fetched.get(feed_type), pending)
+            if pending:
+                self.decoder.prime(pending)
+                for feed_type, feed, content in pending:
+                    self._publish(feed_type, feed, content)
+            return results
+
+    def _publish_feed(self, feed_type, fetch_result=None, pending=None):
+        """
+        Parse and publish a single feed, unless it is unchanged
+
+        Args:
+            feed_type (str): Type of feed to publish
+            fetch_result (FetchResult): Download outcome, or None to read the local file
+            pending (list): If given, the new feed is appended to it as
+                (feed_type, feed, content) instead of being published
+
+        Returns:
+            bool: True if the latest snapshot is up to date
+        """
+        file_path = (self._file_paths or FILE_PATHS)[feed_type]
+        self._count(feed_type, 'polls')
+
+        if fetch_result is not None:
+            if not fetch_result.ok:
+                print(f"Error downloading GTFS-RT from {fetch_result.url}: {fetch_result.error}")
+                self._count(feed_type, 'errors')
+                return False
+
+            if fetch_result.not_modified:
+                self._count(feed_type, 'skipped_not_modified')
+                return True
+
+            current = self.store.get(feed_type)
+            timestamp = read_header_timestamp(fetch_result.content)
+            if current is not None and timestamp is not None and timestamp == current.feed_timestamp:
+                self._count(feed_type, 'skipped_same_timestamp')
+                return True
+
+            save_feed_file(fetch_result.content, file_path)
+            content = fetch_result.content
+            feed = parse_gtfs_rt_content(content)
+        elif os.path.exists(file_path):
+            content = None
+            feed = read_gtfs_rt_file(file_path)
+        else:
+            return False
+
+        if feed is None:
+            self._count(feed_type, 'errors')
+            return False
+
+        # Cached local files come back as the very same feed object when unchanged
+        current = self.store.get(feed_type)
+        if current is not None and current.feed is feed:
+            self._count(feed_type, 'skipped_not_modified')
+            return True
+
+        if content is None and (pending is not None or self.archive is not None):
+            with open(file_path, 'rb') as f:
+                content = f.read()
+        if pending is not None:
+            pending.append((feed_type, feed, content))
+            return True
+
+        self._publish(feed_type, feed, content)
+        return True
+
+    def _publish(self, feed_type, feed, content):
+        """
+        Publish a new feed to the store, and hand it to the archive if any
+        
+        Trip updates are first merged into the trip states, which decode the
+        changed trips only, then added to the rolling delay statistics, so
+        that responses cached for the new snapshot include them. A trip
+        update snapshot in which no trip changed is not archived again.
+        """
+        changes = None
+        if feed_type == 'trip_update':
+            timestamp = feed.header.timestamp if feed.header.HasField('timestamp') else int(time.time())
+            changes = self._merge_trip_states(feed, timestamp)
+            self._update_delay_stats(feed, timestamp)
+        snapshot = self.store.publish(feed_type, feed)
+        if changes is not None:
+            self.trip_states.record_snapshot(snapshot.snapshot_id)
+        self._count(feed_type, 'published')
+        if self.archive is not None and (changes is None or changes):
+            self.archive.submit(get_source_id(self._source), feed_type,
+                                snapshot.feed_timestamp or int(snapshot.fetched_at), content)
+
+    def _merge_trip_states(self, feed, timestamp):
+        try:
+            return self.trip_states.merge(feed, timestamp)
+        except Exception as e:
+            print(f"Error merging trip states: {e}")
+            # Diffs must not rely on merges that miss this snapshot's changes
+            self.trip_states.clear()
+            return None
+
+    def _update_delay_stats(self, feed, timestamp):
+        try:
+            # The decoded columns are cached for the API handlers as well
+            self.delay_stats.add(timestamp, cached_process(decode_scheduled_trip_updates, feed))
+        except Exception as e:
+            print(f"Error updating delay statistics: {e}")
+
+    def refresh(self):
+        """
+        Poll immediately, outside of the regular schedule
+
+        Returns:
+            dict: Success flag per feed type
+        """
+        results = self.poll_once()
+        self._ready_event.set()
+        return results
+
+    def start(self):
+        """
+        Start the background polling thread if it is not running yet
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='gtfs-rt-poller', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the background polling thread
+
+        Args:
+            timeout (float): Seconds to wait for the thread to exit
+        """
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Block until the first poll cycle has completed
+
+        Args:
+            timeout (float): Maximum number of seconds to wait
+
+        Returns:
+            bool: True if a poll cycle has completed
+        """
+        return self._ready_event.wait(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Error polling GTFS-RT feeds: {e}")
+            self._ready_event.set()
+
+            self._wake_event.wait(self.get_interval(self._source))
+            self._wake_event.clear()
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_feed_poller():
+    """
+    Get the process-wide feed poller, starting it on first use
+
+    Returns:
+        FeedPoller: Running feed poller
+    """
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = FeedPoller(decoder=get_parallel_decoder(), archive=get_feed_archive())
+            _poller.start()
+    return _poller
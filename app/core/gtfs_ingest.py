@@ -0,0 +1,537 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Number of stop_times rows parsed and converted at once
+STOP_TIMES_CHUNK_ROWS = 200000
+
+# stop_times columns used by the static model
+STOP_TIMES_COLUMNS = ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']
+
+# calendar_dates exception types
+SERVICE_ADDED = '1'
+SERVICE_REMOVED = '2'
+
+# calendar day columns, in datetime.weekday() order (bit i of the weekday mask)
+WEEKDAY_COLUMNS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# Value stored in integer columns when the field is absent
+MISSING = -1
+
+
+class GTFSSource:
+    """
+    Static GTFS tables read from a directory of CSV files or a GTFS zip
+
+    Tables are looked up as '<table>.txt' (GTFS naming) or '<table>.csv'.
+    Zip members are streamed without being extracted.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Static GTFS directory or zip file
+        """
+        self.path = path
+        self.is_zip = os.path.isfile(path) and zipfile.is_zipfile(path)
+
+    def _find_member(self, archive, table):
+        for name in archive.namelist():
+            if os.path.basename(name) in (f"{table}.txt", f"{table}.csv"):
+                return name
+        return None
+
+    def _find_file(self, table):
+        for extension in ('txt', 'csv'):
+            file_path = os.path.join(self.path, f"{table}.{extension}")
+            if os.path.exists(file_path):
+                return file_path
+        return None
+
+    @contextmanager
+    def open_table(self, table):
+        """
+        Open a table as a text stream
+
+        Args:
+            table (str): Table name without extension (e.g. 'stop_times')
+
+        Yields:
+            io.TextIOBase: Text stream, or None if the table is absent
+        """
+        if self.is_zip:
+            with zipfile.ZipFile(self.path) as archive:
+                member = self._find_member(archive, table)
+                if member is None:
+                    yield None
+                    return
+                with archive.open(member) as raw:
+                    yield io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            return
+
+        file_path = self._find_file(table) if os.path.isdir(self.path) else None
+        if file_path is None:
+            yield None
+            return
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            yield f
+
+    def iter_rows(self, table):
+        """
+        Iterate over the rows of a table
+
+        Args:
+            table (str): Table name without extension
+
+        Returns:
+            iterator: Rows as dicts of stripped strings, empty if the table is absent
+        """
+        with self.open_table(table) as stream:
+            if stream is None:
+                return
+            for row in csv.DictReader(stream):
+                yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+    def iter_chunks(self, table, columns, chunk_rows=STOP_TIMES_CHUNK_ROWS):
+        """
+        Iterate over a table in DataFrame chunks of string columns
+
+        Args:
+            table (str): Table name without extension
+            columns (list): Columns to read, missing ones are filled with ''
+            chunk_rows (int): Number of rows per chunk
+
+        Returns:
+            iterator: pandas DataFrames of at most chunk_rows rows
+        """
+        with self.open_table(table) as stream:
+            if stream is None:
+                return
+            reader = pd.read_csv(stream, chunksize=chunk_rows, dtype=str, keep_default_na=False,
+                                 skipinitialspace=True, usecols=lambda column: column.strip() in columns)
+            for chunk in reader:
+                chunk.columns = [column.strip() for column in chunk.columns]
+                for column in columns:
+                    if column not in chunk.columns:
+                        chunk[column] = ''
+                yield chunk
+
+
+class Interner:
+    """
+    Table of unique strings assigning each one an integer code
+    """
+
+    __slots__ = ('codes', 'values')
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+
+def parse_int(value):
+    """
+    Parse a small integer field, MISSING if empty or invalid
+    """
+    return int(value) if value.isdigit() else MISSING
+
+
+def parse_float(value):
+    """
+    Parse a float field, NaN if empty or invalid
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+def parse_gtfs_time(value):
+    """
+    Convert a GTFS 'HH:MM:SS' time (possibly past 24:00:00) to seconds
+
+    Args:
+        value (str): Time string
+
+    Returns:
+        int: Seconds after midnight of the service day, MISSING if empty or invalid
+    """
+    parts = value.strip().split(':')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return MISSING
+    return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
+
+
+def map_unique(values, function, dtype=np.int32):
+    """
+    Apply a function once per distinct value of a column
+
+    Columns such as stop_times times and ids repeat a lot, so converting
+    the distinct values and broadcasting them is much faster than
+    converting every row.
+
+    Args:
+        values (pandas.Series): String column
+        function (callable): Conversion of one string
+        dtype: Result dtype
+
+    Returns:
+        numpy.ndarray: Converted values
+    """
+    codes, uniques = pd.factorize(values)
+    converted = np.array([function(value) for value in uniques], dtype=dtype)
+    return converted[codes] if len(converted) else np.full(len(values), MISSING, dtype=dtype)
+
+
+class StaticGTFSBuilder:
+    """
+    Accumulate static GTFS rows into the typed columns of a StaticGTFS
+    """
+
+    def __init__(self):
+        self.route_ids = Interner()
+        self.route_fields = {name: [] for name in ('agency_id', 'route_short_name', 'route_long_name',
+                                                   'route_color', 'route_text_color')}
+        self.route_types = []
+        self.trip_ids = []
+        self.trip_route_codes = []
+        self.trip_service_codes = []
+        self.trip_headsign_codes = []
+        self.trip_directions = []
+        self.headsigns = Interner()
+        self.service_ids = Interner()
+        self.service_exceptions = {}
+        self.service_calendars = {}
+        self.stop_fields = {name: [] for name in ('stop_id', 'stop_code', 'stop_name', 'parent_station')}
+        self.stop_coordinates = []
+        self.stop_location_types = []
+
+    def _route_code(self, route_id, row=None):
+        is_new = route_id not in self.route_ids.codes
+        code = self.route_ids.code(route_id)
+        if is_new:
+            row = row or {}
+            for name, values in self.route_fields.items():
+                values.append(row.get(name, ''))
+            self.route_types.append(parse_int(row.get('route_type', '')))
+        return code
+
+    def add_route(self, row):
+        self._route_code(row.get('route_id', ''), row)
+
+    def add_trip(self, row):
+        # Trips of routes missing from routes.txt still resolve to a route
+        self.trip_ids.append(sys.intern(row.get('trip_id', '')))
+        self.trip_route_codes.append(self._route_code(row.get('route_id', '')))
+        self.trip_service_codes.append(self.service_ids.code(row.get('service_id', '')))
+        self.trip_headsign_codes.append(self.headsigns.code(row.get('trip_headsign', '')))
+        self.trip_directions.append(parse_int(row.get('direction_id', '')))
+
+    def add_stop(self, row):
+        for name, values in self.stop_fields.items():
+            values.append(row.get(name, ''))
+        self.stop_coordinates.append((parse_float(row.get('stop_lat', '')), parse_float(row.get('stop_lon', ''))))
+        location_type = parse_int(row.get('location_type', ''))
+        self.stop_location_types.append(0 if location_type == MISSING else location_type)
+
+    def add_service_date(self, row):
+        if not row.get('date', '').isdigit():
+            return
+        exceptions = self.service_exceptions.setdefault(self.service_ids.code(row.get('service_id', '')), {})
+        if row.get('exception_type') in (SERVICE_ADDED, SERVICE_REMOVED):
+            exceptions[int(row['date'])] = row['exception_type']
+
+    def add_calendar(self, row):
+        start_date = row.get('start_date', '').strip()
+        end_date = row.get('end_date', '').strip()
+        if not start_date.isdigit() or not end_date.isdigit():
+            return
+        weekdays = sum(1 << day for day, column in enumerate(WEEKDAY_COLUMNS) if row.get(column, '').strip() == '1')
+        self.service_calendars[self.service_ids.code(row.get('service_id', ''))] = (
+            weekdays, int(start_date), int(end_date)
+        )
+
+    def _service_dates(self, exception_type):
+        offsets = [0]
+        dates = []
+        for code in range(len(self.service_ids.values)):
+            exceptions = self.service_exceptions.get(code, {})
+            dates.extend(sorted(date for date, value in exceptions.items() if value == exception_type))
+            offsets.append(len(dates))
+        return np.array(offsets, dtype=np.int64), np.array(dates, dtype=np.int32)
+
+    def build(self):
+        """
+        Build the arrays and string tables of the static model
+
+        Returns:
+            tuple: (arrays dict, strings dict)
+        """
+        service_offsets, service_dates = self._service_dates(SERVICE_ADDED)
+        removed_offsets, removed_dates = self._service_dates(SERVICE_REMOVED)
+        calendars = [self.service_calendars.get(code, (0, MISSING, MISSING))
+                     for code in range(len(self.service_ids.values))]
+
+        arrays = {
+            'route_types': np.array(self.route_types, dtype=np.int16),
+            'trip_route_codes': np.array(self.trip_route_codes, dtype=np.int32),
+            'trip_service_codes': np.array(self.trip_service_codes, dtype=np.int32),
+            'trip_headsign_codes': np.array(self.trip_headsign_codes, dtype=np.int32),
+            'trip_directions': np.array(self.trip_directions, dtype=np.int8),
+            'stop_coordinates': np.array(self.stop_coordinates, dtype=np.float64).reshape(-1, 2),
+            'stop_location_types': np.array(self.stop_location_types, dtype=np.int8),
+            'service_offsets': service_offsets,
+            'service_dates': service_dates,
+            'service_removed_offsets': removed_offsets,
+            'service_removed_dates': removed_dates,
+            'service_weekdays': np.array([calendar[0] for calendar in calendars], dtype=np.int8),
+            'service_start_dates': np.array([calendar[1] for calendar in calendars], dtype=np.int32),
+            'service_end_dates': np.array([calendar[2] for calendar in calendars], dtype=np.int32)
+        }
+        strings = {
+            'route_ids': self.route_ids.values,
+            'trip_ids': self.trip_ids,
+            'headsigns': self.headsigns.values,
+            'service_ids': self.service_ids.values
+        }
+        strings.update(self.route_fields)
+        strings.update(self.stop_fields)
+        return arrays, strings
+
+
+def stop_time_keys(trip_codes, values):
+    """
+    Combine trip codes and a per-stop int32 value into sortable int64 keys
+
+    Keys order by trip first, then by value (signed), so stop_times grouped
+    by trip and ordered by stop_sequence have ascending keys.
+
+    Args:
+        trip_codes (numpy.ndarray): Trip codes
+        values (numpy.ndarray): int32 values (e.g. stop sequences or stop codes)
+
+    Returns:
+        numpy.ndarray: int64 keys
+    """
+    return (np.asarray(trip_codes, dtype=np.int64) << 32) + (np.asarray(values, dtype=np.int64) + 2 ** 31)
+
+
+class StopTimesWriter:
+    """
+    Append stop_times chunks to on-disk columns and group them by trip
+
+    Each chunk is written to one raw file per column as soon as it is
+    converted, so memory use does not grow with the number of rows. Rows
+    are expected grouped by trip and ordered by stop_sequence, as GTFS
+    producers write them; otherwise they are sorted once at the end.
+    """
+
+    COLUMNS = ('trip_codes', 'sequences', 'stop_codes', 'arrivals', 'departures')
+
+    def __init__(self, work_dir, trip_count):
+        """
+        Args:
+            work_dir (str): Directory receiving the column files
+            trip_count (int): Number of trips in the trip table
+        """
+        self.work_dir = work_dir
+        self.trip_count = trip_count
+        self.rows = 0
+        self.counts = np.zeros(trip_count, dtype=np.int64)
+        self.is_sorted = True
+        self.last_key = -1
+        self.files = {name: open(self._path(name), 'wb') for name in self.COLUMNS}
+
+    def _path(self, name):
+        return os.path.join(self.work_dir, f"stop_times_{name}.bin")
+
+    def add_chunk(self, **columns):
+        """
+        Append converted rows
+
+        Args:
+            **columns: int32 arrays named after COLUMNS, of equal length
+        """
+        trip_codes = columns['trip_codes']
+        if not len(trip_codes):
+            return
+
+        keys = stop_time_keys(trip_codes, columns['sequences'])
+        if self.is_sorted and (keys[0] < self.last_key or np.any(keys[1:] < keys[:-1])):
+            self.is_sorted = False
+        self.last_key = int(keys[-1])
+
+        self.counts += np.bincount(trip_codes, minlength=self.trip_count)
+        for name in self.COLUMNS:
+            columns[name].astype(np.int32, copy=False).tofile(self.files[name])
+        self.rows += len(trip_codes)
+
+    def finish(self):
+        """
+        Close the column files and build the per-trip stop_times arrays
+
+        Returns:
+            dict: 'stop_time_trip_offsets' (int64, one more than the number of
+                trips) delimiting the rows of each trip in the int32
+                'stop_time_sequences', 'stop_time_stop_codes',
+                'stop_time_arrivals' and 'stop_time_departures' columns
+        """
+        for f in self.files.values():
+            f.close()
+
+        columns = {}
+        for name in self.COLUMNS:
+            if self.rows:
+                columns[name] = np.memmap(self._path(name), dtype=np.int32, mode='r', shape=(self.rows,))
+            else:
+                columns[name] = np.zeros(0, dtype=np.int32)
+
+        if not self.is_sorted:
+            # Sorting needs the row order in memory, one column is permuted at a time
+            order = np.lexsort((columns['sequences'], columns['trip_codes']))
+            for name in self.COLUMNS:
+                sorted_path = self._path(f"{name}_sorted")
+                columns[name][order].tofile(sorted_path)
+                columns[name] = np.memmap(sorted_path, dtype=np.int32, mode='r', shape=(self.rows,))
+            del order
+
+        offsets = np.zeros(self.trip_count + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=offsets[1:])
+        return {
+            'stop_time_trip_offsets': offsets,
+            'stop_time_sequences': columns['sequences'],
+            'stop_time_stop_codes': columns['stop_codes'],
+            'stop_time_arrivals': columns['arrivals'],
+            'stop_time_departures': columns['departures']
+        }
+
+
+def get_peak_rss_mb():
+    """
+    Get the peak resident memory of the process
+
+    Returns:
+        float: Peak RSS in megabytes, None if unavailable on this platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def ingest_gtfs(source_path, work_dir, chunk_rows=STOP_TIMES_CHUNK_ROWS):
+    """
+    Build the arrays of the static model from a GTFS directory or zip,
+    streaming stop_times in chunks
+
+    Args:
+        source_path (str): Static GTFS directory or zip file
+        work_dir (str): Directory receiving the stop_times column files; the
+            returned stop_times arrays map these files and must be copied
+            before it is removed
+        chunk_rows (int): Number of stop_times rows converted at once
+
+    Returns:
+        tuple: (arrays dict, strings dict, stats dict with 'rows',
+            'stop_times', 'skipped_stop_times', 'seconds', 'rows_per_second'
+            and 'peak_rss_mb')
+    """
+    started = time.perf_counter()
+    source = GTFSSource(source_path)
+    builder = StaticGTFSBuilder()
+    rows = 0
+
+    for table, add_row in (('routes', builder.add_route), ('trips', builder.add_trip),
+                           ('stops', builder.add_stop), ('calendar', builder.add_calendar),
+                           ('calendar_dates', builder.add_service_date)):
+        for row in source.iter_rows(table):
+            add_row(row)
+            rows += 1
+
+    arrays, strings = builder.build()
+    trip_index = {trip_id: code for code, trip_id in enumerate(strings['trip_ids'])}
+    stop_index = {stop_id: code for code, stop_id in enumerate(strings['stop_id'])}
+
+    writer = StopTimesWriter(work_dir, len(strings['trip_ids']))
+    skipped = 0
+    for chunk in source.iter_chunks('stop_times', STOP_TIMES_COLUMNS, chunk_rows):
+        rows += len(chunk)
+        trip_codes = map_unique(chunk['trip_id'], lambda value: trip_index.get(value.strip(), MISSING))
+        known = trip_codes != MISSING
+        skipped += int((~known).sum())
+        chunk = chunk[known]
+
+        writer.add_chunk(
+            trip_codes=trip_codes[known],
+            sequences=map_unique(chunk['stop_sequence'], lambda value: parse_int(value.strip())),
+            stop_codes=map_unique(chunk['stop_id'], lambda value: stop_index.get(value.strip(), MISSING)),
+            arrivals=map_unique(chunk['arrival_time'], parse_gtfs_time),
+            departures=map_unique(chunk['departure_time'], parse_gtfs_time)
+        )
+    arrays.update(writer.finish())
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'rows': rows,
+        'stop_times': writer.rows,
+        'skipped_stop_times': skipped,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds) if seconds > 0 else None,
+        'peak_rss_mb': get_peak_rss_mb()
+    }
+    return arrays, strings, stats
+
+
+def format_stats(stats):
+    """
+    Format ingestion statistics for the log
+
+    Args:
+        stats (dict): Statistics returned by ingest_gtfs
+
+    Returns:
+        str: One-line summary
+    """
+    peak_rss = f"{stats['peak_rss_mb']:.0f} MB" if stats['peak_rss_mb'] is not None else 'n/a'
+    return (f"{stats['rows']} rows ({stats['stop_times']} stop times) in {stats['seconds']:.2f}s, "
+            f"{stats['rows_per_second']} rows/s, peak RSS {peak_rss}")
+
+
+def main():
+    """
+    Ingest a static GTFS directory or zip and report throughput and memory
+    """
+    if len(sys.argv) < 2:
+        print("Usage: python -m app.core.gtfs_ingest <gtfs.zip or directory>")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        _, _, stats = ingest_gtfs(sys.argv[1], work_dir)
+        print(format_stats(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,28 +9,91 @@ import matplotlib.pyplot as plt
 from google.transit import gtfs_realtime_pb2
 from google.protobuf.json_format import MessageToDict
 from datetime import datetime
+from app.core.feed_cache import feed_cache, file_cache_key
 
 
 def read_gtfs_rt_file(file_path):
     """
     Read a GTFS-RT protobuf file and return the parsed feed message
     
+    Parsed feeds are cached on the file path, mtime and size, so reading an
+    unchanged file returns the same (shared, read-only) feed message.
+    
     Args:
         file_path (str): Path to the GTFS-RT .pb file
         
     Returns:
         feed (gtfs_realtime_pb2.FeedMessage): Parsed GTFS-RT feed message
     """
-    feed = gtfs_realtime_pb2.FeedMessage()
     try:
+        key = file_cache_key(file_path)
+        feed = feed_cache.get(key)
+        if feed is not None:
+            return feed
+        
+        feed = gtfs_realtime_pb2.FeedMessage()
         with open(file_path, 'rb') as f:
             feed.ParseFromString(f.read())
+        feed_cache.put(key, feed, weight=key[2])
         return feed
     except Exception as e:
         print(f"Error reading file {file_path}: {e}")
         return None
 
 
+def parse_gtfs_rt_content(content):
+    """
+    Parse raw GTFS-RT protobuf bytes into a feed message
+    
+    Args:
+        content (bytes): Serialized GTFS-RT feed message
+        
+    Returns:
+        feed (gtfs_realtime_pb2.FeedMessage): Parsed GTFS-RT feed message
+    """
+    feed = gtfs_realtime_pb2.FeedMessage()
+    try:
+        feed.ParseFromString(content)
+        return feed
+    except Exception as e:
+        print(f"Error parsing GTFS-RT content: {e}")
+        return None
+
+
+def read_header_timestamp(content):
+    """
+    Read the header timestamp of serialized GTFS-RT content without parsing
+    the entities
+    
+    Args:
+        content (bytes): Serialized GTFS-RT feed message
+        
+    Returns:
+        int: Header timestamp, or None if it cannot be read cheaply
+    """
+    # The header is field 1 (length-delimited): tag byte 0x0A then a varint length
+    if not content or content[0] != 0x0A:
+        return None
+    
+    length = 0
+    shift = 0
+    position = 1
+    while position < len(content):
+        byte = content[position]
+        position += 1
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    
+    header = gtfs_realtime_pb2.FeedHeader()
+    try:
+        header.ParseFromString(content[position:position + length])
+    except Exception:
+        return None
+    return header.timestamp if header.HasField('timestamp') else None
+
+
 def convert_to_dict(feed):
     """
     Convert a GTFS-RT feed message to a Python dictionary
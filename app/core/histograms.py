@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+import numpy as np
+from app.core.columnar import VEHICLE_STATUS_NAMES
+from app.core.time_format import MISSING, get_agency_timezone
+
+# Number of delay bins when the client does not choose them
+DEFAULT_DELAY_BINS = 20
+
+# Largest number of bins a client can request
+MAX_BINS = 1000
+
+# Granularity of the local hour lookup: every UTC offset in use is a
+# multiple of a quarter of an hour
+HOUR_LOOKUP_SECONDS = 900
+
+
+def round_values(values, digits=1):
+    """
+    Convert a float array to a JSON list rounded to some digits, None for NaN
+    """
+    return [None if value != value else round(value, digits) for value in values.tolist()]
+
+
+def known_delays(columns):
+    """
+    Get the delays of the stop time updates whose delay is known
+
+    Args:
+        columns (TripUpdateColumns): Decoded stop time updates
+
+    Returns:
+        tuple: (bool mask of the known delays, float64 delays in minutes)
+    """
+    known = columns.delay_known
+    return known, columns.delay_seconds[known] / 60
+
+
+def delay_histogram(columns, bins=DEFAULT_DELAY_BINS, value_range=None):
+    """
+    Bin the delays of stop time updates
+
+    Args:
+        columns (TripUpdateColumns): Decoded stop time updates
+        bins: Number of equal-width bins, or an increasing array of bin edges in minutes
+        value_range (tuple): (min, max) in minutes of equal-width bins, the
+            data range if omitted
+
+    Returns:
+        dict: Bin edges and counts, with the number of delays outside the
+            edges and of unknown delays
+    """
+    known, delays = known_delays(columns)
+    if np.ndim(bins) == 0 and value_range is None and not len(delays):
+        value_range = (0, 1)
+    counts, edges = np.histogram(delays, bins=bins, range=value_range)
+    return {
+        'edges': round_values(edges.astype(np.float64), 3),
+        'counts': counts.tolist(),
+        'below': int(np.count_nonzero(delays < edges[0])),
+        'above': int(np.count_nonzero(delays > edges[-1])),
+        'unknown': int(len(known) - len(delays))
+    }
+
+
+def delay_by_route(columns):
+    """
+    Aggregate the delays of stop time updates per route
+
+    Args:
+        columns (TripUpdateColumns): Decoded stop time updates
+
+    Returns:
+        dict: count, average and max delay in minutes per route id, for the
+            routes having a known delay
+    """
+    known, delays = known_delays(columns)
+    codes = columns.route_codes[known]
+    size = len(columns.route_ids)
+    counts = np.bincount(codes, minlength=size)
+    sums = np.bincount(codes, weights=delays, minlength=size)
+    maxes = np.full(size, -np.inf)
+    np.maximum.at(maxes, codes, delays)
+
+    routes = {}
+    for code in np.flatnonzero(counts).tolist():
+        routes[columns.route_ids[code]] = {
+            'count': int(counts[code]),
+            'average': round(float(sums[code] / counts[code]), 1),
+            'max': round(float(maxes[code]), 1)
+        }
+    return routes
+
+
+def local_hours(times, timezone=None):
+    """
+    Get the local hour of day of epoch timestamps
+
+    Args:
+        times (numpy.ndarray): int64 epoch seconds
+        timezone (ZoneInfo): Timezone, the agency timezone (or server local time) if None
+
+    Returns:
+        numpy.ndarray: int64 hour of day (0-23)
+    """
+    timezone = timezone or get_agency_timezone()
+    # The hour is looked up once per distinct quarter of an hour
+    quarters, inverse = np.unique(times // HOUR_LOOKUP_SECONDS, return_inverse=True)
+    hours = np.array([datetime.fromtimestamp(quarter * HOUR_LOOKUP_SECONDS, timezone).hour
+                      for quarter in quarters.tolist()], dtype=np.int64)
+    return hours[inverse.ravel()]
+
+
+def delay_by_hour(columns, timezone=None):
+    """
+    Aggregate the delays of stop time updates per local hour of their
+    departure (or arrival when the departure is absent)
+
+    Args:
+        columns (TripUpdateColumns): Decoded stop time updates
+        timezone (ZoneInfo): Timezone of the hours, the agency timezone if None
+
+    Returns:
+        dict: count and average delay in minutes for each hour 0-23
+    """
+    times = np.where(columns.departure_times != MISSING, columns.departure_times, columns.arrival_times)
+    selected = columns.delay_known & (times != MISSING)
+    hours = local_hours(times[selected], timezone)
+    counts = np.bincount(hours, minlength=24)
+    sums = np.bincount(hours, weights=columns.delay_seconds[selected] / 60, minlength=24)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = sums / counts
+    return {
+        'hours': list(range(24)),
+        'counts': counts.tolist(),
+        'average': round_values(averages)
+    }
+
+
+def vehicle_status_counts(columns, positions=None):
+    """
+    Count vehicles per stop status
+
+    Args:
+        columns (VehiclePositionColumns): Decoded vehicle positions
+        positions (numpy.ndarray): Positions of the vehicles to count, all if None
+
+    Returns:
+        dict: Number of vehicles per status name ('UNKNOWN' when absent)
+    """
+    codes = columns.status_codes if positions is None else columns.status_codes[positions]
+    values, counts = np.unique(codes, return_counts=True)
+    statuses = {}
+    for code, count in zip(values.tolist(), counts.tolist()):
+        name = VEHICLE_STATUS_NAMES.get(code, 'UNKNOWN')
+        statuses[name] = statuses.get(name, 0) + count
+    return statuses
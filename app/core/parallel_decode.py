@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from google.transit import gtfs_realtime_pb2
+from app.utils.config_manager import load_config
+from app.core.columnar import concat_columns, decode_trip_updates, decode_vehicle_columns
+from app.core.feed_cache import prime_process
+
+# Decoding function of each feed type handed to the worker processes
+DECODERS = {
+    'trip_update': decode_trip_updates,
+    'vehicle_position': decode_vehicle_columns
+}
+
+# Serialized size above which a feed is split into entity ranges decoded in parallel
+SHARD_MIN_BYTES = 512 * 1024
+
+# Field number of the entities in a FeedMessage
+ENTITY_FIELD = 2
+
+# Start method of the worker processes: they are started while the server
+# threads run, and forking could copy a lock held by one of them into a worker
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def read_varint(content, position):
+    """
+    Read a protobuf varint
+
+    Args:
+        content (bytes): Serialized message
+        position (int): Offset of the varint
+
+    Returns:
+        tuple: (value, offset following the varint)
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = content[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def split_feed(content, shards):
+    """
+    Split a serialized FeedMessage into messages holding consecutive entity
+    ranges, without parsing the entities
+
+    Every shard keeps the header (and any other non-entity field), so each
+    one is a valid feed on its own, and the entities of the shards in order
+    are the entities of the feed.
+
+    Args:
+        content (bytes): Serialized FeedMessage
+        shards (int): Maximum number of shards
+
+    Returns:
+        list: Serialized FeedMessage of each shard
+    """
+    if shards <= 1:
+        return [content]
+
+    prefix = []
+    entity_starts = []
+    entity_ends = []
+    position = 0
+    try:
+        while position < len(content):
+            start = position
+            tag, position = read_varint(content, position)
+            wire_type = tag & 0x07
+            if wire_type == 0:
+                _, position = read_varint(content, position)
+            elif wire_type == 1:
+                position += 8
+            elif wire_type == 2:
+                length, position = read_varint(content, position)
+                position += length
+            elif wire_type == 5:
+                position += 4
+            else:
+                # Groups are not used by GTFS-RT, the feed is decoded in one piece
+                return [content]
+            if tag >> 3 == ENTITY_FIELD and wire_type == 2:
+                entity_starts.append(start)
+                entity_ends.append(position)
+            else:
+                prefix.append(content[start:position])
+    except IndexError:
+        return [content]
+    if position != len(content) or len(entity_starts) < 2:
+        return [content]
+
+    header = b''.join(prefix)
+    view = memoryview(content)
+    # Entities are contiguous unless other fields are interleaved between them
+    contiguous = entity_starts[1:] == entity_ends[:-1]
+    bounds = [len(entity_starts) * shard // shards for shard in range(shards + 1)]
+    parts = []
+    for first, last in zip(bounds, bounds[1:]):
+        if last == first:
+            continue
+        if contiguous:
+            entities = [view[entity_starts[first]:entity_ends[last - 1]]]
+        else:
+            entities = [view[entity_starts[index]:entity_ends[index]] for index in range(first, last)]
+        parts.append(b''.join([header] + entities))
+    return parts
+
+
+def decode_shard(feed_type, content):
+    """
+    Parse and decode a serialized feed (run in the worker processes)
+
+    Args:
+        feed_type (str): Type of feed, a key of DECODERS
+        content (bytes): Serialized FeedMessage
+
+    Returns:
+        Decoded columns, sent back to the parent as NumPy buffers
+    """
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    return DECODERS[feed_type](feed)
+
+
+class ParallelDecoder:
+    """
+    Decodes feeds in a pool of worker processes
+
+    Protobuf parsing and the per-entity decoding loops hold the GIL, so the
+    feeds of several sources and feed types decoded in threads share one
+    core. The decoder hands each feed, split into entity ranges when it is
+    large, to a ProcessPoolExecutor. The workers return typed columns (NumPy
+    arrays and id tables), which cross the process boundary as raw buffers
+    instead of lists of dicts.
+    """
+
+    def __init__(self, max_workers=None, shard_min_bytes=SHARD_MIN_BYTES):
+        """
+        Args:
+            max_workers (int): Number of worker processes, the CPU count if omitted
+            shard_min_bytes (int): Serialized size above which a feed is sharded
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shard_min_bytes = shard_min_bytes
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+
+    def submit(self, feed_type, content):
+        """
+        Start decoding a feed
+
+        Args:
+            feed_type (str): Type of feed, a key of DECODERS
+            content (bytes): Serialized FeedMessage
+
+        Returns:
+            list: Futures of the decoded shards, in entity order
+        """
+        shards = min(self.max_workers, len(content) // self.shard_min_bytes + 1)
+        return [self._executor.submit(decode_shard, feed_type, shard) for shard in split_feed(content, shards)]
+
+    def decode(self, feed_type, content):
+        """
+        Decode a feed in the worker processes
+
+        Args:
+            feed_type (str): Type of feed, a key of DECODERS
+            content (bytes): Serialized FeedMessage
+
+        Returns:
+            Decoded columns, the same as DECODERS[feed_type] on the parsed feed
+        """
+        return concat_columns([future.result() for future in self.submit(feed_type, content)])
+
+    def prime(self, feeds):
+        """
+        Decode feeds in parallel and store the columns in the rows cache, so
+        that cached_process(DECODERS[feed_type], feed) returns them
+
+        Args:
+            feeds (list): (feed_type, parsed feed, serialized content) tuples;
+                feed types without a decoder are ignored
+        """
+        pending = [
+            (feed_type, feed, self.submit(feed_type, content))
+            for feed_type, feed, content in feeds
+            if feed_type in DECODERS
+        ]
+        for feed_type, feed, futures in pending:
+            try:
+                columns = concat_columns([future.result() for future in futures])
+            except Exception as e:
+                # The feed is decoded in-process when it is first requested
+                print(f"Error decoding {feed_type} feed in worker process: {e}")
+                continue
+            prime_process(DECODERS[feed_type], feed, columns)
+
+    def shutdown(self):
+        """
+        Stop the worker processes
+        """
+        self._executor.shutdown()
+
+
+_decoder = None
+_decoder_lock = threading.Lock()
+
+
+def get_parallel_decoder():
+    """
+    Get the process-wide parallel decoder
+
+    The pool is enabled by setting 'decode_workers' in the configuration to
+    the number of worker processes.
+
+    Returns:
+        ParallelDecoder: Shared decoder, or None if decoding stays in-process
+    """
+    global _decoder
+    with _decoder_lock:
+        if _decoder is None:
+            workers = load_config().get('decode_workers', 0)
+            if not workers:
+                return None
+            _decoder = ParallelDecoder(workers)
+    return _decoder
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import json
+from app.core.feed_cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Maximum number of rendered responses kept in memory, and their total size
+RESPONSE_CACHE_ENTRIES = 64
+RESPONSE_CACHE_BYTES = 512 * 1024 * 1024
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class RenderedResponse:
+    """
+    JSON response body rendered once, with its pre-compressed variants
+
+    Attributes:
+        body (bytes): UTF-8 JSON body
+        etag (str): Strong entity tag of the body
+        encodings (dict): Compressed bodies keyed by content coding (gzip, br)
+    """
+
+    __slots__ = ('body', 'etag', 'encodings')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.encodings = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.encodings['gzip'] = gzip.compress(body, GZIP_LEVEL)
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+    @property
+    def size(self):
+        """
+        Total number of bytes held by the response and its variants
+        """
+        return len(self.body) + sum(len(data) for data in self.encodings.values())
+
+    def negotiate(self, accept_encoding):
+        """
+        Pick the best body for an Accept-Encoding header
+
+        Args:
+            accept_encoding (str): Value of the request's Accept-Encoding header
+
+        Returns:
+            tuple: (content coding or None, body bytes)
+        """
+        accepted = set()
+        for part in (accept_encoding or '').split(','):
+            coding, _, params = part.partition(';')
+            params = params.replace(' ', '')
+            if params.startswith('q='):
+                try:
+                    if float(params[2:]) == 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+
+        for coding in ('br', 'gzip'):
+            if coding in accepted and coding in self.encodings:
+                return coding, self.encodings[coding]
+        return None, self.body
+
+
+def _json_default(value):
+    # NumPy/pandas scalars expose their Python value through item()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+_cache = LRUCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_BYTES)
+
+
+def render_json(key, build_payload, store=True):
+    """
+    Get the rendered JSON response for a key, building it on first use
+
+    The key must identify the data the payload is built from (typically the
+    endpoint and the snapshot ids), so that a response is rendered only once
+    per feed snapshot.
+
+    Args:
+        key (tuple): Cache key
+        build_payload (callable): Function returning the payload to serialize
+        store (bool): Whether to keep the response in the cache; one-off
+            responses (e.g. arbitrary map areas) are rendered without
+            evicting the shared ones
+
+    Returns:
+        RenderedResponse: Rendered response
+    """
+    rendered = _cache.get(key)
+    if rendered is None:
+        body = json.dumps(build_payload(), separators=(',', ':'), default=_json_default).encode('utf-8')
+        rendered = RenderedResponse(body)
+        if store:
+            _cache.put(key, rendered, weight=rendered.size)
+    return rendered
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+import numpy as np
+
+# Edges of the delay histogram bins, in seconds (one minute wide from -30 to
+# +60 minutes); delays outside fall into the open first and last bins
+DELAY_BIN_EDGES = np.arange(-30, 61, dtype=np.int64) * 60
+
+# Number of histogram bins, including the two open ones
+DELAY_BINS = len(DELAY_BIN_EDGES) + 1
+
+# Rolling windows: (length, bucket width) in seconds. A window covers the
+# buckets started less than its length before the latest snapshot, so its
+# span is exact to one bucket width.
+WINDOWS = {
+    '5m': (300, 60),
+    '1h': (3600, 300),
+    '1d': (86400, 3600)
+}
+
+# Groups the statistics are kept for, with the column holding their codes
+# ('all' has a single key covering the whole network)
+GROUPS = {
+    'all': None,
+    'route': ('route_ids', 'route_codes'),
+    'stop': ('stop_ids', 'stop_codes')
+}
+
+# Quantiles estimated from the histograms, with their names in the summaries
+QUANTILES = (('median', 0.5), ('p90', 0.9), ('p95', 0.95))
+
+# Maximum of a key without observation
+NO_MAX = np.iinfo(np.int64).min
+
+
+class DelayAggregate:
+    """
+    Sparse aggregate of delay observations, per key
+
+    Attributes:
+        keys (numpy.ndarray): int64 unique key codes
+        counts (numpy.ndarray): int64 number of observations per key
+        sums (numpy.ndarray): int64 sum of the delays (seconds) per key
+        maxes (numpy.ndarray): int64 largest delay per key
+        cells (numpy.ndarray): int64 unique key * DELAY_BINS + bin
+        cell_counts (numpy.ndarray): int64 number of observations per cell
+    """
+
+    __slots__ = ('keys', 'counts', 'sums', 'maxes', 'cells', 'cell_counts')
+
+    def __init__(self, keys, counts, sums, maxes, cells, cell_counts):
+        self.keys = keys
+        self.counts = counts
+        self.sums = sums
+        self.maxes = maxes
+        self.cells = cells
+        self.cell_counts = cell_counts
+
+    @classmethod
+    def from_observations(cls, keys, delays, bins):
+        """
+        Aggregate observations
+
+        Args:
+            keys (numpy.ndarray): Key code of each observation
+            delays (numpy.ndarray): Delay of each observation in seconds
+            bins (numpy.ndarray): Histogram bin of each delay
+
+        Returns:
+            DelayAggregate: Aggregate of the observations
+        """
+        return cls._reduce(keys.astype(np.int64), np.ones(len(keys), dtype=np.int64),
+                           delays.astype(np.int64), delays.astype(np.int64),
+                           keys.astype(np.int64) * DELAY_BINS + bins, np.ones(len(keys), dtype=np.int64))
+
+    @classmethod
+    def _reduce(cls, keys, counts, sums, maxes, cells, cell_counts):
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        key_counts = np.zeros(len(unique_keys), dtype=np.int64)
+        key_sums = np.zeros(len(unique_keys), dtype=np.int64)
+        key_maxes = np.full(len(unique_keys), NO_MAX, dtype=np.int64)
+        np.add.at(key_counts, inverse, counts)
+        np.add.at(key_sums, inverse, sums)
+        np.maximum.at(key_maxes, inverse, maxes)
+
+        unique_cells, cell_inverse = np.unique(cells, return_inverse=True)
+        unique_cell_counts = np.zeros(len(unique_cells), dtype=np.int64)
+        np.add.at(unique_cell_counts, cell_inverse.ravel(), cell_counts)
+        return cls(unique_keys, key_counts, key_sums, key_maxes, unique_cells, unique_cell_counts)
+
+    def merge(self, other):
+        """
+        Combine with another aggregate
+
+        Returns:
+            DelayAggregate: Aggregate of the observations of both
+        """
+        return self._reduce(np.concatenate([self.keys, other.keys]),
+                            np.concatenate([self.counts, other.counts]),
+                            np.concatenate([self.sums, other.sums]),
+                            np.concatenate([self.maxes, other.maxes]),
+                            np.concatenate([self.cells, other.cells]),
+                            np.concatenate([self.cell_counts, other.cell_counts]))
+
+
+class RollingWindow:
+    """
+    Running totals of one group over a rolling window
+
+    The observations are added to dense per-key totals and kept, sparse, in
+    time buckets. When a bucket leaves the window its aggregate is
+    subtracted, so the totals always describe the window and reading them
+    never scans the observations.
+    """
+
+    __slots__ = ('length', 'bucket_seconds', 'buckets', 'snapshots', 'counts', 'sums', 'maxes', 'histograms')
+
+    def __init__(self, length, bucket_seconds):
+        """
+        Args:
+            length (int): Window length in seconds
+            bucket_seconds (int): Bucket width in seconds
+        """
+        self.length = length
+        self.bucket_seconds = bucket_seconds
+        # [bucket start, DelayAggregate, number of snapshots], oldest first
+        self.buckets = deque()
+        self.snapshots = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0, dtype=np.int64)
+        self.maxes = np.zeros(0, dtype=np.int64)
+        self.histograms = np.zeros((0, DELAY_BINS), dtype=np.int64)
+
+    def reserve(self, size):
+        """
+        Make room for the totals of a number of keys
+
+        Args:
+            size (int): Number of keys of the group
+        """
+        if size <= len(self.counts):
+            return
+        # Capacity doubles, so growing with new routes and stops is amortized
+        capacity = max(size, 2 * len(self.counts))
+        grow = capacity - len(self.counts)
+        self.counts = np.concatenate([self.counts, np.zeros(grow, dtype=np.int64)])
+        self.sums = np.concatenate([self.sums, np.zeros(grow, dtype=np.int64)])
+        self.maxes = np.concatenate([self.maxes, np.full(grow, NO_MAX, dtype=np.int64)])
+        self.histograms = np.concatenate([self.histograms, np.zeros((grow, DELAY_BINS), dtype=np.int64)])
+
+    def add(self, timestamp, aggregate, size):
+        """
+        Add the observations of a snapshot
+
+        Args:
+            timestamp (int): Epoch seconds of the snapshot
+            aggregate (DelayAggregate): Observations of the snapshot
+            size (int): Number of keys of the group
+        """
+        bucket_start = timestamp - timestamp % self.bucket_seconds
+        if self.buckets and bucket_start < self.buckets[-1][0]:
+            # A snapshot older than the latest one joins the latest bucket
+            bucket_start = self.buckets[-1][0]
+        self._expire(bucket_start)
+
+        self.reserve(size)
+        self.counts[aggregate.keys] += aggregate.counts
+        self.sums[aggregate.keys] += aggregate.sums
+        self.maxes[aggregate.keys] = np.maximum(self.maxes[aggregate.keys], aggregate.maxes)
+        self.histograms.reshape(-1)[aggregate.cells] += aggregate.cell_counts
+        self.snapshots += 1
+
+        if self.buckets and self.buckets[-1][0] == bucket_start:
+            bucket = self.buckets[-1]
+            bucket[1] = bucket[1].merge(aggregate)
+            bucket[2] += 1
+        else:
+            self.buckets.append([bucket_start, aggregate, 1])
+
+    def _expire(self, bucket_start):
+        expired = []
+        while self.buckets and self.buckets[0][0] <= bucket_start - self.length:
+            expired.append(self.buckets.popleft())
+        if not expired:
+            return
+
+        for _, aggregate, snapshots in expired:
+            self.counts[aggregate.keys] -= aggregate.counts
+            self.sums[aggregate.keys] -= aggregate.sums
+            self.histograms.reshape(-1)[aggregate.cells] -= aggregate.cell_counts
+            self.snapshots -= snapshots
+
+        # Maxima cannot be subtracted: those of the keys seen in the expired
+        # buckets are rebuilt from the remaining ones, once per bucket width
+        keys = np.unique(np.concatenate([aggregate.keys for _, aggregate, _ in expired]))
+        self.maxes[keys] = NO_MAX
+        for _, aggregate, _ in self.buckets:
+            np.maximum.at(self.maxes, aggregate.keys, aggregate.maxes)
+
+    def summarize(self, keys=None):
+        """
+        Describe the delays of keys over the window
+
+        Args:
+            keys (numpy.ndarray): Key codes to describe, all keys if None
+
+        Returns:
+            dict: count, average, quantiles and max arrays (delays in
+                minutes, NaN where a key has no observation)
+        """
+        if keys is None:
+            keys = np.arange(len(self.counts))
+        counts = self.counts[keys]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            summary = {
+                'count': counts,
+                'average': self.sums[keys] / counts / 60
+            }
+        maxes = np.where(counts > 0, self.maxes[keys], 0).astype(np.float64)
+        for name, quantile in QUANTILES:
+            summary[name] = np.minimum(histogram_quantiles(self.histograms[keys], counts, quantile), maxes) / 60
+        summary['max'] = np.where(counts > 0, maxes / 60, np.nan)
+        return summary
+
+
+def histogram_quantiles(histograms, counts, quantile):
+    """
+    Estimate a quantile from delay histograms, interpolating linearly inside
+    the bin holding it
+
+    Args:
+        histograms (numpy.ndarray): Observation count per bin, one row per key
+        counts (numpy.ndarray): Number of observations per key
+        quantile (float): Quantile between 0 and 1
+
+    Returns:
+        numpy.ndarray: float64 delay in seconds, NaN for keys without observation
+    """
+    if not len(counts):
+        return np.zeros(0, dtype=np.float64)
+    cumulative = np.cumsum(histograms, axis=1)
+    target = quantile * counts
+    bins = np.minimum((cumulative < target[:, None]).sum(axis=1), DELAY_BINS - 1)
+    rows = np.arange(len(counts))
+    # The open bins are reported at their finite edge
+    lower = DELAY_BIN_EDGES[np.clip(bins - 1, 0, len(DELAY_BIN_EDGES) - 1)]
+    upper = DELAY_BIN_EDGES[np.clip(bins, 0, len(DELAY_BIN_EDGES) - 1)]
+    before = cumulative[rows, bins] - histograms[rows, bins]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.clip((target - before) / histograms[rows, bins], 0, 1)
+        values = lower + fraction * (upper - lower)
+    return np.where(counts > 0, values, np.nan)
+
+
+def round_summary(summary, position):
+    """
+    Build the JSON summary of one key
+
+    Args:
+        summary (dict): Arrays returned by RollingWindow.summarize
+        position (int): Position of the key in the arrays
+
+    Returns:
+        dict: Count and delays in minutes rounded to one decimal (None without observation)
+    """
+    values = {'count': int(summary['count'][position])}
+    for name, array in summary.items():
+        if name != 'count':
+            value = float(array[position])
+            values[name] = None if np.isnan(value) else round(value, 1)
+    return values
+
+
+class RollingDelayStats:
+    """
+    Rolling delay statistics of a source, for the network, each route and
+    each stop
+
+    The trip updates of each new snapshot are aggregated once, vectorized,
+    and added to the running totals of every window (see RollingWindow), so
+    reading a window costs the same whatever the number of snapshots it
+    covers. Medians and percentiles are estimated from fixed one-minute
+    histograms. Only the stop time updates whose delay is known (from the
+    feed or the static schedule) are counted, and the windows end at the
+    latest snapshot timestamp.
+    """
+
+    def __init__(self, windows=None):
+        """
+        Args:
+            windows (dict): (length, bucket width) in seconds per window name, WINDOWS if omitted
+        """
+        self._window_specs = windows or WINDOWS
+        self._lock = threading.Lock()
+        # Incremented on each change, to key cached responses
+        self.version = 0
+        self.clear()
+
+    def clear(self):
+        """
+        Forget every observation, e.g. when the polled source changes
+        """
+        with self._lock:
+            self._ids = {group: ['all'] if group == 'all' else [] for group in GROUPS}
+            self._codes = {group: {'all': 0} if group == 'all' else {} for group in GROUPS}
+            self._windows = {
+                name: {group: RollingWindow(length, bucket_seconds) for group in GROUPS}
+                for name, (length, bucket_seconds) in self._window_specs.items()
+            }
+            # The network key is reported even before any observation
+            for windows in self._windows.values():
+                windows['all'].reserve(1)
+            self.last_timestamp = None
+            self.version += 1
+
+    def _global_codes(self, group, ids, codes):
+        table = self._codes[group]
+        mapping = np.empty(len(ids), dtype=np.int64)
+        for position, key in enumerate(ids):
+            code = table.get(key)
+            if code is None:
+                code = table[key] = len(self._ids[group])
+                self._ids[group].append(key)
+            mapping[position] = code
+        return mapping[codes] if len(mapping) else np.zeros(0, dtype=np.int64)
+
+    def add(self, timestamp, columns):
+        """
+        Add the stop time updates of a snapshot
+
+        Args:
+            timestamp (int): Epoch seconds of the snapshot
+            columns (TripUpdateColumns): Decoded stop time updates
+        """
+        known = columns.delay_known
+        delays = columns.delay_seconds[known].astype(np.int64)
+        bins = np.searchsorted(DELAY_BIN_EDGES, delays, side='right')
+        with self._lock:
+            for group, table in GROUPS.items():
+                if table is None:
+                    keys = np.zeros(len(delays), dtype=np.int64)
+                else:
+                    ids_name, codes_name = table
+                    keys = self._global_codes(group, getattr(columns, ids_name), getattr(columns, codes_name)[known])
+                aggregate = DelayAggregate.from_observations(keys, delays, bins)
+                for windows in self._windows.values():
+                    windows[group].add(timestamp, aggregate, len(self._ids[group]))
+            self.last_timestamp = timestamp if self.last_timestamp is None else max(self.last_timestamp, timestamp)
+            self.version += 1
+
+    def get_windows(self):
+        """
+        Get the names of the windows
+
+        Returns:
+            list: Window names, shortest first
+        """
+        return list(self._window_specs)
+
+    def get_summary(self, window):
+        """
+        Describe the delays of the whole network over a window
+
+        Args:
+            window (str): Window name
+
+        Returns:
+            dict: Snapshot and observation counts, average, quantiles and max in minutes
+        """
+        with self._lock:
+            rolling = self._windows[window]['all']
+            summary = round_summary(rolling.summarize(np.zeros(1, dtype=np.int64)), 0)
+            summary['snapshots'] = rolling.snapshots
+            return summary
+
+    def get_summaries(self):
+        """
+        Describe the delays of the whole network over every window
+
+        Returns:
+            dict: Summary returned by get_summary, per window name
+        """
+        return {window: self.get_summary(window) for window in self._window_specs}
+
+    def get_group(self, window, group):
+        """
+        Describe the delays of each route or stop over a window
+
+        Args:
+            window (str): Window name
+            group (str): 'route' or 'stop'
+
+        Returns:
+            dict: Summary per route or stop identifier, for those observed in the window
+        """
+        with self._lock:
+            rolling = self._windows[window][group]
+            ids = self._ids[group]
+            keys = np.flatnonzero(rolling.counts[:len(ids)] > 0)
+            summary = rolling.summarize(keys)
+            return {ids[key]: round_summary(summary, position) for position, key in enumerate(keys.tolist())}
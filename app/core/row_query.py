@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import numpy as np
+
+# Fields each feed type can be filtered on
+FILTER_FIELDS = {
+    'trip_update': ('route_id', 'trip_id', 'stop_id'),
+    'vehicle_position': ('route_id', 'trip_id', 'vehicle_id'),
+    'alert': ('route_id', 'trip_id', 'stop_id')
+}
+
+# Largest page a client can request
+MAX_PAGE_SIZE = 10000
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class RowIndex:
+    """
+    Hash indexes from field values to row positions of one snapshot
+
+    Attributes:
+        size (int): Number of indexed rows
+        positions (dict): field -> {value: sorted int64 array of row positions}
+    """
+
+    __slots__ = ('size', 'positions')
+
+    def __init__(self, size, positions):
+        self.size = size
+        self.positions = positions
+
+    def lookup(self, field, values):
+        """
+        Get the rows whose field has one of the values
+
+        Args:
+            field (str): Indexed field
+            values (tuple): Accepted values
+
+        Returns:
+            numpy.ndarray: Sorted int64 row positions
+        """
+        index = self.positions.get(field, {})
+        found = [index[value] for value in values if value in index]
+        if not found:
+            return _EMPTY
+        if len(found) == 1:
+            return found[0]
+        return np.unique(np.concatenate(found))
+
+
+def index_rows(rows, fields, entity_field=None):
+    """
+    Index a list of rows on some of their fields
+
+    Args:
+        rows (list): Rows (dicts)
+        fields (tuple): Fields to index
+        entity_field (str): Field holding a list of dicts whose values are
+            indexed too (e.g. the affected entities of alerts)
+
+    Returns:
+        RowIndex: Row index
+    """
+    lists = {field: {} for field in fields}
+    for position, row in enumerate(rows):
+        for field in fields:
+            values = {row[field]} if field in row else set()
+            if entity_field:
+                values.update(entity[field] for entity in row.get(entity_field, ()) if field in entity)
+            for value in values:
+                lists[field].setdefault(value, []).append(position)
+
+    positions = {
+        field: {value: np.array(rows_of_value, dtype=np.int64) for value, rows_of_value in values.items()}
+        for field, values in lists.items()
+    }
+    return RowIndex(len(rows), positions)
+
+
+def index_codes(codes, table):
+    """
+    Index an int32 code column (interned ids) without a Python pass per row
+
+    Args:
+        codes (numpy.ndarray): Code of each row
+        table (list): Value of each code
+
+    Returns:
+        dict: value -> sorted int64 array of row positions
+    """
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(table))
+    groups = np.split(order.astype(np.int64), np.cumsum(counts)[:-1]) if len(table) else []
+    return {value: group for value, group, count in zip(table, groups, counts) if count}
+
+
+def filter_positions(index, filters, mask=None):
+    """
+    Get the positions of the rows matching every filter
+
+    Args:
+        index (RowIndex): Row index
+        filters (dict): field -> tuple of accepted values (OR), fields are ANDed
+        mask (numpy.ndarray): Optional boolean mask the rows must also match
+
+    Returns:
+        numpy.ndarray: Sorted int64 row positions
+    """
+    positions = None
+    # Start from the most selective filter so intersections stay small
+    for matches in sorted((index.lookup(field, values) for field, values in filters.items()), key=len):
+        positions = matches if positions is None else np.intersect1d(positions, matches, assume_unique=True)
+        if not len(positions):
+            return _EMPTY
+    if positions is None:
+        positions = np.arange(index.size, dtype=np.int64) if mask is None else np.flatnonzero(mask)
+    elif mask is not None:
+        positions = positions[mask[positions]]
+    return positions
+
+
+def project_rows(rows, fields):
+    """
+    Keep only some fields of the rows
+
+    Args:
+        rows (list): Rows (dicts), not modified
+        fields (tuple): Fields to keep, all if None
+
+    Returns:
+        list: Projected rows
+    """
+    if not fields:
+        return rows
+    return [{field: row[field] for field in fields if field in row} for row in rows]
+
+
+def encode_cursor(snapshot_id, offset):
+    """
+    Build the opaque cursor of the next page
+
+    The cursor pins the snapshot, so pages stay consistent while new
+    snapshots are published.
+
+    Args:
+        snapshot_id (int): Snapshot being paginated
+        offset (int): Offset of the next page in the filtered result
+
+    Returns:
+        str: URL-safe cursor
+    """
+    return base64.urlsafe_b64encode(f"{snapshot_id}:{offset}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor built by encode_cursor
+
+    Args:
+        cursor (str): Cursor
+
+    Returns:
+        tuple: (snapshot_id, offset), or None if the cursor is malformed or negative
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        snapshot_id, offset = (int(part) for part in value.split(':'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    # A negative offset would slice the rows from the end
+    if snapshot_id < 0 or offset < 0:
+        return None
+    return snapshot_id, offset
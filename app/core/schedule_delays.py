@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from app.core.columnar import MISSING, TripUpdateColumns, decode_trip_updates
+from app.core.feed_cache import cached_process
+from app.core.static_gtfs import get_static_gtfs
+from app.core.time_format import get_agency_timezone
+
+# Service dates tried, relative to the feed date, for trips without a start date
+SERVICE_DAY_CANDIDATES = (-1, 0, 1)
+
+
+def get_service_day_start(service_date, timezone=None):
+    """
+    Get the origin of the GTFS times of a service date
+
+    GTFS times are measured from noon minus 12 hours, which is midnight
+    except on daylight saving time change days.
+
+    Args:
+        service_date (int): Date as YYYYMMDD
+        timezone (ZoneInfo): Agency timezone, server local time if None
+
+    Returns:
+        int: Epoch seconds of the time origin
+    """
+    noon = datetime(service_date // 10000, service_date // 100 % 100, service_date % 100, 12, tzinfo=timezone)
+    return int(noon.timestamp()) - 12 * 3600
+
+
+def get_day_starts(service_dates, timezone=None):
+    """
+    Get the time origins of an array of service dates, computed once per date
+
+    Args:
+        service_dates (numpy.ndarray): int32 dates as YYYYMMDD
+        timezone (ZoneInfo): Agency timezone
+
+    Returns:
+        numpy.ndarray: int64 epoch seconds
+    """
+    unique_dates, inverse = np.unique(service_dates, return_inverse=True)
+    starts = np.array([get_service_day_start(value, timezone) for value in unique_dates.tolist()], dtype=np.int64)
+    return starts[inverse.ravel()]
+
+
+def get_active_days(static_gtfs, static_trips, service_dates):
+    """
+    Check on which service dates the static trips run, once per service and date
+
+    Services absent from both calendar and calendar_dates are assumed to run
+    every day, the schedule not telling otherwise.
+
+    Args:
+        static_gtfs (StaticGTFS): Static model
+        static_trips (numpy.ndarray): int64 static trip rows
+        service_dates (list): Dates as YYYYMMDD
+
+    Returns:
+        numpy.ndarray: bool matrix, one row per trip and one column per date
+    """
+    service_ids = static_gtfs.trips.service_ids
+    service_codes, inverse = np.unique(static_gtfs.trips.service_codes[static_trips], return_inverse=True)
+    active = np.array([
+        [static_gtfs.is_service_active(service_ids[code], value) for value in service_dates]
+        if static_gtfs.has_service(service_ids[code]) else [True] * len(service_dates)
+        for code in service_codes.tolist()
+    ], dtype=bool).reshape(-1, len(service_dates))
+    return active[inverse.ravel()]
+
+
+def locate_stop_times(static_gtfs, static_trips, stop_sequences, stop_codes):
+    """
+    Find the scheduled stop_times row of realtime updates
+
+    Updates are matched on (trip, stop_sequence), or on (trip, stop) when
+    the sequence is absent or unknown to the schedule.
+
+    Args:
+        static_gtfs (StaticGTFS): Static model
+        static_trips (numpy.ndarray): int64 static trip row, MISSING if unknown
+        stop_sequences (numpy.ndarray): int32 stop sequences, MISSING if absent
+        stop_codes (numpy.ndarray): int64 static stop codes, MISSING if unknown
+
+    Returns:
+        numpy.ndarray: int64 stop_times row of each update, MISSING if not found
+    """
+    rows = np.full(len(static_trips), MISSING, dtype=np.int64)
+    if not len(static_gtfs.arrays['stop_time_sequences']):
+        return rows
+
+    keys = static_gtfs.get_sequence_keys()
+    candidates = np.flatnonzero((static_trips != MISSING) & (stop_sequences != MISSING))
+    if len(candidates):
+        wanted = (static_trips[candidates] << 32) + (stop_sequences[candidates].astype(np.int64) + 2 ** 31)
+        positions = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        found = keys[positions] == wanted
+        rows[candidates[found]] = positions[found]
+
+    stop_keys, stop_rows = static_gtfs.get_stop_keys()
+    candidates = np.flatnonzero((rows == MISSING) & (static_trips != MISSING) & (stop_codes != MISSING))
+    if len(candidates):
+        wanted = (static_trips[candidates] << 32) + (stop_codes[candidates] + 2 ** 31)
+        positions = np.minimum(np.searchsorted(stop_keys, wanted), len(stop_keys) - 1)
+        found = stop_keys[positions] == wanted
+        rows[candidates[found]] = stop_rows[positions[found]]
+
+    return rows
+
+
+def apply_schedule_delays(columns, static_gtfs, reference_time=None, timezone=None):
+    """
+    Compute the delays the producer left out from the scheduled stop times
+
+    For each update with an absolute time but no delay, the scheduled time
+    of the matching stop time is subtracted from it. Trips without a start
+    date are assigned a service day among the day before, of and after the
+    reference time on which their service runs, the smallest delay breaking
+    ties; their delay stays unknown if the service runs on none of them.
+
+    Args:
+        columns (TripUpdateColumns): Decoded trip updates
+        static_gtfs (StaticGTFS): Static model with stop times
+        reference_time (int): Epoch seconds of the feed, now if None
+        timezone (ZoneInfo): Agency timezone, server local time if None
+
+    Returns:
+        TripUpdateColumns: Updates with the computed delays marked as known
+    """
+    actual = np.where(columns.departure_times != MISSING, columns.departure_times, columns.arrival_times)
+    pending = np.flatnonzero(~columns.delay_known & (actual != MISSING))
+    if not len(pending):
+        return columns
+
+    trip_index = static_gtfs.trips.index
+    static_trip_table = np.array([trip_index.get(trip_id, MISSING) for trip_id in columns.trip_ids], dtype=np.int64)
+    static_stop_table = np.array([static_gtfs.get_stop_code(stop_id) for stop_id in columns.stop_ids], dtype=np.int64)
+    static_trips = static_trip_table[columns.trip_codes[pending]]
+    rows = locate_stop_times(
+        static_gtfs,
+        static_trips,
+        columns.stop_sequences[pending],
+        static_stop_table[columns.stop_codes[pending]]
+    )
+    matched = rows != MISSING
+    pending, rows, static_trips = pending[matched], rows[matched], static_trips[matched]
+
+    # Compare departures with departures and arrivals with arrivals when possible
+    scheduled_departures = static_gtfs.arrays['stop_time_departures'][rows].astype(np.int64)
+    scheduled_arrivals = static_gtfs.arrays['stop_time_arrivals'][rows].astype(np.int64)
+    uses_departure = columns.departure_times[pending] != MISSING
+    scheduled = np.where(uses_departure, scheduled_departures, scheduled_arrivals)
+    scheduled = np.where(scheduled == MISSING, np.where(uses_departure, scheduled_arrivals, scheduled_departures), scheduled)
+    has_schedule = scheduled != MISSING
+    pending, scheduled, static_trips = pending[has_schedule], scheduled[has_schedule], static_trips[has_schedule]
+    if not len(pending):
+        return columns
+    actual = actual[pending]
+
+    start_dates = columns.start_dates[pending]
+    delays = np.zeros(len(pending), dtype=np.int64)
+    found = np.ones(len(pending), dtype=bool)
+    dated = start_dates != MISSING
+    if dated.any():
+        delays[dated] = actual[dated] - get_day_starts(start_dates[dated], timezone) - scheduled[dated]
+    if not dated.all():
+        reference = datetime.fromtimestamp(reference_time or time.time(), timezone).date()
+        candidate_dates = [
+            int((reference + timedelta(days=offset)).strftime('%Y%m%d')) for offset in SERVICE_DAY_CANDIDATES
+        ]
+        candidates = np.array([get_service_day_start(value, timezone) for value in candidate_dates], dtype=np.int64)
+        active = get_active_days(static_gtfs, static_trips[~dated], candidate_dates)
+        options = actual[~dated, None] - candidates[None, :] - scheduled[~dated, None]
+        distances = np.where(active, np.abs(options), np.iinfo(np.int64).max)
+        delays[~dated] = options[np.arange(len(options)), distances.argmin(axis=1)]
+        found[~dated] = active.any(axis=1)
+    pending, delays = pending[found], delays[found]
+
+    delay_seconds = columns.delay_seconds.copy()
+    delay_known = columns.delay_known.copy()
+    delay_seconds[pending] = delays
+    delay_known[pending] = True
+
+    values = {name: getattr(columns, name) for name in TripUpdateColumns.COLUMNS}
+    values.update(delay_seconds=delay_seconds, delay_known=delay_known)
+    return TripUpdateColumns(columns.trip_ids, columns.route_ids, columns.stop_ids, **values)
+
+
+def decode_scheduled_trip_updates(feed):
+    """
+    Decode the stop time updates of a feed, completing the missing delays
+    from the static schedule
+
+    Args:
+        feed: GTFS-RT feed message
+
+    Returns:
+        TripUpdateColumns: Decoded stop time updates
+    """
+    # The raw columns may already have been decoded by a worker process
+    columns = cached_process(decode_trip_updates, feed)
+    if not len(columns):
+        return columns
+    reference_time = feed.header.timestamp if feed.header.HasField('timestamp') else None
+    return apply_schedule_delays(columns, get_static_gtfs(), reference_time, get_agency_timezone())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from app.core.feed_cache import LRUCache
+
+# Field identifying an entity in the processed rows of each feed type
+ENTITY_KEYS = {
+    'trip_update': 'trip_id',
+    'vehicle_position': 'vehicle_id',
+    'alert': 'id'
+}
+
+# Maximum number of per-snapshot entity indexes kept in memory
+INDEX_CACHE_ENTRIES = 32
+
+_index_cache = LRUCache(INDEX_CACHE_ENTRIES)
+
+
+def index_entities(feed_type, rows):
+    """
+    Group processed rows by entity
+
+    Trip updates have one row per stop time update, so a trip maps to the
+    list of its rows; vehicle positions and alerts map to a single row.
+
+    Args:
+        feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+        rows (list): Processed rows of the feed
+
+    Returns:
+        dict: Rows keyed by entity key
+    """
+    key_field = ENTITY_KEYS[feed_type]
+    index = {}
+    if feed_type == 'trip_update':
+        for row in rows or []:
+            index.setdefault(row[key_field], []).append(row)
+    else:
+        for row in rows or []:
+            index[row[key_field]] = row
+    return index
+
+
+def get_entity_index(snapshot, rows, variant=None):
+    """
+    Get the entity index of a snapshot, building it once
+
+    Args:
+        snapshot (FeedSnapshot): Snapshot the rows come from
+        rows (list): Processed rows of the snapshot
+        variant: Hashable value identifying how the rows were rendered
+            (e.g. the time format), if several renderings are indexed
+
+    Returns:
+        dict: Rows keyed by entity key
+    """
+    key = (snapshot.feed_type, snapshot.snapshot_id, variant)
+    index = _index_cache.get(key)
+    if index is None:
+        index = index_entities(snapshot.feed_type, rows)
+        _index_cache.put(key, index)
+    return index
+
+
+def diff_entities(old_index, new_index, keys=None):
+    """
+    Compute the entities added, changed and removed between two indexes
+
+    Args:
+        old_index (dict): Entity index of the client's snapshot
+        new_index (dict): Entity index of the latest snapshot
+        keys (set): Entity keys that may differ between the snapshots (e.g.
+            the trips whose content hash changed), all if None
+
+    Returns:
+        dict: 'added' and 'changed' entities keyed by entity key, and the
+            list of 'removed' entity keys
+    """
+    added = {}
+    changed = {}
+    if keys is None:
+        candidates = new_index
+    else:
+        candidates = [key for key in new_index if key in keys]
+    for key in candidates:
+        value = new_index[key]
+        if key not in old_index:
+            added[key] = value
+        elif old_index[key] != value:
+            changed[key] = value
+
+    removed = [key for key in (old_index if keys is None else keys) if key in old_index and key not in new_index]
+    return {
+        'added': added,
+        'changed': changed,
+        'removed': removed
+    }
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+import time
+from collections import deque
+
+# Number of past snapshots kept per feed type (for incremental diffs)
+HISTORY_SIZE = 10
+
+# Snapshot ids are unique across stores, so they can key process-wide caches
+_snapshot_ids = itertools.count(1)
+
+
+class FeedSnapshot:
+    """
+    Immutable view of one parsed GTFS-RT feed as published by the poller
+
+    Attributes:
+        snapshot_id (int): Monotonic identifier, unique within the process
+        feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+        feed (gtfs_realtime_pb2.FeedMessage): Parsed feed message
+        fetched_at (float): Epoch seconds at which the feed was published
+    """
+
+    __slots__ = ('snapshot_id', 'feed_type', 'feed', 'fetched_at')
+
+    def __init__(self, snapshot_id, feed_type, feed, fetched_at):
+        self.snapshot_id = snapshot_id
+        self.feed_type = feed_type
+        self.feed = feed
+        self.fetched_at = fetched_at
+
+    @property
+    def feed_timestamp(self):
+        """
+        Timestamp announced in the feed header, or None if absent
+        """
+        if self.feed is None or not self.feed.header.timestamp:
+            return None
+        return self.feed.header.timestamp
+
+
+class SnapshotStore:
+    """
+    Thread-safe in-memory store holding the latest snapshots of each feed type
+
+    The background poller is the only writer; API handlers only read, so a
+    request never waits on the upstream producer. The last few snapshots of
+    each type are kept so that clients can ask for the changes since theirs.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        """
+        Args:
+            history_size (int): Number of snapshots kept per feed type
+        """
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._published = threading.Condition(self._lock)
+        self._snapshots = {}
+
+    def publish(self, feed_type, feed):
+        """
+        Publish a freshly parsed feed as the latest snapshot of its type
+
+        Args:
+            feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+            feed (gtfs_realtime_pb2.FeedMessage): Parsed feed message
+
+        Returns:
+            FeedSnapshot: The published snapshot
+        """
+        with self._lock:
+            snapshot = FeedSnapshot(next(_snapshot_ids), feed_type, feed, time.time())
+            history = self._snapshots.setdefault(feed_type, deque(maxlen=self.history_size))
+            history.append(snapshot)
+            self._published.notify_all()
+        return snapshot
+
+    def wait_for_change(self, known_ids, timeout=None):
+        """
+        Block until a feed type has a snapshot other than the one a client knows
+
+        Args:
+            known_ids (dict): Snapshot id known by the client, keyed by feed type
+            timeout (float): Maximum number of seconds to wait
+
+        Returns:
+            list: Latest snapshots of the feed types that changed (empty on timeout)
+        """
+        def changed():
+            return [
+                history[-1]
+                for feed_type, history in self._snapshots.items()
+                if feed_type in known_ids and history and history[-1].snapshot_id != known_ids[feed_type]
+            ]
+
+        with self._published:
+            self._published.wait_for(changed, timeout)
+            return changed()
+
+    def get(self, feed_type):
+        """
+        Get the latest snapshot of a feed type
+
+        Args:
+            feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+
+        Returns:
+            FeedSnapshot: Latest snapshot, or None if nothing was published yet
+        """
+        with self._lock:
+            history = self._snapshots.get(feed_type)
+            return history[-1] if history else None
+
+    def get_by_id(self, feed_type, snapshot_id):
+        """
+        Get a past snapshot of a feed type, if it is still kept
+
+        Args:
+            feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+            snapshot_id (int): Id of the snapshot
+
+        Returns:
+            FeedSnapshot: The snapshot, or None if unknown or evicted
+        """
+        with self._lock:
+            for snapshot in self._snapshots.get(feed_type, ()):
+                if snapshot.snapshot_id == snapshot_id:
+                    return snapshot
+        return None
+
+    def get_feed(self, feed_type):
+        """
+        Get the latest parsed feed message of a feed type
+
+        Args:
+            feed_type (str): Type of feed (trip_update, vehicle_position, alert)
+
+        Returns:
+            feed: GTFS-RT feed message, or None if nothing was published yet
+        """
+        snapshot = self.get(feed_type)
+        return snapshot.feed if snapshot else None
+
+    def clear(self):
+        """
+        Drop every stored snapshot (used when the current source changes)
+        """
+        with self._lock:
+            self._snapshots.clear()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.config_manager import get_active_sources, get_current_source, get_source_id, is_valid_source_id
+from app.core.feed_fetcher import FeedFetcher, get_feed_fetcher
+from app.core.feed_poller import FILE_PATHS, GTFS_RT_DIR, FeedPoller, get_feed_poller
+from app.core.parallel_decode import get_parallel_decoder
+from app.core.feed_archive import get_feed_archive
+
+# Directory holding the feeds downloaded for each source, one subdirectory per source
+SOURCES_DIR = os.path.join(GTFS_RT_DIR, 'sources')
+
+# Number of sources polled at the same time
+MAX_SOURCE_WORKERS = 4
+
+# Longest sleep of the scheduler, so configuration changes are picked up
+SYNC_INTERVAL = 10
+
+
+def get_source_file_paths(source_id):
+    """
+    Get the paths the feeds of a source are saved to
+
+    Args:
+        source_id (str): Source identifier
+
+    Returns:
+        dict: File path per feed type
+    """
+    if not is_valid_source_id(source_id):
+        raise ValueError(f"Invalid source identifier: {source_id!r}")
+    return {
+        feed_type: os.path.join(SOURCES_DIR, source_id, os.path.basename(file_path))
+        for feed_type, file_path in FILE_PATHS.items()
+    }
+
+
+class SourcePollers:
+    """
+    Pollers of every active source, served at the same time
+
+    Each source has its own FeedPoller and SnapshotStore, polled at the
+    source's own interval. A single scheduler thread submits the sources
+    that are due to a worker pool, so a slow or unreachable source never
+    delays the others; a source still being polled is not submitted again.
+    The current source is served by the current-source poller, which polls
+    itself, so its feeds are not downloaded and processed twice.
+    """
+
+    def __init__(self, sources=None, max_workers=MAX_SOURCE_WORKERS, fetcher=None, decoder=None, archive=None,
+                 current_poller=None):
+        """
+        Args:
+            sources (dict): Sources keyed by identifier, the active configured ones if omitted
+            max_workers (int): Number of sources polled at the same time
+            fetcher (FeedFetcher): Fetcher shared by the sources (a dedicated one if omitted)
+            decoder (ParallelDecoder): Worker processes shared by the sources, if any
+            archive (FeedArchive): Archive recording the feeds of every source, if any
+            current_poller (FeedPoller): Poller of the configured current source, reused
+                for that source instead of a poller of its own, if any
+        """
+        self._sources = sources
+        self.decoder = decoder
+        self.archive = archive
+        self.fetcher = fetcher or FeedFetcher()
+        self.current_poller = current_poller
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gtfs-rt-source')
+        self._lock = threading.Lock()
+        self._pollers = {}
+        self._configs = {}
+        self._next_polls = {}
+        self._running = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def sync(self):
+        """
+        Create, replace or drop pollers to match the configured sources
+
+        Returns:
+            dict: FeedPoller keyed by source identifier
+        """
+        sources = self._sources if self._sources is not None else get_active_sources()
+        current_source_id = self.get_current_source_id()
+        with self._lock:
+            for source_id in list(self._pollers):
+                shared = self._pollers[source_id] is self.current_poller
+                if sources.get(source_id) != self._configs[source_id] or shared != (source_id == current_source_id):
+                    del self._pollers[source_id], self._configs[source_id]
+                    self._next_polls.pop(source_id, None)
+            for source_id, source in sources.items():
+                if source_id in self._pollers:
+                    continue
+                if source_id == current_source_id:
+                    self._pollers[source_id] = self.current_poller
+                else:
+                    file_paths = None if source.get('use_local_files', False) else get_source_file_paths(source_id)
+                    self._pollers[source_id] = FeedPoller(fetcher=self.fetcher, source=source, file_paths=file_paths,
+                                                          decoder=self.decoder, archive=self.archive)
+                self._configs[source_id] = source
+            return dict(self._pollers)
+
+    def get_current_source_id(self):
+        """
+        Get the identifier of the source served by the current-source poller
+
+        Returns:
+            str: Source identifier, or None without a current-source poller or current source
+        """
+        if self.current_poller is None:
+            return None
+        source = get_current_source()
+        return get_source_id(source) if source else None
+
+    def get(self, source_id):
+        """
+        Get the poller of a source
+
+        Args:
+            source_id (str): Source identifier
+
+        Returns:
+            FeedPoller: Poller of the source, or None if the source is unknown
+        """
+        with self._lock:
+            poller = self._pollers.get(source_id)
+        if poller is None:
+            # The source may have been added since the last synchronization
+            poller = self.sync().get(source_id)
+            self._wake_event.set()
+        return poller
+
+    def get_sources(self):
+        """
+        Get the polled sources
+
+        Returns:
+            dict: Source configuration keyed by source identifier
+        """
+        self.sync()
+        with self._lock:
+            return dict(self._configs)
+
+    def poll_due(self, now=None):
+        """
+        Submit the sources whose poll interval has elapsed to the worker pool
+
+        Args:
+            now (float): Monotonic time, the current time if None
+
+        Returns:
+            float: Seconds until the next source is due
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for source_id, poller in self._pollers.items():
+                if poller is self.current_poller:
+                    # Polled by its own thread
+                    continue
+                running = self._running.get(source_id)
+                if running is not None and not running.done():
+                    continue
+                if self._next_polls.get(source_id, now) <= now:
+                    self._running[source_id] = self._executor.submit(self._poll, source_id, poller)
+                    self._next_polls[source_id] = now + poller.get_interval(self._configs[source_id])
+            return min(self._next_polls.values(), default=now + SYNC_INTERVAL) - now
+
+    def refresh(self):
+        """
+        Poll every source immediately, in parallel
+
+        Returns:
+            dict: Success flag per feed type, keyed by source identifier
+        """
+        futures = {
+            source_id: self._executor.submit(poller.refresh)
+            for source_id, poller in self.sync().items()
+        }
+        return {source_id: future.result() for source_id, future in futures.items()}
+
+    def get_metrics(self):
+        """
+        Get the poll counters of each source
+
+        Returns:
+            dict: Counters returned by FeedPoller.get_metrics, keyed by source identifier
+        """
+        with self._lock:
+            pollers = dict(self._pollers)
+        return {source_id: poller.get_metrics() for source_id, poller in pollers.items()}
+
+    def _poll(self, source_id, poller):
+        try:
+            poller.refresh()
+        except Exception as e:
+            print(f"Error polling GTFS-RT feeds of {source_id}: {e}")
+
+    def start(self):
+        """
+        Start the scheduler thread if it is not running yet
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='gtfs-rt-sources', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the scheduler thread, letting the running polls finish
+
+        Args:
+            timeout (float): Seconds to wait for the thread to exit
+        """
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sync()
+                delay = self.poll_due()
+            except Exception as e:
+                print(f"Error scheduling GTFS-RT sources: {e}")
+                delay = SYNC_INTERVAL
+
+            self._wake_event.wait(min(max(delay, 0), SYNC_INTERVAL))
+            self._wake_event.clear()
+
+
+_source_pollers = None
+_source_pollers_lock = threading.Lock()
+
+
+def get_source_pollers():
+    """
+    Get the process-wide pollers of all sources, starting them on first use
+
+    Returns:
+        SourcePollers: Running source pollers
+    """
+    global _source_pollers
+    with _source_pollers_lock:
+        if _source_pollers is None:
+            _source_pollers = SourcePollers(fetcher=get_feed_fetcher(), decoder=get_parallel_decoder(),
+                                            archive=get_feed_archive(), current_poller=get_feed_poller())
+            _source_pollers.start()
+    return _source_pollers
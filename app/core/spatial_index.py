@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# Size of the grid cells in degrees (about 1 km of latitude)
+CELL_SIZE_DEGREES = 0.01
+
+# Mean Earth radius used for distances, in meters
+EARTH_RADIUS_M = 6371008.8
+
+# Above this number of cells, a query scans every point instead of the cells
+MAX_QUERY_CELLS = 4096
+
+
+def haversine_m(latitude, longitude, latitudes, longitudes):
+    """
+    Compute great-circle distances from one point to many
+
+    Args:
+        latitude (float): Latitude of the origin in degrees
+        longitude (float): Longitude of the origin in degrees
+        latitudes (numpy.ndarray): Latitudes in degrees
+        longitudes (numpy.ndarray): Longitudes in degrees
+
+    Returns:
+        numpy.ndarray: Distances in meters
+    """
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(latitudes)
+    half_dlat = (lat2 - lat1) / 2
+    half_dlon = np.radians(longitudes - longitude) / 2
+    a = np.sin(half_dlat) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(half_dlon) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over a set of points
+
+    Points are sorted by cell, so the points of a cell are a contiguous
+    slice of 'order'. Queries visit only the cells overlapping the searched
+    area and then filter the candidates exactly.
+
+    Attributes:
+        latitudes (numpy.ndarray): float64 latitudes of the indexed points
+        longitudes (numpy.ndarray): float64 longitudes of the indexed points
+    """
+
+    __slots__ = ('latitudes', 'longitudes', 'cell_size', 'order', 'cell_keys', 'cell_starts', 'cell_ends')
+
+    def __init__(self, latitudes, longitudes, cell_size=CELL_SIZE_DEGREES):
+        """
+        Args:
+            latitudes (array-like): Latitudes in degrees, NaN/None for unknown positions
+            longitudes (array-like): Longitudes in degrees, NaN/None for unknown positions
+            cell_size (float): Size of the grid cells in degrees
+        """
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.cell_size = cell_size
+
+        valid = np.flatnonzero(~(np.isnan(self.latitudes) | np.isnan(self.longitudes)))
+        keys = self._cell_keys(self.latitudes[valid], self.longitudes[valid])
+        sort = np.argsort(keys, kind='stable')
+        self.order = valid[sort]
+        sorted_keys = keys[sort]
+        self.cell_keys, self.cell_starts = np.unique(sorted_keys, return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], len(sorted_keys))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _cells(self, values):
+        return np.floor(np.asarray(values, dtype=np.float64) / self.cell_size).astype(np.int64)
+
+    def _cell_keys(self, latitudes, longitudes):
+        return (self._cells(latitudes) << 32) + (self._cells(longitudes) + 2 ** 31)
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Get the points of the cells overlapping a box
+        """
+        lat_cells = np.arange(self._cells(min_lat), self._cells(max_lat) + 1)
+        lon_cells = np.arange(self._cells(min_lon), self._cells(max_lon) + 1)
+        if len(lat_cells) * len(lon_cells) > min(MAX_QUERY_CELLS, len(self.cell_keys)):
+            return self.order
+
+        wanted = ((lat_cells[:, None] << 32) + (lon_cells[None, :] + 2 ** 31)).ravel()
+        positions = np.searchsorted(self.cell_keys, wanted)
+        present = positions < len(self.cell_keys)
+        positions, wanted = positions[present], wanted[present]
+        positions = positions[self.cell_keys[positions] == wanted]
+        if not len(positions):
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.order[start:end] for start, end in
+                               zip(self.cell_starts[positions], self.cell_ends[positions])])
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Find the points inside a bounding box
+
+        Args:
+            min_lat (float): South edge
+            min_lon (float): West edge
+            max_lat (float): North edge
+            max_lon (float): East edge
+
+        Returns:
+            numpy.ndarray: Indices of the points, in ascending order
+        """
+        candidates = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        latitudes = self.latitudes[candidates]
+        longitudes = self.longitudes[candidates]
+        inside = (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+        return np.sort(candidates[inside])
+
+    def within_radius(self, latitude, longitude, radius_m):
+        """
+        Find the points within a distance of a location
+
+        Args:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            radius_m (float): Radius in meters
+
+        Returns:
+            tuple: (indices, distances in meters), nearest first
+        """
+        lat_delta = np.degrees(radius_m / EARTH_RADIUS_M)
+        # Longitude degrees shrink with the cosine of the latitude
+        lon_delta = lat_delta / max(np.cos(np.radians(min(abs(latitude) + lat_delta, 89.9))), 1e-6)
+        candidates = self._candidates(latitude - lat_delta, longitude - lon_delta,
+                                      latitude + lat_delta, longitude + lon_delta)
+        distances = haversine_m(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])
+        inside = distances <= radius_m
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
+
+    def nearest(self, latitude, longitude, k, radius_m=None):
+        """
+        Find the k points nearest to a location
+
+        The search radius starts at one cell and doubles until k points are
+        found, so only the cells around the location are visited.
+
+        Args:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            k (int): Maximum number of points
+            radius_m (float): Maximum distance in meters, unbounded if None
+
+        Returns:
+            tuple: (indices, distances in meters), nearest first
+        """
+        if radius_m is not None:
+            indices, distances = self.within_radius(latitude, longitude, radius_m)
+            return indices[:k], distances[:k]
+
+        radius = self.cell_size * np.pi / 180 * EARTH_RADIUS_M
+        while True:
+            indices, distances = self.within_radius(latitude, longitude, radius)
+            if len(indices) >= k or len(indices) == len(self.order) or radius > np.pi * EARTH_RADIUS_M:
+                return indices[:k], distances[:k]
+            radius *= 2
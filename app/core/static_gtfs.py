@@ -0,0 +1,600 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from app.core.array_cache import load_array_cache, write_array_cache
+from app.core.gtfs_ingest import MISSING, format_stats, ingest_gtfs, stop_time_keys
+from app.core.spatial_index import GridIndex
+
+# Static GTFS directory
+GTFS_DIR = 'data/gtfs'
+
+# GTFS zip which, when present in the static GTFS directory, is read instead of the CSV files
+GTFS_ZIP_NAME = 'gtfs.zip'
+
+# Static GTFS tables loaded by StaticGTFS
+GTFS_TABLES = ['routes', 'trips', 'stops', 'calendar', 'calendar_dates', 'stop_times']
+
+# Files watched for changes and hashed to identify the binary cache
+GTFS_FILES = [f"{table}.{extension}" for table in GTFS_TABLES for extension in ('txt', 'csv')] + [GTFS_ZIP_NAME]
+
+# Minimum seconds between two checks of the static files for changes
+CHANGE_CHECK_INTERVAL = 5
+
+# Directory, inside the static GTFS directory, holding the binary caches
+CACHE_DIR_NAME = '.cache'
+
+# Version of the binary cache layout, bumped whenever the arrays change
+CACHE_VERSION = 3
+
+# Identifiers of the loaded models, unique within the process
+_load_ids = itertools.count(1)
+
+
+class Route:
+    """
+    Route of the static GTFS
+    """
+
+    __slots__ = ('route_id', 'agency_id', 'short_name', 'long_name', 'route_type', 'color', 'text_color')
+
+    def __init__(self, route_id, agency_id, short_name, long_name, route_type, color, text_color):
+        self.route_id = route_id
+        self.agency_id = agency_id
+        self.short_name = short_name
+        self.long_name = long_name
+        self.route_type = route_type
+        self.color = color
+        self.text_color = text_color
+
+
+class Trip:
+    """
+    Trip of the static GTFS, referencing its route
+    """
+
+    __slots__ = ('trip_id', 'route', 'service_id', 'headsign', 'direction_id')
+
+    def __init__(self, trip_id, route, service_id, headsign, direction_id):
+        self.trip_id = trip_id
+        self.route = route
+        self.service_id = service_id
+        self.headsign = headsign
+        self.direction_id = direction_id
+
+
+class Stop:
+    """
+    Stop (or station) of the static GTFS
+    """
+
+    __slots__ = ('stop_id', 'code', 'name', 'latitude', 'longitude', 'location_type', 'parent_station')
+
+    def __init__(self, stop_id, code, name, latitude, longitude, location_type, parent_station):
+        self.stop_id = stop_id
+        self.code = code
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.location_type = location_type
+        self.parent_station = parent_station
+
+
+class TripTable:
+    """
+    Read-only mapping of trip_id to Trip backed by typed arrays
+
+    Only the trip_id index is a dict; Trip objects are built on access from
+    the (possibly memory-mapped) columns.
+    """
+
+    __slots__ = ('index', 'routes', 'service_ids', 'headsigns', 'route_codes',
+                 'service_codes', 'headsign_codes', 'directions')
+
+    def __init__(self, trip_ids, routes, service_ids, headsigns, route_codes, service_codes,
+                 headsign_codes, directions):
+        self.index = {trip_id: row for row, trip_id in enumerate(trip_ids)}
+        self.routes = routes
+        self.service_ids = service_ids
+        self.headsigns = headsigns
+        self.route_codes = route_codes
+        self.service_codes = service_codes
+        self.headsign_codes = headsign_codes
+        self.directions = directions
+
+    def get(self, trip_id, default=None):
+        row = self.index.get(trip_id)
+        if row is None:
+            return default
+        direction = int(self.directions[row])
+        return Trip(
+            trip_id,
+            self.routes[self.route_codes[row]],
+            self.service_ids[self.service_codes[row]],
+            self.headsigns[self.headsign_codes[row]],
+            None if direction == MISSING else direction
+        )
+
+    def __getitem__(self, trip_id):
+        trip = self.get(trip_id)
+        if trip is None:
+            raise KeyError(trip_id)
+        return trip
+
+    def __contains__(self, trip_id):
+        return trip_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class StaticGTFS:
+    """
+    Static GTFS tables indexed by id
+
+    The model is built from typed arrays and string tables, so it can be
+    loaded from the memory-mapped binary cache as well as from the CSV files.
+    Stop times are kept as columns grouped by trip: the rows of the trip
+    with code i are stop_time_trip_offsets[i]:stop_time_trip_offsets[i + 1].
+
+    Attributes:
+        load_id (int): Identifier of this load, unique within the process
+        routes (dict): route_id -> Route
+        trips (TripTable): trip_id -> Trip
+        stops (dict): stop_id -> Stop
+        service_dates (dict): service_id -> sorted array of dates added by calendar_dates (YYYYMMDD)
+        service_removed_dates (dict): service_id -> sorted array of dates removed by calendar_dates
+        service_calendars (dict): service_id -> (weekday mask, start_date, end_date) from calendar,
+            bit i of the mask for datetime.weekday() i
+    """
+
+    def __init__(self, gtfs_dir=GTFS_DIR, arrays=None, strings=None):
+        """
+        Load the static tables of a GTFS directory
+
+        Args:
+            gtfs_dir (str): Directory holding the static GTFS CSV files or zip
+            arrays (dict): Prebuilt arrays (e.g. from the binary cache), the
+                static files are parsed if None
+            strings (dict): Prebuilt string tables matching the arrays
+        """
+        self.gtfs_dir = gtfs_dir
+        self.load_id = next(_load_ids)
+        if arrays is None:
+            arrays, strings = self.parse_files(gtfs_dir)
+        self.arrays = arrays
+        self.strings = strings
+
+        self.routes = {}
+        route_list = []
+        for code, route_id in enumerate(strings['route_ids']):
+            route_type = int(arrays['route_types'][code])
+            route = Route(
+                route_id, strings['agency_id'][code], strings['route_short_name'][code],
+                strings['route_long_name'][code], None if route_type == MISSING else route_type,
+                strings['route_color'][code], strings['route_text_color'][code]
+            )
+            self.routes[route_id] = route
+            route_list.append(route)
+
+        self.trips = TripTable(
+            strings['trip_ids'], route_list, strings['service_ids'], strings['headsigns'],
+            arrays['trip_route_codes'], arrays['trip_service_codes'],
+            arrays['trip_headsign_codes'], arrays['trip_directions']
+        )
+
+        self.stops = {}
+        coordinates = arrays['stop_coordinates'].tolist()
+        for row, stop_id in enumerate(strings['stop_id']):
+            latitude, longitude = coordinates[row]
+            self.stops[stop_id] = Stop(
+                stop_id, strings['stop_code'][row], strings['stop_name'][row],
+                None if latitude != latitude else latitude,
+                None if longitude != longitude else longitude,
+                int(arrays['stop_location_types'][row]), strings['parent_station'][row]
+            )
+
+        # Search indexes of the stops and stop times, built on first use
+        self._stop_index = None
+        self._stop_codes = None
+        self._sequence_keys = None
+        self._stop_keys = None
+
+        self.service_dates = split_service_dates(
+            strings['service_ids'], arrays['service_offsets'], arrays['service_dates']
+        )
+        self.service_removed_dates = split_service_dates(
+            strings['service_ids'], arrays['service_removed_offsets'], arrays['service_removed_dates']
+        )
+        self.service_calendars = {
+            service_id: (int(weekdays), int(start_date), int(end_date))
+            for service_id, weekdays, start_date, end_date in zip(
+                strings['service_ids'], arrays['service_weekdays'].tolist(),
+                arrays['service_start_dates'].tolist(), arrays['service_end_dates'].tolist()
+            )
+            if start_date != MISSING
+        }
+
+    @staticmethod
+    def parse_files(gtfs_dir):
+        """
+        Parse the static GTFS files of a directory into in-memory arrays
+
+        Args:
+            gtfs_dir (str): Static GTFS directory
+
+        Returns:
+            tuple: (arrays dict, strings dict)
+        """
+        with tempfile.TemporaryDirectory() as work_dir:
+            arrays, strings, _ = ingest_gtfs(get_source_path(gtfs_dir), work_dir)
+            # Copy the stop_times columns out of the work files before they are removed
+            return {name: np.array(values) for name, values in arrays.items()}, strings
+
+    def get_stop_times(self, trip_id):
+        """
+        Get the scheduled stop times of a trip
+
+        Args:
+            trip_id (str): Trip id
+
+        Returns:
+            dict: int32 'stop_sequences', 'stop_codes' (index into the stop
+                table), 'arrivals' and 'departures' (seconds after midnight
+                of the service day, MISSING if absent), or None if unknown
+        """
+        row = self.trips.index.get(trip_id)
+        if row is None:
+            return None
+        offsets = self.arrays['stop_time_trip_offsets']
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        return {
+            'stop_sequences': self.arrays['stop_time_sequences'][start:end],
+            'stop_codes': self.arrays['stop_time_stop_codes'][start:end],
+            'arrivals': self.arrays['stop_time_arrivals'][start:end],
+            'departures': self.arrays['stop_time_departures'][start:end]
+        }
+
+    def get_stop_code(self, stop_id):
+        """
+        Get the index of a stop in the stop table
+
+        Args:
+            stop_id (str): Stop id
+
+        Returns:
+            int: Stop code, MISSING if unknown
+        """
+        if self._stop_codes is None:
+            self._stop_codes = {stop_id: code for code, stop_id in enumerate(self.strings['stop_id'])}
+        return self._stop_codes.get(stop_id, MISSING)
+
+    def get_stop_index(self):
+        """
+        Get the spatial index of the stops
+
+        Returns:
+            GridIndex: Index whose point i is the stop with code i
+        """
+        if self._stop_index is None:
+            coordinates = self.arrays['stop_coordinates']
+            self._stop_index = GridIndex(coordinates[:, 0], coordinates[:, 1])
+        return self._stop_index
+
+    def _get_stop_time_trip_codes(self):
+        offsets = self.arrays['stop_time_trip_offsets']
+        return np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+
+    def get_sequence_keys(self):
+        """
+        Get the sorted (trip, stop_sequence) keys of the stop times
+
+        Position i of the keys is row i of the stop_times columns, so
+        numpy.searchsorted on the keys locates the scheduled stop times of
+        many realtime updates at once.
+
+        Returns:
+            numpy.ndarray: Ascending int64 keys (see gtfs_ingest.stop_time_keys)
+        """
+        if self._sequence_keys is None:
+            self._sequence_keys = stop_time_keys(self._get_stop_time_trip_codes(),
+                                                 self.arrays['stop_time_sequences'])
+        return self._sequence_keys
+
+    def get_stop_keys(self):
+        """
+        Get the sorted (trip, stop code) keys of the stop times
+
+        Returns:
+            tuple: (ascending int64 keys, int64 stop_times row of each key)
+        """
+        if self._stop_keys is None:
+            keys = stop_time_keys(self._get_stop_time_trip_codes(), self.arrays['stop_time_stop_codes'])
+            order = np.argsort(keys, kind='stable')
+            self._stop_keys = (keys[order], order)
+        return self._stop_keys
+
+    def get_route(self, route_id, trip_id=None):
+        """
+        Get the route of a realtime entity, resolving it from the trip if needed
+
+        Args:
+            route_id (str): Route id of the entity, possibly 'Unknown'
+            trip_id (str): Trip id of the entity
+
+        Returns:
+            Route: Route, or None if unknown
+        """
+        route = self.routes.get(route_id)
+        if route is None and trip_id is not None:
+            trip = self.trips.get(trip_id)
+            route = trip.route if trip else None
+        return route
+
+    def has_service(self, service_id):
+        """
+        Check whether calendar or calendar_dates describe a service at all
+        """
+        return (service_id in self.service_calendars or service_id in self.service_dates
+                or service_id in self.service_removed_dates)
+
+    def is_service_active(self, service_id, date):
+        """
+        Check whether a service runs on a date
+
+        The calendar_dates exceptions take precedence over the weekly
+        calendar: an added date is active and a removed one is not.
+
+        Args:
+            service_id (str): Service id
+            date (int): Date as YYYYMMDD
+
+        Returns:
+            bool: True if the service runs on that date
+        """
+        if contains_date(self.service_dates.get(service_id), date):
+            return True
+        if contains_date(self.service_removed_dates.get(service_id), date):
+            return False
+        calendar = self.service_calendars.get(service_id)
+        if calendar is None:
+            return False
+        weekdays, start_date, end_date = calendar
+        if not start_date <= date <= end_date:
+            return False
+        weekday = datetime.date(date // 10000, date // 100 % 100, date % 100).weekday()
+        return bool(weekdays >> weekday & 1)
+
+    def get_counts(self):
+        """
+        Get the number of loaded entries per table
+
+        Returns:
+            dict: Counts of routes, trips, stops, services and stop times
+        """
+        return {
+            'routes': len(self.routes),
+            'trips': len(self.trips),
+            'stops': len(self.stops),
+            'services': sum(1 for service_id in self.strings['service_ids'] if self.has_service(service_id)),
+            'stop_times': len(self.arrays['stop_time_sequences'])
+        }
+
+
+def split_service_dates(service_ids, offsets, dates):
+    """
+    Split the concatenated dates of the services into one sorted array per service
+
+    Returns:
+        dict: service_id -> dates, for the services having any
+    """
+    return {
+        service_id: dates[offsets[code]:offsets[code + 1]]
+        for code, service_id in enumerate(service_ids)
+        if offsets[code + 1] > offsets[code]
+    }
+
+
+def contains_date(dates, date):
+    """
+    Check whether a sorted array of dates (or None) holds a date
+    """
+    if dates is None:
+        return False
+    index = int(np.searchsorted(dates, date))
+    return index < len(dates) and dates[index] == date
+
+
+def get_source_path(gtfs_dir=GTFS_DIR):
+    """
+    Get the static GTFS source of a directory: its GTFS zip if there is one,
+    the directory of CSV files otherwise
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+
+    Returns:
+        str: Path to the zip file or to the directory
+    """
+    zip_path = os.path.join(gtfs_dir, GTFS_ZIP_NAME)
+    return zip_path if os.path.isfile(zip_path) else gtfs_dir
+
+
+def get_files_signature(gtfs_dir=GTFS_DIR):
+    """
+    Build a signature of the static files that changes whenever one is rewritten
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+
+    Returns:
+        tuple: (file name, mtime in nanoseconds, size) per file, None if missing
+    """
+    signature = []
+    for file_name in GTFS_FILES:
+        try:
+            stat = os.stat(os.path.join(gtfs_dir, file_name))
+            signature.append((file_name, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((file_name, None, None))
+    return tuple(signature)
+
+
+def hash_files(gtfs_dir=GTFS_DIR):
+    """
+    Hash the content of the static files, identifying their binary cache
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+
+    Returns:
+        str: Hex digest covering the name and content of every static file
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(CACHE_VERSION).encode())
+    for file_name in GTFS_FILES:
+        digest.update(file_name.encode())
+        file_path = os.path.join(gtfs_dir, file_name)
+        if not os.path.exists(file_path):
+            digest.update(b'\0missing')
+            continue
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cache_dir(gtfs_dir, source_hash):
+    """
+    Get the binary cache directory of a version of the static files
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+        source_hash (str): Hash of the static files (see hash_files)
+
+    Returns:
+        str: Cache directory path
+    """
+    return os.path.join(gtfs_dir, CACHE_DIR_NAME, f"v{CACHE_VERSION}-{source_hash}")
+
+
+def remove_stale_caches(gtfs_dir, keep_dir):
+    """
+    Remove the binary caches of previous versions of the static files
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+        keep_dir (str): Cache directory to keep
+    """
+    root = os.path.join(gtfs_dir, CACHE_DIR_NAME)
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if path != keep_dir and not name.startswith('.tmp-'):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_static_gtfs(gtfs_dir=GTFS_DIR, use_cache=True):
+    """
+    Load the static GTFS, memory-mapping its binary cache when one matches
+    the current files and ingesting the files into it otherwise
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+        use_cache (bool): Whether to read and write the binary cache
+
+    Returns:
+        StaticGTFS: Indexed static GTFS
+    """
+    if not use_cache:
+        return StaticGTFS(gtfs_dir)
+
+    cache_dir = get_cache_dir(gtfs_dir, hash_files(gtfs_dir))
+    cached = load_array_cache(cache_dir)
+    if cached is not None:
+        arrays, strings, _ = cached
+        return StaticGTFS(gtfs_dir, arrays, strings)
+
+    # Stop times are streamed to work files next to the cache, then copied into it
+    cache_root = os.path.dirname(cache_dir)
+    os.makedirs(cache_root, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_root)
+    try:
+        arrays, strings, stats = ingest_gtfs(get_source_path(gtfs_dir), work_dir)
+        print(f"Static GTFS ingested from {get_source_path(gtfs_dir)}: {format_stats(stats)}")
+        try:
+            write_array_cache(cache_dir, arrays, strings, {'files': GTFS_FILES, 'ingest': stats})
+            remove_stale_caches(gtfs_dir, cache_dir)
+            cached = load_array_cache(cache_dir)
+        except OSError as e:
+            print(f"Error writing static GTFS cache to {cache_dir}: {e}")
+        if cached is None:
+            arrays = {name: np.array(values) for name, values in arrays.items()}
+        else:
+            arrays, strings, _ = cached
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return StaticGTFS(gtfs_dir, arrays, strings)
+
+
+_static_lock = threading.Lock()
+_static_gtfs = {}
+_load_locks = {}
+
+
+def get_static_gtfs(gtfs_dir=GTFS_DIR):
+    """
+    Get the static GTFS model, loading it on first use and whenever the
+    static files change
+
+    A reload runs outside the lock guarding the models, in one thread:
+    the other callers keep getting the previous model until it is done.
+    Only the first load of a directory is waited for.
+
+    Args:
+        gtfs_dir (str): Static GTFS directory
+
+    Returns:
+        StaticGTFS: Indexed static GTFS
+    """
+    with _static_lock:
+        entry = _static_gtfs.get(gtfs_dir)
+        now = time.monotonic()
+        if entry is not None:
+            if now - entry['checked_at'] < CHANGE_CHECK_INTERVAL:
+                return entry['model']
+            # The other callers skip the check until this one is done
+            entry['checked_at'] = now
+        load_lock = _load_locks.setdefault(gtfs_dir, threading.Lock())
+
+    signature = get_files_signature(gtfs_dir)
+    if entry is not None and entry['signature'] == signature:
+        return entry['model']
+    if not load_lock.acquire(blocking=entry is None):
+        # Being reloaded by another thread
+        return entry['model']
+    try:
+        with _static_lock:
+            current = _static_gtfs.get(gtfs_dir)
+        if current is not None and current['signature'] == signature:
+            return current['model']
+        try:
+            model = load_static_gtfs(gtfs_dir)
+        except Exception as e:
+            print(f"Error loading static GTFS from {gtfs_dir}: {e}")
+            model = current['model'] if current else StaticGTFS(os.devnull)
+        with _static_lock:
+            _static_gtfs[gtfs_dir] = {'model': model, 'signature': signature, 'checked_at': time.monotonic()}
+        return model
+    finally:
+        load_lock.release()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+
+# Accepted values of the time_format query parameter
+TIME_FORMATS = ('text', 'iso', 'epoch')
+DEFAULT_TIME_FORMAT = 'text'
+
+# Format of 'text' timestamps
+TEXT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Sentinel used for absent times in epoch arrays
+MISSING = -1
+
+# Static GTFS agency file providing agency_timezone
+AGENCY_FILE = 'data/gtfs/agency.csv'
+
+_timezone_lock = threading.Lock()
+_timezone_cache = {}
+
+
+def get_agency_timezone(agency_file=AGENCY_FILE):
+    """
+    Get the timezone of the agency, reloaded when agency.csv changes
+
+    Args:
+        agency_file (str): Path to agency.csv
+
+    Returns:
+        ZoneInfo: Agency timezone, or None if unknown (server local time is used)
+    """
+    try:
+        key = (agency_file, os.stat(agency_file).st_mtime_ns)
+    except OSError:
+        return None
+
+    with _timezone_lock:
+        if key in _timezone_cache:
+            return _timezone_cache[key]
+
+    timezone = None
+    try:
+        with open(agency_file, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                if row.get('agency_timezone'):
+                    timezone = ZoneInfo(row['agency_timezone'].strip())
+                    break
+    except Exception as e:
+        print(f"Error reading agency timezone from {agency_file}: {e}")
+
+    with _timezone_lock:
+        _timezone_cache.clear()
+        _timezone_cache[key] = timezone
+    return timezone
+
+
+def format_epoch(value, time_format=DEFAULT_TIME_FORMAT, timezone=None):
+    """
+    Format a single epoch timestamp
+
+    Args:
+        value (int): Epoch seconds, None or MISSING if absent
+        time_format (str): One of TIME_FORMATS
+        timezone (ZoneInfo): Timezone to format in (agency timezone if None)
+
+    Returns:
+        Formatted value, or None if absent
+    """
+    if value is None or value == MISSING:
+        return None
+    if time_format == 'epoch':
+        return int(value)
+
+    timezone = timezone or get_agency_timezone()
+    moment = datetime.fromtimestamp(value, timezone)
+    if time_format == 'iso':
+        return (moment if timezone else moment.astimezone()).isoformat()
+    return moment.strftime(TEXT_FORMAT)
+
+
+def format_epochs(values, time_format=DEFAULT_TIME_FORMAT, timezone=None):
+    """
+    Format an array of epoch timestamps, formatting each distinct value once
+
+    Args:
+        values (numpy.ndarray): int64 epoch seconds, MISSING if absent
+        time_format (str): One of TIME_FORMATS
+        timezone (ZoneInfo): Timezone to format in (agency timezone if None)
+
+    Returns:
+        list: Formatted values, None where absent
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if time_format == 'epoch':
+        return [None if value == MISSING else value for value in values.tolist()]
+
+    timezone = timezone or get_agency_timezone()
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    formatted = [format_epoch(value, time_format, timezone) for value in unique_values.tolist()]
+    return [formatted[index] for index in inverse.ravel().tolist()]
+
+
+def format_row_times(rows, fields, time_format=DEFAULT_TIME_FORMAT):
+    """
+    Copy rows holding epoch timestamps with the timestamp fields formatted
+
+    Args:
+        rows (list): Rows holding epoch seconds (or None) in the given fields
+        fields (list): Names of the timestamp fields
+        time_format (str): One of TIME_FORMATS
+
+    Returns:
+        list: New rows, or the same rows for the 'epoch' format
+    """
+    if time_format == 'epoch' or not rows:
+        return rows
+
+    formatted = {
+        field: format_epochs([MISSING if row[field] is None else row[field] for row in rows], time_format)
+        for field in fields
+    }
+    new_rows = []
+    for index, row in enumerate(rows):
+        new_row = dict(row)
+        for field in fields:
+            new_row[field] = formatted[field][index]
+        new_rows.append(new_row)
+    return new_rows
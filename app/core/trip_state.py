@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import hashlib
+import threading
+from collections import deque
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+from app.core.columnar import compact_columns, concat_columns, decode_trip_update_messages, decode_trip_updates
+from app.core.feed_cache import cached_process, prime_process
+from app.core.snapshot_store import HISTORY_SIZE
+
+# Size of the content digests of trips and stop time updates, in bytes
+DIGEST_SIZE = 16
+
+
+def get_content(trip_update):
+    """
+    Serialize a trip update without its timestamp, which producers may
+    refresh in every snapshot although nothing else changed
+
+    The timestamp is cleared on a copy: the feed may be shared with the
+    request threads through the feed cache.
+
+    Returns:
+        bytes: Serialized trip update
+    """
+    if not trip_update.HasField('timestamp'):
+        return trip_update.SerializeToString()
+    content = gtfs_realtime_pb2.TripUpdate()
+    content.CopyFrom(trip_update)
+    content.ClearField('timestamp')
+    return content.SerializeToString()
+
+
+def get_trip_key(trip):
+    """
+    Identify a trip instance by its trip id and start date
+
+    Args:
+        trip: TripDescriptor message
+
+    Returns:
+        tuple: (trip_id, start_date), 'Unknown' for an absent trip id and '' for an absent date
+    """
+    return (trip.trip_id if trip.HasField('trip_id') else 'Unknown', trip.start_date)
+
+
+def get_stop_key(stop_time_update):
+    """
+    Identify a stop time update within its trip by its stop sequence, or its stop id when absent
+    """
+    if stop_time_update.HasField('stop_sequence'):
+        return stop_time_update.stop_sequence
+    return stop_time_update.stop_id
+
+
+class TripState:
+    """
+    Latest state of one trip instance of a trip update feed
+
+    The stop time updates are only compared when the trip's content hash
+    changes, from the previous serialized content, so unchanged trips cost
+    one hash per snapshot.
+
+    Attributes:
+        trip_id (str): Trip id
+        start_date (str): Start date (YYYYMMDD), '' if absent
+        digest (bytes): Hash of the content
+        content (bytes): Serialized trip update, without its timestamp
+        first_seen (int): Feed timestamp at which the trip appeared
+        last_changed (int): Feed timestamp at which its content last changed
+        stop_changes (dict): Feed timestamp at which each stop time update
+            last changed, keyed by stop key, for those changed since first_seen
+        row_start (int): Position of its first stop time update in the merged columns
+    """
+
+    __slots__ = ('trip_id', 'start_date', 'digest', 'content', 'first_seen', 'last_changed', 'stop_changes',
+                 'row_start')
+
+    def __init__(self, trip_id, start_date, digest, content, first_seen):
+        self.trip_id = trip_id
+        self.start_date = start_date
+        self.digest = digest
+        self.content = content
+        self.first_seen = first_seen
+        self.last_changed = first_seen
+        self.stop_changes = {}
+        self.row_start = 0
+
+    def update(self, trip_update, digest, content, timestamp):
+        """
+        Apply a trip update whose content changed, noting which of its stop
+        time updates changed
+
+        Args:
+            trip_update: New TripUpdate message
+            digest (bytes): Hash of its content
+            content (bytes): Its serialization without timestamp
+            timestamp (int): Feed timestamp of the snapshot
+        """
+        previous = gtfs_realtime_pb2.TripUpdate.FromString(self.content)
+        previous_stops = {get_stop_key(stop_time_update): stop_time_update.SerializeToString()
+                          for stop_time_update in previous.stop_time_update}
+        stop_changes = {}
+        for stop_time_update in trip_update.stop_time_update:
+            key = get_stop_key(stop_time_update)
+            if previous_stops.get(key) != stop_time_update.SerializeToString():
+                stop_changes[key] = timestamp
+            elif key in self.stop_changes:
+                stop_changes[key] = self.stop_changes[key]
+        self.stop_changes = stop_changes
+        self.digest = digest
+        self.content = content
+        self.last_changed = timestamp
+
+    def to_dict(self):
+        """
+        Describe the trip and when each of its stop time updates last changed
+        """
+        trip_update = gtfs_realtime_pb2.TripUpdate.FromString(self.content)
+        return {
+            'trip_id': self.trip_id,
+            'start_date': self.start_date or None,
+            'first_seen': self.first_seen,
+            'last_changed': self.last_changed,
+            'stop_time_updates': [
+                {
+                    'stop_sequence': stop_time_update.stop_sequence if stop_time_update.HasField('stop_sequence') else None,
+                    'stop_id': stop_time_update.stop_id if stop_time_update.HasField('stop_id') else None,
+                    'last_changed': self.stop_changes.get(get_stop_key(stop_time_update), self.first_seen)
+                }
+                for stop_time_update in trip_update.stop_time_update
+            ]
+        }
+
+
+class TripChanges:
+    """
+    Trips added, changed and removed by merging one snapshot
+
+    Attributes:
+        timestamp (int): Feed timestamp of the snapshot
+        added (list): Keys (trip_id, start_date) of the new trips
+        changed (list): Keys of the trips whose content changed
+        removed (list): Keys of the trips absent from the snapshot
+        snapshot_id (int): Id of the published snapshot, once recorded
+    """
+
+    __slots__ = ('timestamp', 'added', 'changed', 'removed', 'snapshot_id')
+
+    def __init__(self, timestamp, added, changed, removed):
+        self.timestamp = timestamp
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        self.snapshot_id = None
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def trip_ids(self):
+        """
+        Get the trip ids touched by the changes
+        """
+        return {trip_id for trip_id, _ in self.added + self.changed + self.removed}
+
+
+class TripStateStore:
+    """
+    Latest state of every trip of a trip update feed, merged snapshot by snapshot
+
+    Each trip update is hashed, ignoring its timestamp. Unchanged trips keep their
+    decoded stop time updates from the previous snapshot, so only the trips
+    that changed are decoded, and the columns of the whole snapshot are
+    assembled with vectorized copies. The columns are stored in the rows
+    cache as the decoding of the feed, for the statistics, histograms, row
+    indexes and rows built from it. The trips changed by recent merges are
+    kept to diff snapshots over the changed trips only.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        """
+        Args:
+            history_size (int): Number of merges whose changes are kept
+        """
+        self._lock = threading.Lock()
+        self._trips = {}
+        self._columns = None
+        self._history = deque(maxlen=history_size)
+        self._stats = {'merges': 0, 'trips_changed': 0, 'stop_updates_decoded': 0, 'stop_updates_reused': 0,
+                       'last_merge_ms': None}
+
+    def clear(self):
+        """
+        Forget every trip (used when the source changes or a merge failed)
+        """
+        with self._lock:
+            self._trips = {}
+            self._columns = None
+            self._history.clear()
+
+    def merge(self, feed, timestamp):
+        """
+        Merge a trip update snapshot into the trip states
+
+        Args:
+            feed: GTFS-RT feed message
+            timestamp (int): Feed timestamp of the snapshot
+
+        Returns:
+            TripChanges: Trips added, changed and removed
+        """
+        started = time.perf_counter()
+        with self._lock:
+            previous = self._trips
+            trips = {}
+            added = []
+            changed = []
+            # Source of the rows of each trip update, in feed order: 0 for the
+            # previous columns, 1 for the decoded ones; start and count of its rows
+            sources = []
+            decoded = []
+            decoded_rows = 0
+            position = 0
+
+            for entity in feed.entity:
+                if not entity.HasField('trip_update'):
+                    continue
+                trip_update = entity.trip_update
+                key = get_trip_key(trip_update.trip)
+                count = len(trip_update.stop_time_update)
+                content = get_content(trip_update)
+                digest = hashlib.blake2b(content, digest_size=DIGEST_SIZE).digest()
+                state = previous.get(key) if key not in trips else None
+
+                if state is not None and state.digest == digest:
+                    sources.append((0, state.row_start, count))
+                else:
+                    if state is None:
+                        state = TripState(key[0], key[1], digest, content, timestamp)
+                        # A trip repeated within a feed is decoded each time, its last entity tracked
+                        if key not in trips:
+                            added.append(key)
+                    else:
+                        state.update(trip_update, digest, content, timestamp)
+                        changed.append(key)
+                    sources.append((1, decoded_rows, count))
+                    decoded.append(trip_update)
+                    decoded_rows += count
+
+                state.row_start = position
+                position += count
+                trips[key] = state
+
+            removed = [key for key in previous if key not in trips]
+            columns, decoded_rows = self._assemble(feed, sources, decoded, decoded_rows, position)
+            prime_process(decode_trip_updates, feed, columns)
+            self._trips = trips
+            self._columns = columns
+
+            changes = TripChanges(timestamp, added, changed, removed)
+            self._history.append(changes)
+            self._stats['merges'] += 1
+            self._stats['trips_changed'] += len(added) + len(changed) + len(removed)
+            self._stats['stop_updates_decoded'] += decoded_rows
+            self._stats['stop_updates_reused'] += position - decoded_rows
+            self._stats['last_merge_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return changes
+
+    def _assemble(self, feed, sources, decoded, decoded_rows, size):
+        """
+        Build the columns of a snapshot from the previous columns and the changed trips
+
+        Returns:
+            tuple: (TripUpdateColumns, number of stop time updates decoded)
+        """
+        if decoded_rows * 2 >= size:
+            # With more changed than unchanged updates (e.g. the first
+            # snapshot), decoding the feed as a whole is cheaper, and the
+            # parallel decoder may already have done it
+            return cached_process(decode_trip_updates, feed), size
+
+        kinds, starts, counts = np.array(sources, dtype=np.int64).reshape(-1, 3).T
+        offsets = np.cumsum(counts) - counts
+        if not decoded and size == len(self._columns) and np.array_equal(starts, offsets):
+            return self._columns, 0
+
+        combined = concat_columns([self._columns, decode_trip_update_messages(decoded)])
+        starts = starts + kinds * len(self._columns)
+        # Rows of each trip update, copied in feed order
+        index = np.repeat(starts - offsets, counts) + np.arange(size)
+        return compact_columns(combined.select(index)), decoded_rows
+
+    def record_snapshot(self, snapshot_id):
+        """
+        Associate the latest merge with the id of the snapshot it was published as
+        """
+        with self._lock:
+            if self._history:
+                self._history[-1].snapshot_id = snapshot_id
+
+    def changed_since(self, snapshot_id):
+        """
+        Get the trips changed by the snapshots published after a given one
+
+        Returns:
+            set: Trip ids added, changed or removed since the snapshot, or
+                None if the snapshot is not among the recent merges
+        """
+        with self._lock:
+            history = list(self._history)
+        for position, changes in enumerate(history):
+            if changes.snapshot_id == snapshot_id:
+                trip_ids = set()
+                for later in history[position + 1:]:
+                    trip_ids |= later.trip_ids()
+                return trip_ids
+        return None
+
+    def get_trips(self, trip_ids=None, since=None):
+        """
+        Get the state of trips
+
+        Args:
+            trip_ids (set): Trip ids to describe, all if None
+            since (int): If given, only the trips changed at or after this feed timestamp
+
+        Returns:
+            list: Trip descriptions, in feed order
+        """
+        with self._lock:
+            trips = list(self._trips.values())
+        return [
+            trip.to_dict()
+            for trip in trips
+            if (trip_ids is None or trip.trip_id in trip_ids) and (since is None or trip.last_changed >= since)
+        ]
+
+    def get_stats(self):
+        """
+        Get the number of trips tracked and the merge counters
+
+        Returns:
+            dict: Counters, with the share of stop time updates reused rather than decoded
+        """
+        with self._lock:
+            stats = dict(self._stats, trips=len(self._trips))
+        total = stats['stop_updates_decoded'] + stats['stop_updates_reused']
+        stats['reuse_rate'] = round(stats['stop_updates_reused'] / total, 3) if total else 0
+        return stats
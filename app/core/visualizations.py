@@ -3,37 +3,118 @@
 
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import pandas as pd
+from matplotlib.figure import Figure
+import numpy as np
 import os
+import threading
+from contextlib import contextmanager
+
+# Size of each chart, in inches
+FIGURE_SIZES = {
+    'delay_distribution': (10, 6),
+    'vehicle_positions': (10, 8)
+}
+
+# Default labels of each chart
+CHART_LABELS = {
+    'delay_distribution': {
+        'title': 'Distribution of Delays',
+        'xlabel': 'Delay (minutes)',
+        'ylabel': 'Frequency'
+    },
+    'vehicle_positions': {
+        'title': 'Vehicle Positions',
+        'xlabel': 'Longitude',
+        'ylabel': 'Latitude'
+    }
+}
+
+# One figure per chart, reused for every drawing instead of being created and
+# destroyed each time; matplotlib is not thread-safe, so drawing is serialized
+_figures = {}
+_figures_lock = threading.Lock()
+
+
+@contextmanager
+def chart_figure(name):
+    """
+    Borrow the persistent figure of a chart, cleared for a new drawing
+
+    Args:
+        name (str): Chart name, a key of FIGURE_SIZES
+
+    Yields:
+        tuple: (Figure, Axes)
+    """
+    with _figures_lock:
+        if name not in _figures:
+            figure = Figure(figsize=FIGURE_SIZES[name])
+            _figures[name] = (figure, figure.add_subplot())
+        figure, axes = _figures[name]
+        axes.clear()
+        yield figure, axes
+
+
+def save_delay_chart(delays, output_path, labels=None):
+    """
+    Draw a histogram of delays and save it
+
+    Args:
+        delays (numpy.ndarray): Delays in minutes
+        output_path (str): Path to save the chart to
+        labels (dict): Title and axis labels, CHART_LABELS if omitted
+    """
+    labels = labels or CHART_LABELS['delay_distribution']
+    with chart_figure('delay_distribution') as (figure, axes):
+        axes.hist(delays, bins=20, alpha=0.7, color='blue')
+        axes.axvline(x=0, color='red', linestyle='dashed', linewidth=1)
+        axes.set_title(labels['title'])
+        axes.set_xlabel(labels['xlabel'])
+        axes.set_ylabel(labels['ylabel'])
+        axes.grid(True, alpha=0.3)
+        figure.tight_layout()
+        figure.savefig(output_path, format='png')
+
+
+def save_vehicle_position_map(longitudes, latitudes, output_path, labels=None):
+    """
+    Draw a scatter plot of vehicle positions and save it
+
+    Args:
+        longitudes (numpy.ndarray): Longitudes of the vehicles
+        latitudes (numpy.ndarray): Latitudes of the vehicles
+        output_path (str): Path to save the chart to
+        labels (dict): Title and axis labels, CHART_LABELS if omitted
+    """
+    labels = labels or CHART_LABELS['vehicle_positions']
+    with chart_figure('vehicle_positions') as (figure, axes):
+        axes.scatter(longitudes, latitudes, alpha=0.6)
+        axes.set_title(labels['title'])
+        axes.set_xlabel(labels['xlabel'])
+        axes.set_ylabel(labels['ylabel'])
+        axes.grid(True, alpha=0.3)
+        figure.savefig(output_path, format='png')
 
 
 def generate_delay_chart(trip_updates, output_path='output/charts/delay_distribution.png'):
     """
     Generate a histogram of delay distribution from trip updates
-    
+
     Args:
         trip_updates (list): List of trip update dictionaries
         output_path (str): Path to save the generated chart
     """
     if not trip_updates:
         return None
-        
+
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
+
     # Extract delay values
     delays = [update['delay_minutes'] for update in trip_updates if 'delay_minutes' in update]
-    
+
     if delays:
-        plt.figure(figsize=(10, 6))
-        plt.hist(delays, bins=20)
-        plt.title('Distribution of Delays')
-        plt.xlabel('Delay (minutes)')
-        plt.ylabel('Frequency')
-        plt.grid(True, alpha=0.3)
-        plt.savefig(output_path)
-        plt.close()
+        save_delay_chart(np.array(delays, dtype=np.float64), output_path)
         return output_path
     return None
 
@@ -41,30 +122,25 @@ def generate_delay_chart(trip_updates, output_path='output/charts/delay_distribu
 def generate_vehicle_position_map(vehicle_positions, output_path='output/charts/vehicle_positions.png'):
     """
     Generate a scatter plot of vehicle positions
-    
+
     Args:
         vehicle_positions (list): List of vehicle position dictionaries
         output_path (str): Path to save the generated chart
     """
     if not vehicle_positions:
         return None
-        
+
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    # Create a DataFrame from vehicle positions
-    df = pd.DataFrame(vehicle_positions)
-    
-    # Check if we have coordinate data
-    if ('latitude' in df and 'longitude' in df and 
-            df['latitude'].notna().any() and df['longitude'].notna().any()):
-        plt.figure(figsize=(10, 8))
-        plt.scatter(df['longitude'], df['latitude'], alpha=0.6)
-        plt.title('Vehicle Positions')
-        plt.xlabel('Longitude')
-        plt.ylabel('Latitude')
-        plt.grid(True, alpha=0.3)
-        plt.savefig(output_path)
-        plt.close()
+
+    # Keep the vehicles having both coordinates
+    coordinates = np.array([
+        (vehicle.get('longitude'), vehicle.get('latitude'))
+        for vehicle in vehicle_positions
+        if vehicle.get('longitude') is not None and vehicle.get('latitude') is not None
+    ], dtype=np.float64).reshape(-1, 2)
+
+    if len(coordinates):
+        save_vehicle_position_map(coordinates[:, 0], coordinates[:, 1], output_path)
         return output_path
     return None
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
 
 # Configuration file path
@@ -22,6 +23,9 @@ DEFAULT_CONFIG = {
     'current_source': 0
 }
 
+# Source identifiers, also used as directory names: lowercase letters and digits separated by dashes
+SOURCE_ID_PATTERN = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+
 
 def load_config():
     """
@@ -145,3 +149,49 @@ def get_current_source():
     if 0 <= config['current_source'] < len(config['sources']):
         return config['sources'][config['current_source']]
     return None
+
+
+def slugify(value):
+    """
+    Lowercase a name and replace the other characters than letters and
+    digits by dashes (e.g. 'Montpellier TaM' gives 'montpellier-tam')
+    """
+    return re.sub(r'[^a-z0-9]+', '-', str(value).lower()).strip('-')
+
+
+def is_valid_source_id(source_id):
+    """
+    Check whether a source identifier is safe to use as a directory name
+    """
+    return isinstance(source_id, str) and SOURCE_ID_PATTERN.fullmatch(source_id) is not None
+
+
+def get_source_id(source):
+    """
+    Get the identifier of a data source used in the API paths
+    
+    The 'id' of the source is used if set, otherwise its name, both
+    slugified: the identifier names the directories the feeds of the
+    source are saved and archived to.
+    
+    Args:
+        source (dict): Source configuration
+        
+    Returns:
+        str: Source identifier, matching SOURCE_ID_PATTERN
+    """
+    return slugify(source.get('id') or '') or slugify(source.get('name', '')) or 'source'
+
+
+def get_active_sources():
+    """
+    Get the configured data sources that are not disabled
+    
+    Returns:
+        dict: Source configuration keyed by source identifier, in configuration order
+    """
+    sources = {}
+    for source in load_config()['sources']:
+        if source.get('active', True):
+            sources.setdefault(get_source_id(source), source)
+    return sources
@@ -5,6 +5,7 @@ from flask import Flask, render_template, send_from_directory
 from flask_cors import CORS
 from app.api.config_routes import config_api
 from app.api.data_routes import data_api
+from app.core.chart_renderer import CHARTS_DIR
 import os
 
 # Create Flask application
@@ -39,12 +40,5 @@ def serve_chart(filename):
     """
     Serve generated chart images
     """
-    return send_from_directory('../output/charts', filename)
+    return send_from_directory(os.path.abspath(CHARTS_DIR), filename)
 
-
-@app.route('/output/csv/<path:filename>')
-def serve_csv(filename):
-    """
-    Serve generated CSV files
-    """
-    return send_from_directory('../output/csv', filename)
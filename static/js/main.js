@@ -13,6 +13,11 @@ let vehicleMarkers = [];
 let tripUpdatesTable = null;
 let vehiclePositionsTable = null;
 let configData = null;
+let eventSource = null;
+let pollingTimer = null;
+let reloadTimer = null;
+let historyTimestamp = null;
+let historyTimer = null;
 
 // Initialize the application when the document is ready
 $(document).ready(() => {
@@ -34,8 +39,10 @@ $(document).ready(() => {
     // Set up filters
     setupFilters();
     
-    // Set up auto-refresh every 30 seconds
-    setInterval(loadAllData, 30000);
+    // Set up archive scrubbing
+    setupHistory();
+    
+    // Live updates are started once the first data has been loaded
 });
 
 /**
@@ -274,7 +281,7 @@ function refreshData() {
  */
 function loadAllData() {
     $.ajax({
-        url: '/api/all-data',
+        url: historyTimestamp === null ? '/api/all-data' : `/api/all-data?at=${historyTimestamp}`,
         method: 'GET',
         dataType: 'json',
         success: (response) => {
@@ -306,14 +313,137 @@ function loadAllData() {
             
             // Update route filter options
             updateRouteFilterOptions(vehiclePositionsData);
+            
+            // Listen for new snapshots from now on, unless showing the past
+            if (historyTimestamp === null) {
+                startLiveUpdates(response.snapshot_ids);
+            }
         },
         error: (xhr, status, error) => {
             console.error('Error loading data:', error);
             showNotification('danger', `Erreur lors du chargement des données: ${error}`);
+            
+            // Keep retrying, e.g. while the server waits for its first snapshot
+            if (historyTimestamp === null && !eventSource) {
+                startPolling();
+            }
+        }
+    });
+}
+
+/**
+ * Start receiving new snapshots pushed by the server, or fall back to
+ * polling every 30 seconds if the event stream is not available
+ * @param {Object} snapshotIds - Snapshot ids of the data already loaded, by feed type
+ */
+function startLiveUpdates(snapshotIds) {
+    if (eventSource || pollingTimer) return;
+    
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    
+    const params = new URLSearchParams();
+    for (const [feedType, snapshotId] of Object.entries(snapshotIds || {})) {
+        if (snapshotId !== null && snapshotId !== undefined) {
+            params.append(feedType, snapshotId);
+        }
+    }
+    
+    let opened = false;
+    eventSource = new EventSource(`/api/stream?${params.toString()}`);
+    eventSource.onopen = () => {
+        opened = true;
+    };
+    eventSource.onerror = () => {
+        // The stream never opened: the server does not support it
+        if (!opened) {
+            eventSource.close();
+            eventSource = null;
+            startPolling();
         }
+    };
+    
+    for (const feedType of ['trip_update', 'vehicle_position', 'alert']) {
+        eventSource.addEventListener(feedType, scheduleReload);
+    }
+}
+
+/**
+ * Stop receiving new snapshots, while archived data is shown
+ */
+function stopLiveUpdates() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    clearInterval(pollingTimer);
+    pollingTimer = null;
+    clearTimeout(reloadTimer);
+}
+
+/**
+ * Set up the slider scrubbing through the archived snapshots
+ */
+function setupHistory() {
+    $.ajax({
+        url: '/api/archive/trip-updates/timeline',
+        method: 'GET',
+        dataType: 'json',
+        success: (response) => {
+            if (response.first_timestamp === null || response.last_timestamp === null) return;
+            
+            $('#history-slider')
+                .attr({min: response.first_timestamp, max: response.last_timestamp, step: 10})
+                .val(response.last_timestamp);
+            $('#history-bar').show();
+        },
+        // The archive is not enabled
+        error: () => {}
+    });
+    
+    $('#history-slider').on('input', function() {
+        const timestamp = parseInt($(this).val(), 10);
+        $('#history-time').text(new Date(timestamp * 1000).toLocaleString('fr-FR'));
+        $('#history-live').prop('disabled', false);
+        
+        // Only the position where the slider stops is loaded
+        clearTimeout(historyTimer);
+        historyTimer = setTimeout(() => {
+            historyTimestamp = timestamp;
+            stopLiveUpdates();
+            loadAllData();
+        }, 250);
+    });
+    
+    $('#history-live').on('click', function() {
+        clearTimeout(historyTimer);
+        historyTimestamp = null;
+        $('#history-time').text('Direct');
+        $(this).prop('disabled', true);
+        loadAllData();
     });
 }
 
+/**
+ * Reload the data shortly after a new snapshot, so that snapshots of
+ * several feeds published together trigger a single reload
+ */
+function scheduleReload() {
+    clearTimeout(reloadTimer);
+    reloadTimer = setTimeout(loadAllData, 500);
+}
+
+/**
+ * Poll the data every 30 seconds
+ */
+function startPolling() {
+    if (!pollingTimer) {
+        pollingTimer = setInterval(loadAllData, 30000);
+    }
+}
+
 /**
  * Update timestamps in the UI
  * @param {Object} data - Data object containing timestamps
@@ -369,10 +499,10 @@ function updateTripUpdatesUI(tripUpdates) {
         $('#trip-min-delay').text(`${tripUpdates.stats.min_delay_minutes} min`);
     }
     
-    // Update delay chart
-    if (tripUpdates.chart) {
-        $('#delay-chart').attr('src', `/static/${tripUpdates.chart}?t=${new Date().getTime()}`);
-        $('#trip-delay-chart').attr('src', `/static/${tripUpdates.chart}?t=${new Date().getTime()}`);
+    // Update delay chart (chart URLs change with their content, so they can be cached)
+    if (tripUpdates.stats && tripUpdates.stats.delay_chart) {
+        $('#delay-chart').attr('src', tripUpdates.stats.delay_chart);
+        $('#trip-delay-chart').attr('src', tripUpdates.stats.delay_chart);
     }
     
     // Update trip updates table
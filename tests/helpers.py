@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from google.transit import gtfs_realtime_pb2
+from google.protobuf import json_format
+
+
+def make_feed(entities=(), timestamp=None):
+    """
+    Build a GTFS-RT feed for the tests
+
+    Args:
+        entities (list): One dict per entity, holding its 'id' and a
+            'trip_update', 'vehicle' or 'alert' dict of message fields, by
+            their GTFS-RT names. Nested messages are dicts, repeated fields
+            lists and enums names or numbers, e.g.
+            {'id': 'trip-0', 'trip_update': {'trip': {'trip_id': 'T0'},
+             'stop_time_update': [{'stop_id': 'S0', 'departure': {'delay': 60}}]}}
+        timestamp (int): Header timestamp, left absent if None
+
+    Returns:
+        gtfs_realtime_pb2.FeedMessage: Feed
+    """
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '2.0'
+    if timestamp is not None:
+        feed.header.timestamp = timestamp
+    for entity in entities:
+        json_format.ParseDict(entity, feed.entity.add())
+    return feed
+
+
+def trip_update(trip_id, stops=(), entity_id=None, **fields):
+    """
+    Describe a trip update entity for make_feed
+
+    Args:
+        trip_id (str): Trip id, also the entity id unless entity_id is given
+        stops (list): Stop time update dicts, e.g. from stop_time_update
+        entity_id (str): Entity id
+        **fields: Other TripDescriptor fields (route_id, start_date), and
+            'timestamp' for the trip update's own timestamp
+
+    Returns:
+        dict: Entity
+    """
+    timestamp = fields.pop('timestamp', None)
+    update = {'trip': dict(fields, trip_id=trip_id), 'stop_time_update': list(stops)}
+    if timestamp is not None:
+        update['timestamp'] = timestamp
+    return {'id': entity_id or trip_id, 'trip_update': update}
+
+
+def stop_time_update(stop_id=None, stop_sequence=None, delay=None, time=None, event='departure'):
+    """
+    Describe a stop time update for trip_update, with the delay and time of
+    its arrival or departure, leaving out the fields given as None
+
+    Returns:
+        dict: StopTimeUpdate fields
+    """
+    update = {name: value for name, value in (('stop_id', stop_id), ('stop_sequence', stop_sequence))
+              if value is not None}
+    times = {name: value for name, value in (('delay', delay), ('time', time)) if value is not None}
+    if times:
+        update[event] = times
+    return update
+
+
+def vehicle(vehicle_id, entity_id=None, trip=None, **fields):
+    """
+    Describe a vehicle position entity for make_feed
+
+    Args:
+        vehicle_id (str): Vehicle id
+        entity_id (str): Entity id, 'vehicle-<vehicle_id>' if omitted
+        trip (dict): TripDescriptor fields
+        **fields: Position fields (latitude, longitude, bearing, speed) and
+            the other VehiclePosition fields (current_status, timestamp)
+
+    Returns:
+        dict: Entity
+    """
+    position = {name: fields.pop(name) for name in ('latitude', 'longitude', 'bearing', 'speed') if name in fields}
+    message = dict(fields, vehicle={'id': vehicle_id})
+    if position:
+        message['position'] = position
+    if trip:
+        message['trip'] = trip
+    return {'id': entity_id or f"vehicle-{vehicle_id}", 'vehicle': message}
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.helpers import make_feed, stop_time_update, trip_update
+from app.core.chart_renderer import ChartRenderer
+from app.core.snapshot_store import SnapshotStore
+
+
+def make_delay_feed(delays):
+    return make_feed([
+        trip_update(f"T{index}", [stop_time_update(f"S{index}", delay=delay)], entity_id=f"trip-{index}")
+        for index, delay in enumerate(delays)
+    ])
+
+
+def test_charts_are_content_addressed(tmp_path):
+    renderer = ChartRenderer(str(tmp_path), url_prefix='/charts/', keep=1)
+    first = renderer.render('delay_distribution', make_delay_feed([60, 120]))
+    # The same data in another feed reuses the file
+    assert renderer.render('delay_distribution', make_delay_feed([60, 120])) == first
+    second = renderer.render('delay_distribution', make_delay_feed([60, 300]))
+
+    assert first != second and second.startswith('delay_distribution-')
+    # Only the latest file is kept
+    assert sorted(os.listdir(tmp_path)) == [second]
+    assert renderer.render('vehicle_positions', make_delay_feed([60])) is None
+
+
+def test_new_snapshots_are_rendered_in_background(tmp_path):
+    renderer = ChartRenderer(str(tmp_path), url_prefix='/charts/')
+    store = SnapshotStore()
+    renderer.watch(store)
+    feed = make_delay_feed([60, 120, 180])
+    store.publish('trip_update', feed)
+
+    deadline = time.monotonic() + 10
+    while renderer.get_chart('delay_distribution', feed) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    url = renderer.get_chart('delay_distribution', feed)
+    assert url.startswith('/charts/delay_distribution-')
+    assert os.path.getsize(os.path.join(tmp_path, url[len('/charts/'):])) > 0
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.helpers import make_feed, stop_time_update, trip_update
+from app.core.columnar import MISSING, decode_trip_updates, trip_update_stats
+
+
+def make_trips_feed():
+    entities = [
+        trip_update(trip_id, [
+            stop_time_update(f"S{sequence}", sequence, delay, event='arrival') for sequence, delay in enumerate(delays, 1)
+        ], route_id=route_id)
+        for trip_id, route_id, delays in [('T1', 'R1', [60, -171]), ('T2', 'R1', [600])]
+    ]
+    # A stop time update without any field
+    return make_feed(entities + [{'trip_update': {'stop_time_update': [{}]}}])
+
+
+def test_decode_trip_updates_interns_ids():
+    columns = decode_trip_updates(make_trips_feed())
+
+    assert len(columns) == 4
+    assert columns.trip_ids == ['T1', 'T2', 'Unknown']
+    assert columns.trip_codes.tolist() == [0, 0, 1, 2]
+    assert columns.stop_sequences.tolist() == [1, 2, 1, MISSING]
+    assert columns.arrival_times.tolist() == [MISSING] * 4
+
+
+def test_to_records_matches_row_format():
+    records = decode_trip_updates(make_trips_feed()).to_records()
+
+    assert records[1] == {
+        'trip_id': 'T1',
+        'route_id': 'R1',
+        'stop_id': 'S2',
+        'delay_seconds': -171,
+        'delay_minutes': -2.9,
+        'arrival_time': None,
+        'departure_time': None
+    }
+
+
+def test_select_and_stats_run_on_arrays():
+    columns = decode_trip_updates(make_trips_feed())
+    late = columns.select(columns.delay_seconds > 0)
+
+    assert [record['trip_id'] for record in late.to_records()] == ['T1', 'T2']
+    stats = trip_update_stats(columns)
+    assert stats['delay']['max'] == 10.0
+    assert stats['trips'] == 3
+    assert stats['routes'] == 2
+    assert trip_update_stats(columns.select(columns.delay_seconds > 1000)) == {}
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import gzip
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.helpers import make_feed, stop_time_update, trip_update, vehicle
+from app.api import data_routes
+from app.core.snapshot_store import SnapshotStore
+from app.core.rolling_stats import RollingDelayStats
+from app.core.trip_state import TripStateStore
+from app.web.routes import app
+
+
+class StubPoller:
+    def __init__(self):
+        self.store = SnapshotStore()
+        self.delay_stats = RollingDelayStats()
+        self.trip_states = TripStateStore()
+
+    def wait_until_ready(self, timeout=None):
+        return True
+
+
+def make_trip_update_feed(timestamp, delays):
+    return make_feed([
+        trip_update(f"T{index}", [stop_time_update(f"S{index}", 1, delay, 1741687200 + delay)],
+                    entity_id=f"trip-{index}", route_id='R1')
+        for index, delay in enumerate(delays)
+    ], timestamp)
+
+
+@pytest.fixture
+def poller(monkeypatch):
+    stub = StubPoller()
+    monkeypatch.setattr(data_routes, 'get_feed_poller', lambda: stub)
+    return stub
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_trip_updates_are_served_with_etag(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1000, [60, 120]))
+
+    response = client.get('/api/trip-updates')
+    assert response.status_code == 200
+    assert len(response.get_json()['trip_updates']) == 2
+    etag = response.headers['ETag']
+
+    revalidated = client.get('/api/trip-updates', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+
+    poller.store.publish('trip_update', make_trip_update_feed(2000, [0]))
+    changed = client.get('/api/trip-updates', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_all_data_is_served_pre_compressed(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1000, list(range(0, 6000, 60))))
+
+    response = client.get('/api/all-data', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    payload = json.loads(gzip.decompress(response.data))
+    assert payload['statistics']['trip_updates']['trips'] == 100
+    assert payload['statistics']['alerts']['count'] == 0
+
+
+def test_changes_returns_only_modified_trips(poller, client):
+    first = poller.store.publish('trip_update', make_trip_update_feed(1000, [60, 120, 180]))
+    poller.store.publish('trip_update', make_trip_update_feed(1030, [60, 240]))
+
+    payload = client.get(f"/api/trip-updates/changes?since={first.snapshot_id}").get_json()
+    assert payload['full'] is False
+    assert payload['since'] == first.snapshot_id
+    assert list(payload['changed']) == ['T1']
+    assert payload['added'] == {}
+    assert payload['removed'] == ['T2']
+
+
+
+def test_changes_compare_changed_trips_only(poller, client):
+    def publish_merged(feed):
+        poller.trip_states.merge(feed, feed.header.timestamp)
+        snapshot = poller.store.publish('trip_update', feed)
+        poller.trip_states.record_snapshot(snapshot.snapshot_id)
+        return snapshot
+
+    first = publish_merged(make_trip_update_feed(1000, [60, 120, 180]))
+    second = publish_merged(make_trip_update_feed(1030, [60, 240]))
+    publish_merged(make_trip_update_feed(1060, [60, 240]))
+
+    payload = client.get(f"/api/trip-updates/changes?since={first.snapshot_id}").get_json()
+    assert (list(payload['changed']), payload['added'], payload['removed']) == (['T1'], {}, ['T2'])
+    payload = client.get(f"/api/trip-updates/changes?since={second.snapshot_id}").get_json()
+    assert (payload['changed'], payload['added'], payload['removed']) == ({}, {}, [])
+
+    trips = client.get('/api/trip-states?trip_id=T1').get_json()['trips']
+    assert [(trip['first_seen'], trip['last_changed']) for trip in trips] == [(1000, 1030)]
+    assert trips[0]['stop_time_updates'] == [{'stop_sequence': 1, 'stop_id': 'S1', 'last_changed': 1030}]
+    assert [trip['trip_id'] for trip in client.get('/api/trip-states?since=1030').get_json()['trips']] == ['T1']
+
+def test_changes_falls_back_to_full_payload(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1000, [60]))
+
+    payload = client.get('/api/trip-updates/changes?since=-1').get_json()
+    assert payload['full'] is True
+    assert len(payload['data']) == 1
+
+
+def test_stream_pushes_new_snapshots(poller, client):
+    snapshot = poller.store.publish('vehicle_position', make_trip_update_feed(1000, []))
+
+    response = client.get('/api/stream')
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    event = next(chunks).decode('utf-8')
+    response.close()
+
+    assert 'event: vehicle_position' in event
+    data = json.loads(event.split('data: ', 1)[1])
+    assert data['snapshot_id'] == snapshot.snapshot_id
+    assert data['full'] is True
+
+
+def test_time_format_parameter(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1000, [60]))
+
+    rows = client.get('/api/trip-updates?time_format=epoch').get_json()['trip_updates']
+    assert rows[0]['departure_time'] == 1741687260
+    assert rows[0]['arrival_time'] is None
+
+    response = client.get('/api/trip-updates?time_format=unix')
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+def make_vehicle_feed(positions):
+    return make_feed([
+        vehicle(f"V{index}", entity_id=f"vehicle-{index}", latitude=latitude, longitude=longitude)
+        for index, (latitude, longitude) in enumerate(positions)
+    ], 1000)
+
+
+def test_vehicle_positions_spatial_queries(poller, client):
+    poller.store.publish('vehicle_position', make_vehicle_feed([(43.60, 3.87), (43.61, 3.88), (43.70, 3.95)]))
+
+    in_box = client.get('/api/vehicle-positions?bbox=3.86,43.59,3.885,43.615').get_json()['vehicle_positions']
+    assert [row['vehicle_id'] for row in in_box] == ['V0', 'V1']
+
+    nearest = client.get('/api/vehicle-positions?near=43.611,3.881&k=1').get_json()['vehicle_positions']
+    assert [row['vehicle_id'] for row in nearest] == ['V1']
+    assert nearest[0]['distance_m'] < 200
+
+    assert client.get('/api/vehicle-positions?near=43.6,3.8').status_code == 400
+    assert client.get('/api/vehicle-positions?bbox=1,2,3').status_code == 400
+
+
+def test_trip_updates_filters_and_pagination(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1000, [60, 300, 600, 900]))
+
+    rows = client.get('/api/trip-updates?trip_id=T1,T3&fields=trip_id,delay_minutes').get_json()['trip_updates']
+    assert rows == [{'trip_id': 'T1', 'delay_minutes': 5.0}, {'trip_id': 'T3', 'delay_minutes': 15.0}]
+
+    late = client.get('/api/trip-updates?min_delay=300&max_delay=600').get_json()
+    assert late['total'] == 2
+    assert [row['trip_id'] for row in late['trip_updates']] == ['T1', 'T2']
+
+    first = client.get('/api/trip-updates?route_id=R1&limit=3').get_json()
+    assert [row['trip_id'] for row in first['trip_updates']] == ['T0', 'T1', 'T2']
+    # The cursor keeps reading the paginated snapshot
+    poller.store.publish('trip_update', make_trip_update_feed(2000, [0]))
+    second = client.get(f"/api/trip-updates?route_id=R1&limit=3&cursor={first['next_cursor']}").get_json()
+    assert [row['trip_id'] for row in second['trip_updates']] == ['T3']
+    assert second['next_cursor'] is None
+
+    assert client.get('/api/trip-updates?vehicle_id=V1').status_code == 400
+    assert client.get('/api/trip-updates?limit=0').status_code == 400
+    assert client.get('/api/trip-updates?cursor=%%%').status_code == 400
+
+
+def test_all_data_filters_every_list(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1000, [60, 120]))
+    poller.store.publish('vehicle_position', make_vehicle_feed([(43.60, 3.87), (43.61, 3.88)]))
+
+    payload = client.get('/api/all-data?trip_id=T0').get_json()
+    assert [row['trip_id'] for row in payload['trip_updates']] == ['T0']
+    assert payload['vehicle_positions'] == []
+    assert payload['statistics']['trip_updates']['trips'] == 1
+
+
+def test_archive_nearest_snapshot_and_replay(tmp_path, monkeypatch, client):
+    from app.core.feed_archive import FeedArchive
+    archive = FeedArchive(str(tmp_path))
+    for timestamp, delays in ((1741687200, [60]), (1741687230, [60, 120]), (1741687260, [60, 120, 180])):
+        archive.append('tam', 'trip_update', timestamp, make_trip_update_feed(timestamp, delays).SerializeToString())
+    monkeypatch.setattr(data_routes, 'get_feed_archive', lambda: archive)
+
+    payload = client.get('/api/tam/archive/trip-updates/at?timestamp=1741687235').get_json()
+    assert payload['feed_timestamp'] == 1741687230
+    assert [row['trip_id'] for row in payload['trip_updates']] == ['T0', 'T1']
+    assert client.get('/api/tam/archive/trip-updates/at').status_code == 400
+
+    response = client.get('/api/tam/archive/trip-updates/replay?start=1741687200&end=1741687260&step=40&trip_id=T0')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.mimetype == 'application/x-ndjson'
+    assert [(line['feed_timestamp'], len(line['trip_updates'])) for line in lines] == [(1741687200, 1), (1741687260, 1)]
+
+
+def test_all_data_at_serves_archived_snapshots(poller, tmp_path, monkeypatch, client):
+    from app.core.feed_archive import FeedArchive
+    archive = FeedArchive(str(tmp_path))
+    for timestamp, delays in ((1741687200, [60]), (1741687230, [60, 120])):
+        archive.append('tam', 'trip_update', timestamp, make_trip_update_feed(timestamp, delays).SerializeToString())
+    monkeypatch.setattr(data_routes, 'get_feed_archive', lambda: archive)
+    monkeypatch.setattr(data_routes, 'get_current_source', lambda: {'name': 'TaM'})
+    poller.store.publish('trip_update', make_trip_update_feed(1741687290, [60, 120, 180]))
+
+    payload = client.get('/api/all-data?at=1741687205').get_json()
+    assert payload['feed_timestamps']['trip_update'] == 1741687200
+    assert [row['trip_id'] for row in payload['trip_updates']] == ['T0']
+    assert payload['snapshot_ids'] is None and payload['statistics']['delay_windows'] is None
+    assert client.get('/api/all-data?at=1741687235').get_json()['feed_timestamps']['trip_update'] == 1741687230
+    assert len(client.get('/api/all-data').get_json()['trip_updates']) == 3
+    assert client.get('/api/all-data?at=yesterday').status_code == 400
+
+
+def test_delay_stats_windows(poller, client):
+    poller.delay_stats.add(1741687200, data_routes.decode_scheduled_trip_updates(make_trip_update_feed(1741687200, [60, 120, 600])))
+
+    payload = client.get('/api/stats/delays?window=5m').get_json()
+    assert payload['windows']['5m']['count'] == 3
+    assert payload['windows']['5m']['max'] == 10.0
+    routes = client.get('/api/stats/delays?group=route').get_json()['windows']
+    assert routes['1h']['R1']['count'] == 3
+    assert client.get('/api/stats/delays?window=2h').status_code == 400
+    assert client.get('/api/stats/delays?group=trip').status_code == 400
+
+
+def test_histogram_endpoints(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1741687200, [60, 120, 600]))
+
+    payload = client.get('/api/histograms/delay?bins=0,5,15').get_json()
+    assert payload['data']['counts'] == [2, 1]
+    routes = client.get('/api/histograms/delay-by-route?trip_id=T0,T1').get_json()['data']
+    assert routes == {'R1': {'count': 2, 'average': 1.5, 'max': 2.0}}
+    assert client.get('/api/histograms/delay?bins=5,0').status_code == 400
+    assert client.get('/api/histograms/delay?bins=3&range=10,0').status_code == 400
+    assert client.get('/api/histograms/speed').status_code == 404
+
+
+def test_csv_export_is_streamed_with_filters(poller, client):
+    poller.store.publish('trip_update', make_trip_update_feed(1741687200, [60, 120, 600]))
+
+    response = client.get('/api/trip-updates?format=csv&trip_id=T0,T2&fields=trip_id,delay_minutes')
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'] == 'attachment; filename="trip_updates.csv"'
+    assert response.get_data(as_text=True).splitlines() == ['trip_id,delay_minutes', 'T0,1.0', 'T2,10.0']
+    assert client.get('/api/trip-updates?format=geojson').status_code == 400
+    assert client.get('/api/trip-updates?format=csv&limit=1').status_code == 400
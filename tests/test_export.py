@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import csv
+import io
+import json
+import os
+import sys
+import pyarrow.parquet as pq
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.export import iter_csv, iter_geojson, iter_parquet
+
+ROWS = [
+    {'vehicle_id': 'V1', 'latitude': 43.61, 'longitude': 3.88, 'speed': 8.5},
+    {'vehicle_id': 'V2', 'latitude': None, 'longitude': None, 'speed': None},
+    {'vehicle_id': 'V3', 'latitude': 43.6, 'longitude': 3.87, 'speed': 0.0}
+]
+
+
+def test_csv_is_streamed_in_chunks():
+    chunks = list(iter_csv(ROWS, chunk_rows=2))
+    assert len(chunks) == 2
+    rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert [row['vehicle_id'] for row in rows] == ['V1', 'V2', 'V3']
+    assert rows[1]['speed'] == ''
+
+    assert ''.join(iter_csv(ROWS, fields=('speed', 'vehicle_id'))).splitlines()[:2] == ['speed,vehicle_id', '8.5,V1']
+    assert list(iter_csv([])) == []
+
+
+def test_geojson_features():
+    document = json.loads(''.join(iter_geojson(ROWS, chunk_rows=2)))
+    features = document['features']
+    assert document['type'] == 'FeatureCollection' and len(features) == 3
+    assert features[0]['geometry'] == {'type': 'Point', 'coordinates': [3.88, 43.61]}
+    assert features[0]['properties'] == {'vehicle_id': 'V1', 'speed': 8.5}
+    assert features[1]['geometry'] is None
+    assert json.loads(''.join(iter_geojson([]))) == {'type': 'FeatureCollection', 'features': []}
+
+
+def test_parquet_row_groups():
+    content = b''.join(iter_parquet(ROWS, chunk_rows=2))
+    parquet_file = pq.ParquetFile(io.BytesIO(content))
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.read().to_pylist() == ROWS
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import zipfile
+import pyarrow.parquet as pq
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api import data_routes
+from app.core.feed_archive import FeedArchive
+from app.core.export_jobs import ExportJobs, export_segment
+from app.web.routes import app
+from tests.helpers import make_feed, vehicle
+
+
+# 2025-03-11 10:00 UTC, the archive segments rotate every 12 hours
+START = 1741687200
+
+
+def make_vehicle_content(timestamp, count=3):
+    return make_feed([
+        vehicle(f"V{index}", entity_id=f"vehicle-{index}", trip={'route_id': 'R1'},
+                latitude=43.6 + index / 100, longitude=3.88)
+        for index in range(count)
+    ], timestamp).SerializeToString()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = FeedArchive(str(tmp_path / 'archive'), segment_seconds=12 * 3600, retention_days=None)
+    # Three snapshots on 2025-03-11, two on 2025-03-12
+    for timestamp in (START, START + 30, START + 60, START + 86400, START + 86430):
+        archive.append('tam', 'vehicle_position', timestamp, make_vehicle_content(timestamp))
+    return archive
+
+
+def read_part(path):
+    with gzip.open(path, 'rt', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_export_job_writes_date_partitions(tmp_path, archive):
+    jobs = ExportJobs(str(tmp_path / 'exports'), archive=archive, max_workers=1)
+    job = jobs.submit('tam', 'vehicle_position', START + 30, START + 86400, 'csv')
+    job = jobs.wait(job['job_id'])
+
+    assert job['state'] == 'done'
+    assert (job['segments_done'], job['snapshots'], job['rows']) == (2, 3, 9)
+    assert job['progress'] == 1.0
+    parts = [name for name, _ in jobs.iter_files(job['job_id'])]
+    assert [name.split('/')[0] for name in parts] == ['date=2025-03-11', 'date=2025-03-12']
+
+    rows = read_part(jobs.iter_files(job['job_id'])[0][1])
+    assert [row['feed_timestamp'] for row in rows] == [str(START + 30)] * 3 + [str(START + 60)] * 3
+    assert rows[0]['vehicle_id'] == 'V0' and rows[0]['route_id'] == 'R1' and rows[0]['trip_id'] == 'Unknown'
+    assert rows[0]['bearing'] == '' and rows[0]['current_status'] == 'UNKNOWN'
+
+    # The same export is the same job, not run again
+    assert jobs.submit('tam', 'vehicle_position', START + 30, START + 86400, 'csv')['job_id'] == job['job_id']
+    assert jobs.get(job['job_id'])['snapshots'] == 3
+
+
+def test_export_job_writes_parquet_row_groups(tmp_path, archive):
+    jobs = ExportJobs(str(tmp_path / 'exports'), archive=archive, max_workers=1)
+    job = jobs.wait(jobs.submit('tam', 'vehicle_position', START, START + 86430, 'parquet')['job_id'])
+    assert job['state'] == 'done' and job['rows'] == 15
+
+    # The three snapshots of 3 vehicles are buffered into a single row group
+    parquet_file = pq.ParquetFile(jobs.iter_files(job['job_id'])[0][1])
+    assert parquet_file.metadata.num_row_groups == 1
+    rows = parquet_file.read().to_pylist()
+    assert [row['feed_timestamp'] for row in rows] == [START] * 3 + [START + 30] * 3 + [START + 60] * 3
+    assert rows[0]['vehicle_id'] == 'V0' and rows[0]['trip_id'] == 'Unknown' and rows[0]['bearing'] is None
+    assert rows[4]['latitude'] == pytest.approx(43.61) and rows[4]['current_status'] == 'UNKNOWN'
+
+
+def test_unfinished_job_is_resumed(tmp_path, archive):
+    jobs = ExportJobs(str(tmp_path / 'exports'), archive=archive, max_workers=1)
+    job = jobs.wait(jobs.submit('tam', 'vehicle_position', START, START + 86430, 'csv')['job_id'])
+    first_part, first_path = jobs.iter_files(job['job_id'])[0]
+
+    # Interrupted after the first part was written
+    job_path = os.path.join(jobs.get_job_dir(job['job_id']), 'job.json')
+    with open(job_path) as f:
+        saved = json.load(f)
+    os.remove(jobs.iter_files(job['job_id'])[1][1])
+    saved.update(state='running', parts=[first_part], segments_done=1, snapshots=3, rows=9)
+    with open(job_path, 'w') as f:
+        json.dump(saved, f)
+    modified = os.path.getmtime(first_path)
+
+    restarted = ExportJobs(str(tmp_path / 'exports'), archive=archive, max_workers=1)
+    assert restarted.resume() == [job['job_id']]
+    job = restarted.wait(job['job_id'])
+    assert job['state'] == 'done'
+    assert (job['segments_done'], job['snapshots'], job['rows']) == (2, 5, 15)
+    assert os.path.getmtime(first_path) == modified
+
+
+def test_failed_segment_export_removes_temporary_file(tmp_path, archive):
+    _, segment_path, offset = next(archive.iter_range('tam', 'vehicle_position', START, START))
+    part_path = str(tmp_path / 'exports' / 'date=2025-03-11' / 'part.csv.gz')
+
+    # The second record is past the end of the segment, after the first was written
+    with pytest.raises(Exception):
+        export_segment(segment_path, [offset, 10 ** 9], 'vehicle_position', 'csv', part_path)
+    assert os.listdir(os.path.dirname(part_path)) == []
+
+
+def test_job_id_follows_requested_end(tmp_path, archive):
+    jobs = ExportJobs(str(tmp_path / 'exports'), archive=archive, max_workers=1)
+    end = 2 ** 40
+    job = jobs.wait(jobs.submit('tam', 'vehicle_position', START, end, 'csv')['job_id'])
+
+    assert job['end'] == end and job['snapshots'] == 5
+    assert jobs.submit('tam', 'vehicle_position', START, end, 'csv')['job_id'] == job['job_id']
+
+
+def test_export_job_routes(tmp_path, archive, monkeypatch):
+    jobs = ExportJobs(str(tmp_path / 'exports'), archive=archive, max_workers=1)
+    monkeypatch.setattr(data_routes, 'get_export_jobs', lambda: jobs)
+    monkeypatch.setattr(data_routes, 'get_feed_archive', lambda: archive)
+    client = app.test_client()
+
+    response = client.post('/api/tam/export-jobs', json={
+        'feed': 'vehicle-positions', 'start': START, 'end': START + 86430, 'format': 'csv'
+    })
+    assert response.status_code == 202
+    job_id = response.get_json()['job']['job_id']
+    jobs.wait(job_id)
+    assert client.get(f'/api/export-jobs/{job_id}').get_json()['job']['state'] == 'done'
+    assert [job['job_id'] for job in client.get('/api/export-jobs').get_json()['jobs']] == [job_id]
+
+    response = client.get(f'/api/export-jobs/{job_id}/download')
+    assert response.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as downloaded:
+        names = downloaded.namelist()
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(downloaded.read(names[1])).decode())))
+    assert [name.split('/')[0] for name in names] == ['date=2025-03-11', 'date=2025-03-12']
+    assert len(rows) == 6
+
+    assert client.post('/api/tam/export-jobs', json={'feed': 'alerts', 'start': 0, 'end': 1}).status_code == 400
+    assert client.post('/api/tam/export-jobs', json={'feed': 'trip-updates', 'start': 2, 'end': 1}).status_code == 400
+    assert client.get('/api/export-jobs/unknown').status_code == 404
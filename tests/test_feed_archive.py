@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import feed_poller
+from app.core.feed_archive import FeedArchive, ArchiveStream, iter_segment, read_feed, read_index, read_record
+from app.core.feed_poller import FeedPoller
+from tests.helpers import make_feed, vehicle
+
+
+# Recent timestamps, as the retention policy compares them with the current time
+NOW = int(time.time())
+
+
+def make_content(timestamp, count=20):
+    return make_feed([vehicle(f"V{index}", entity_id=f"vehicle-{index}") for index in range(count)],
+                     timestamp).SerializeToString()
+
+
+def test_append_and_read_back(tmp_path):
+    archive = FeedArchive(str(tmp_path), segment_seconds=60)
+    for timestamp in (NOW, NOW + 10, NOW + 10, NOW + 70):
+        archive.append('tam', 'vehicle_position', timestamp, make_content(timestamp))
+
+    segments = archive.list_segments('tam', 'vehicle_position')
+    # The repeated snapshot is skipped and the last one starts a new segment
+    assert [read_index(path)['timestamp'].tolist() for path in segments] == [[NOW, NOW + 10], [NOW + 70]]
+    assert [timestamp for timestamp, _ in iter_segment(segments[0])] == [NOW, NOW + 10]
+    timestamp, content = read_record(segments[1], int(read_index(segments[1])['offset'][0]))
+    assert (timestamp, content) == (NOW + 70, make_content(NOW + 70))
+    stats = archive.get_stats()
+    assert stats['archived'] == 3
+    assert stats['duplicates'] == 1
+    assert stats['compression_ratio'] > 1
+
+
+def test_truncated_record_is_recovered(tmp_path):
+    archive = FeedArchive(str(tmp_path))
+    archive.append('tam', 'alert', 1000, make_content(1000))
+    archive.append('tam', 'alert', 1010, make_content(1010))
+    segment = archive.list_segments('tam', 'alert')[0]
+    archive._streams[('tam', 'alert')].close()
+    os.truncate(segment, os.path.getsize(segment) - 5)
+
+    stream = ArchiveStream(archive.get_stream_dir('tam', 'alert'))
+    assert stream.last_timestamp == 1000
+    assert [timestamp for timestamp, _ in iter_segment(segment)] == [1000]
+
+
+def test_retention_deletes_old_and_oversized_segments(tmp_path):
+    archive = FeedArchive(str(tmp_path), segment_seconds=10, retention_days=1)
+    for timestamp in (NOW, NOW + 10, NOW + 20):
+        archive.append('tam', 'trip_update', timestamp, make_content(timestamp))
+    stream = archive._streams[('tam', 'trip_update')]
+
+    assert archive.apply_retention(stream, now=NOW + 15 + 86400) == 2
+    assert len(archive.list_segments('tam', 'trip_update')) == 1
+
+    archive.max_bytes = 1
+    archive.append('tam', 'trip_update', NOW + 30, make_content(NOW + 30))
+    # The segment being written is kept whatever its size
+    segments = archive.list_segments('tam', 'trip_update')
+    assert [read_index(path)['timestamp'].tolist() for path in segments] == [[NOW + 30]]
+
+
+def test_nearest_and_range_span_segments(tmp_path):
+    archive = FeedArchive(str(tmp_path), segment_seconds=60)
+    for timestamp in (NOW, NOW + 30, NOW + 70, NOW + 100):
+        archive.append('tam', 'vehicle_position', timestamp, make_content(timestamp))
+    archive.flush()
+
+    assert [archive.find_nearest('tam', 'vehicle_position', timestamp)[0]
+            for timestamp in (NOW - 50, NOW + 10, NOW + 55, NOW + 86, NOW + 500)] == [NOW, NOW, NOW + 70, NOW + 100, NOW + 100]
+    assert archive.find_nearest('tam', 'trip_update', NOW) is None
+
+    records = list(archive.iter_range('tam', 'vehicle_position', NOW + 20, NOW + 80))
+    assert [timestamp for timestamp, _, _ in records] == [NOW + 30, NOW + 70]
+    timestamp, feed = read_feed(*records[1][1:])
+    assert (timestamp, feed.header.timestamp) == (NOW + 70, NOW + 70)
+    assert archive.get_timeline('tam', 'vehicle_position')['last_timestamp'] == NOW + 100
+
+
+def test_poller_archives_published_feeds(tmp_path, monkeypatch):
+    file_paths = {feed_type: str(tmp_path / f"{feed_type}.pb") for feed_type in feed_poller.FEED_TYPES}
+    monkeypatch.setattr(feed_poller, 'FILE_PATHS', file_paths)
+    monkeypatch.setattr(feed_poller, 'get_current_source', lambda: {'name': 'Local Files', 'use_local_files': True})
+    with open(file_paths['alert'], 'wb') as f:
+        f.write(make_content(1234))
+
+    archive = FeedArchive(str(tmp_path / 'archive'))
+    FeedPoller(archive=archive).poll_once()
+    archive.flush()
+
+    segments = archive.list_segments('local-files', 'alert')
+    assert [list(iter_segment(path)) for path in segments] == [[(1234, make_content(1234))]]
+
+
+def test_concurrent_submits_start_one_writer(tmp_path):
+    archive = FeedArchive(str(tmp_path), retention_days=None)
+    writers_before = {thread for thread in threading.enumerate() if thread.name == 'gtfs-rt-archive'}
+    barrier = threading.Barrier(8)
+
+    def submit(source_id):
+        barrier.wait()
+        for timestamp in range(1000, 1050, 10):
+            assert archive.submit(source_id, 'alert', timestamp, make_content(timestamp, count=2))
+
+    threads = [threading.Thread(target=submit, args=(f"source-{index}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    archive.flush()
+
+    writers = {thread for thread in threading.enumerate() if thread.name == 'gtfs-rt-archive'} - writers_before
+    assert len(writers) == 1
+    for index in range(8):
+        records = [record for path in archive.list_segments(f"source-{index}", 'alert') for record in iter_segment(path)]
+        assert [timestamp for timestamp, _ in records] == [1000, 1010, 1020, 1030, 1040]
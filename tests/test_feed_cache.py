@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.feed_cache import LRUCache, cached_process
+from app.core.gtfs_rt_reader import read_gtfs_rt_file
+from tests.helpers import make_feed
+
+
+def write_feed(path, timestamp):
+    feed = make_feed(timestamp=timestamp)
+    with open(path, 'wb') as f:
+        f.write(feed.SerializeToString())
+    # Make sure the rewrite is visible even on coarse mtime filesystems
+    os.utime(path, ns=(timestamp * 10**9, timestamp * 10**9))
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_respects_max_weight():
+    cache = LRUCache(10, max_weight=100)
+    cache.put('a', 'x', weight=60)
+    cache.put('b', 'y', weight=60)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 'y'
+
+
+def test_read_gtfs_rt_file_reuses_parsed_feed(tmp_path):
+    path = str(tmp_path / 'TripUpdate.pb')
+    write_feed(path, 1000)
+
+    first = read_gtfs_rt_file(path)
+    assert read_gtfs_rt_file(path) is first
+
+    write_feed(path, 2000)
+    second = read_gtfs_rt_file(path)
+    assert second is not first
+    assert second.header.timestamp == 2000
+
+
+def test_cached_process_runs_once_per_feed():
+    calls = []
+
+    def processor(feed):
+        calls.append(feed)
+        return [feed.header.timestamp]
+
+    feed = make_feed(timestamp=42)
+
+    assert cached_process(processor, feed) == [42]
+    assert cached_process(processor, feed) == [42]
+    assert len(calls) == 1
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.feed_fetcher import FeedFetcher
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(2)
+        if self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = b'etag-body'
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path == '/missing':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = b'feed:' + self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_all_downloads_every_feed(server):
+    fetcher = FeedFetcher()
+    results = fetcher.fetch_all({
+        'trip_update': f"{server}/trip",
+        'alert': f"{server}/missing"
+    })
+
+    assert results['trip_update'].ok
+    assert results['trip_update'].content == b'feed:/trip'
+    assert not results['alert'].ok
+    assert results['alert'].status_code == 404
+
+
+def test_fetch_all_applies_total_deadline(server):
+    fetcher = FeedFetcher(total_deadline=0.5)
+    start = time.monotonic()
+    results = fetcher.fetch_all({
+        'trip_update': f"{server}/trip",
+        'vehicle_position': f"{server}/slow"
+    })
+
+    assert time.monotonic() - start < 1.5
+    assert results['trip_update'].ok
+    assert results['vehicle_position'].error == 'Deadline exceeded'
+
+
+def test_conditional_fetch_uses_etag(server):
+    fetcher = FeedFetcher()
+    first = fetcher.fetch(f"{server}/etag", conditional=True)
+    second = fetcher.fetch(f"{server}/etag", conditional=True)
+
+    assert first.ok and not first.not_modified
+    assert second.ok and second.not_modified
+    assert second.status_code == 304
+
+
+def test_conditional_fetch_detects_identical_body(server):
+    fetcher = FeedFetcher()
+    first = fetcher.fetch(f"{server}/trip", conditional=True)
+    second = fetcher.fetch(f"{server}/trip", conditional=True)
+    fetcher.forget(f"{server}/trip")
+    third = fetcher.fetch(f"{server}/trip", conditional=True)
+
+    assert not first.not_modified
+    assert second.not_modified and second.content is None
+    assert not third.not_modified
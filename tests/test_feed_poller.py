@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import feed_poller
+from app.core.feed_fetcher import FetchResult
+from app.core.feed_poller import FeedPoller
+from app.core.snapshot_store import SnapshotStore
+from tests.helpers import make_feed as build_feed, vehicle
+
+
+def make_feed(timestamp):
+    return build_feed([vehicle('V1', entity_id='vehicle-1')], timestamp)
+
+
+@pytest.fixture
+def local_source(tmp_path, monkeypatch):
+    file_paths = {
+        feed_type: str(tmp_path / f"{feed_type}.pb")
+        for feed_type in feed_poller.FEED_TYPES
+    }
+    monkeypatch.setattr(feed_poller, 'FILE_PATHS', file_paths)
+    monkeypatch.setattr(feed_poller, 'get_current_source', lambda: {
+        'name': 'Local Files',
+        'use_local_files': True
+    })
+    return file_paths
+
+
+def test_store_publish_increments_snapshot_id():
+    store = SnapshotStore()
+    first = store.publish('alert', make_feed(100))
+    second = store.publish('alert', make_feed(200))
+
+    assert second.snapshot_id > first.snapshot_id
+    assert store.get('alert') is second
+    assert store.get_feed('alert').header.timestamp == 200
+    assert store.get('trip_update') is None
+
+
+def test_poll_once_publishes_local_files(local_source):
+    with open(local_source['vehicle_position'], 'wb') as f:
+        f.write(make_feed(1234).SerializeToString())
+
+    poller = FeedPoller()
+    results = poller.poll_once()
+
+    assert results['vehicle_position'] is True
+    assert results['trip_update'] is False
+    assert poller.store.get('vehicle_position').feed_timestamp == 1234
+    assert poller.store.get('trip_update') is None
+
+
+class StaticFetcher:
+    def __init__(self, content):
+        self.content = content
+
+    def forget(self, url):
+        pass
+
+    def fetch_all(self, urls, conditional=False):
+        return {
+            feed_type: FetchResult(url, 200, content=self.content)
+            for feed_type, url in urls.items()
+        }
+
+
+def test_poll_once_skips_same_header_timestamp(local_source, monkeypatch):
+    monkeypatch.setattr(feed_poller, 'get_current_source', lambda: {
+        'name': 'Remote',
+        'use_local_files': False,
+        'alert_url': 'http://example.com/alert.pb'
+    })
+    poller = FeedPoller(fetcher=StaticFetcher(make_feed(1000).SerializeToString()))
+
+    poller.poll_once()
+    first = poller.store.get('alert')
+    poller.poll_once()
+
+    assert poller.store.get('alert') is first
+    metrics = poller.get_metrics()
+    assert metrics['alert']['published'] == 1
+    assert metrics['alert']['skipped_same_timestamp'] == 1
+    assert metrics['alert']['skip_rate'] == 0.5
+
+
+def test_background_thread_signals_ready(local_source):
+    poller = FeedPoller(interval=60)
+    poller.start()
+    try:
+        assert poller.wait_until_ready(5)
+    finally:
+        poller.stop(5)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import zipfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.gtfs_ingest import MISSING, ingest_gtfs
+from app.core.static_gtfs import load_static_gtfs
+
+TABLES = {
+    'routes.txt': 'route_id,route_short_name,route_type\nR1,1,3\n',
+    'trips.txt': 'route_id,service_id,trip_id\nR1,S1,T1\nR1,S1,T2\n',
+    'stops.txt': 'stop_id,stop_name,stop_lat,stop_lon\nA,Stop A,43.6,3.8\nB,Stop B,43.7,3.9\n',
+    'calendar_dates.txt': 'service_id,date,exception_type\nS1,20250311,1\n',
+    # T2 comes first and T1 rows are out of order, one row belongs to no known trip
+    'stop_times.txt': (
+        'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+        'T2,24:10:00,24:10:30,A,1\n'
+        'T1,08:05:00,08:05:00,B,2\n'
+        'T1,08:00:00,,A,1\n'
+        'T9,08:00:00,08:00:00,A,1\n'
+    )
+}
+
+
+@pytest.fixture
+def gtfs_zip(tmp_path):
+    gtfs_dir = tmp_path / 'gtfs'
+    gtfs_dir.mkdir()
+    with zipfile.ZipFile(gtfs_dir / 'gtfs.zip', 'w') as archive:
+        for name, content in TABLES.items():
+            archive.writestr(name, content)
+    return gtfs_dir
+
+
+def test_ingest_streams_stop_times_in_chunks(gtfs_zip, tmp_path):
+    arrays, strings, stats = ingest_gtfs(str(gtfs_zip / 'gtfs.zip'), str(tmp_path), chunk_rows=2)
+
+    assert stats['stop_times'] == 3
+    assert stats['skipped_stop_times'] == 1
+    assert stats['rows_per_second'] > 0
+    assert strings['trip_ids'] == ['T1', 'T2']
+    assert arrays['stop_time_trip_offsets'].tolist() == [0, 2, 3]
+    assert arrays['stop_time_sequences'].tolist() == [1, 2, 1]
+    assert arrays['stop_time_arrivals'].tolist() == [28800, 29100, 87000]
+    assert arrays['stop_time_departures'].tolist() == [MISSING, 29100, 87030]
+
+
+def test_static_gtfs_is_loaded_from_zip(gtfs_zip):
+    model = load_static_gtfs(str(gtfs_zip))
+
+    assert model.get_counts()['stop_times'] == 3
+    stop_times = model.get_stop_times('T1')
+    assert stop_times['stop_sequences'].tolist() == [1, 2]
+    assert [model.strings['stop_id'][code] for code in stop_times['stop_codes']] == ['A', 'B']
+    assert model.get_stop_times('T9') is None
+
+    # The second load maps the binary cache written by the first one
+    cached = load_static_gtfs(str(gtfs_zip))
+    assert cached.get_stop_times('T2')['departures'].tolist() == [87030]
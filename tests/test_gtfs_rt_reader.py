@@ -6,7 +6,8 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.core.gtfs_rt_reader import read_gtfs_rt_file, convert_to_dict
+from app.core.gtfs_rt_reader import read_gtfs_rt_file, convert_to_dict, read_header_timestamp
+from tests.helpers import make_feed
 
 
 # This is a placeholder for future test implementation
@@ -18,3 +19,10 @@ def test_read_gtfs_rt_file():
 def test_convert_to_dict():
     # TODO: Implement proper tests
     pass
+
+
+def test_read_header_timestamp():
+    feed = make_feed([{'id': '1'}], 1741687200)
+
+    assert read_header_timestamp(feed.SerializeToString()) == 1741687200
+    assert read_header_timestamp(b'') is None
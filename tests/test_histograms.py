@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+from datetime import timezone
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from tests.helpers import make_feed, stop_time_update, trip_update, vehicle
+from app.core.columnar import decode_trip_updates, decode_vehicle_columns
+from app.core.histograms import delay_by_hour, delay_by_route, delay_histogram, vehicle_status_counts
+
+
+def make_trip_columns(updates):
+    return decode_trip_updates(make_feed([
+        trip_update(f"T{index}", [stop_time_update(f"S{index}", delay=delay, time=departure)],
+                    entity_id=f"trip-{index}", route_id=route_id)
+        for index, (route_id, delay, departure) in enumerate(updates)
+    ]))
+
+
+# 2025-03-11 08:00 and 09:30 UTC
+COLUMNS = make_trip_columns([('R1', 60, 1741680000), ('R1', 300, 1741680000), ('R2', -120, 1741685400),
+                             ('R2', None, 1741685400), ('R3', 3600, 1741685400)])
+
+
+def test_delay_histogram_bins():
+    histogram = delay_histogram(COLUMNS, bins=(-5, 0, 5, 10))
+    assert histogram == {'edges': [-5.0, 0.0, 5.0, 10.0], 'counts': [1, 1, 1], 'below': 0, 'above': 1, 'unknown': 1}
+
+    histogram = delay_histogram(COLUMNS, bins=2, value_range=(0, 10))
+    assert (histogram['edges'], histogram['counts']) == ([0.0, 5.0, 10.0], [1, 1])
+    assert sum(delay_histogram(COLUMNS, bins=4)['counts']) == 4
+
+
+def test_delay_aggregates_per_route_and_hour():
+    routes = delay_by_route(COLUMNS)
+    assert routes['R1'] == {'count': 2, 'average': 3.0, 'max': 5.0}
+    assert routes['R2'] == {'count': 1, 'average': -2.0, 'max': -2.0}
+
+    hours = delay_by_hour(COLUMNS, timezone.utc)
+    assert (hours['counts'][8], hours['average'][8]) == (2, 3.0)
+    assert (hours['counts'][9], hours['average'][9]) == (2, 29.0)
+    assert hours['average'][0] is None
+
+
+def test_vehicle_status_counts():
+    columns = decode_vehicle_columns(make_feed([
+        vehicle(f"V{index}", entity_id=f"vehicle-{index}", **({} if status is None else {'current_status': status}))
+        for index, status in enumerate([1, 1, 2, None])
+    ]))
+
+    assert vehicle_status_counts(columns) == {'STOPPED_AT': 2, 'IN_TRANSIT_TO': 1, 'UNKNOWN': 1}
+    assert vehicle_status_counts(columns, np.array([0, 2])) == {'STOPPED_AT': 1, 'IN_TRANSIT_TO': 1}
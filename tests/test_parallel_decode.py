@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.transit import gtfs_realtime_pb2
+from app.core import feed_poller
+from app.core.columnar import concat_columns, decode_trip_updates, decode_vehicle_columns
+from app.core.feed_cache import cached_process
+from app.core.feed_poller import FeedPoller
+from app.core.parallel_decode import ParallelDecoder, split_feed
+from tests.helpers import make_feed as build_feed, stop_time_update, trip_update, vehicle
+
+
+def make_feed(count):
+    entities = []
+    for index in range(count):
+        entity = trip_update(f"T{index % 7}", [stop_time_update(f"S{index % 5}", delay=index)],
+                             entity_id=f"entity-{index}", route_id=f"R{index % 3}")
+        entity['vehicle'] = vehicle(f"V{index}", latitude=43.6, longitude=3.8 + index / 1000)['vehicle']
+        entities.append(entity)
+    return build_feed(entities, 1000)
+
+
+def assert_same_columns(actual, expected):
+    for table_name, _ in type(expected).TABLES:
+        assert getattr(actual, table_name) == getattr(expected, table_name)
+    for name in type(expected).COLUMNS:
+        np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name))
+
+
+def test_split_feed_keeps_header_and_entity_order():
+    content = make_feed(10).SerializeToString()
+    shards = [gtfs_realtime_pb2.FeedMessage.FromString(shard) for shard in split_feed(content, 3)]
+
+    assert [len(shard.entity) for shard in shards] == [3, 3, 4]
+    assert all(shard.header.timestamp == 1000 for shard in shards)
+    assert [entity.id for shard in shards for entity in shard.entity] == [f"entity-{index}" for index in range(10)]
+    assert split_feed(content[:-3], 3) == [content[:-3]]
+
+
+def test_concatenated_shards_match_whole_feed():
+    feed = make_feed(50)
+    shards = [gtfs_realtime_pb2.FeedMessage.FromString(shard) for shard in split_feed(feed.SerializeToString(), 4)]
+
+    assert_same_columns(concat_columns([decode_trip_updates(shard) for shard in shards]), decode_trip_updates(feed))
+    assert_same_columns(concat_columns([decode_vehicle_columns(shard) for shard in shards]),
+                        decode_vehicle_columns(feed))
+
+
+@pytest.fixture(scope='module')
+def decoder():
+    decoder = ParallelDecoder(max_workers=2, shard_min_bytes=256)
+    yield decoder
+    decoder.shutdown()
+
+
+def test_worker_processes_decode_columns(decoder):
+    feed = make_feed(200)
+    assert_same_columns(decoder.decode('trip_update', feed.SerializeToString()), decode_trip_updates(feed))
+
+
+def test_poller_publishes_decoded_feeds(decoder, tmp_path, monkeypatch):
+    file_paths = {feed_type: str(tmp_path / f"{feed_type}.pb") for feed_type in feed_poller.FEED_TYPES}
+    monkeypatch.setattr(feed_poller, 'FILE_PATHS', file_paths)
+    monkeypatch.setattr(feed_poller, 'get_current_source', lambda: {'name': 'Local Files', 'use_local_files': True})
+    with open(file_paths['vehicle_position'], 'wb') as f:
+        f.write(make_feed(20).SerializeToString())
+
+    poller = FeedPoller(decoder=decoder)
+    poller.poll_once()
+    feed = poller.store.get_feed('vehicle_position')
+
+    # The columns decoded by the workers are served without decoding again
+    columns = cached_process(decode_vehicle_columns, feed)
+    assert columns is cached_process(decode_vehicle_columns, feed)
+    assert_same_columns(columns, decode_vehicle_columns(feed))
+    assert poller.get_metrics()['vehicle_position']['published'] == 1
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from tests.helpers import make_feed, stop_time_update, trip_update
+from app.core.columnar import decode_trip_updates
+from app.core.rolling_stats import RollingDelayStats, histogram_quantiles, DELAY_BIN_EDGES, DELAY_BINS
+
+
+def make_columns(updates):
+    return decode_trip_updates(make_feed([
+        trip_update(f"T{index}", [stop_time_update(stop_id, delay=delay)], entity_id=f"trip-{index}", route_id=route_id)
+        for index, (route_id, stop_id, delay) in enumerate(updates)
+    ]))
+
+
+def test_windows_aggregate_and_expire():
+    stats = RollingDelayStats({'short': (120, 60), 'long': (3600, 600)})
+    stats.add(1000, make_columns([('R1', 'S1', 60), ('R1', 'S2', 180), ('R2', 'S1', None)]))
+    stats.add(1030, make_columns([('R1', 'S1', 120), ('R2', 'S1', -60)]))
+
+    summary = stats.get_summary('short')
+    assert (summary['snapshots'], summary['count'], summary['average'], summary['max']) == (2, 4, 1.2, 3.0)
+    # Quantiles are interpolated within the one-minute bins
+    routes = stats.get_group('short', 'route')
+    assert routes['R1'] == {'count': 3, 'average': 2.0, 'median': 2.5, 'p90': 3.0, 'p95': 3.0, 'max': 3.0}
+    assert routes['R2']['count'] == 1
+
+    # Both earlier snapshots leave the short window, but stay in the long one
+    stats.add(1250, make_columns([('R3', 'S3', 600)]))
+    assert stats.get_summary('short')['count'] == 1
+    assert stats.get_summary('short')['max'] == 10.0
+    assert list(stats.get_group('short', 'route')) == ['R3']
+    assert stats.get_summary('long')['count'] == 5
+    assert stats.get_summary('long')['max'] == 10.0
+
+    stats.clear()
+    assert stats.get_summary('long') == {'count': 0, 'average': None, 'median': None,
+                                         'p90': None, 'p95': None, 'max': None, 'snapshots': 0}
+
+
+def test_histogram_quantiles_interpolate_within_bins():
+    delays = np.array([30, 90, 90, 150, 5000])
+    histogram = np.bincount(np.searchsorted(DELAY_BIN_EDGES, delays, side='right'), minlength=DELAY_BINS)
+    median = histogram_quantiles(histogram[None, :], np.array([len(delays)]), 0.5)[0]
+    assert 60 <= median < 120
+    # Delays beyond the last edge are reported at that edge
+    assert histogram_quantiles(histogram[None, :], np.array([len(delays)]), 1.0)[0] == DELAY_BIN_EDGES[-1]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.row_query import decode_cursor, encode_cursor, filter_positions, index_codes, index_rows, project_rows
+
+
+ROWS = [
+    {'route_id': 'R1', 'trip_id': 'T1', 'affected_entities': []},
+    {'route_id': 'R2', 'trip_id': 'T2', 'affected_entities': [{'stop_id': 'S1'}]},
+    {'route_id': 'R1', 'trip_id': 'T3', 'affected_entities': [{'stop_id': 'S1'}, {'route_id': 'R2'}]}
+]
+
+
+def test_filters_are_or_within_a_field_and_across_fields():
+    index = index_rows(ROWS, ('route_id', 'trip_id', 'stop_id'), 'affected_entities')
+
+    assert filter_positions(index, {'route_id': ('R2',)}).tolist() == [1, 2]
+    assert filter_positions(index, {'trip_id': ('T1', 'T3')}).tolist() == [0, 2]
+    assert filter_positions(index, {'route_id': ('R1',), 'stop_id': ('S1',)}).tolist() == [2]
+    assert filter_positions(index, {'route_id': ('R9',)}).tolist() == []
+    assert filter_positions(index, {}, np.array([True, False, True])).tolist() == [0, 2]
+
+
+def test_index_codes_matches_index_rows():
+    codes = np.array([1, 0, 1, 2], dtype=np.int32)
+    index = index_codes(codes, ['a', 'b', 'c', 'unused'])
+
+    assert {value: positions.tolist() for value, positions in index.items()} == {'a': [1], 'b': [0, 2], 'c': [3]}
+
+
+def test_projection_and_cursor():
+    assert project_rows(ROWS, ('trip_id', 'missing'))[0] == {'trip_id': 'T1'}
+    assert project_rows(ROWS, None) is ROWS
+
+    assert decode_cursor(encode_cursor(42, 1000)) == (42, 1000)
+    assert decode_cursor('not a cursor') is None
+    assert decode_cursor(encode_cursor(1, -5)) is None
+    assert decode_cursor(encode_cursor(-1, 0)) is None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zoneinfo import ZoneInfo
+from app.core.columnar import decode_trip_updates
+from app.core.schedule_delays import apply_schedule_delays, get_service_day_start
+from app.core.static_gtfs import StaticGTFS
+from tests.helpers import make_feed as build_feed, stop_time_update, trip_update
+
+PARIS = ZoneInfo('Europe/Paris')
+
+
+@pytest.fixture
+def static_gtfs(tmp_path):
+    (tmp_path / 'routes.txt').write_text('route_id,route_type\nR1,3\n')
+    (tmp_path / 'trips.txt').write_text('route_id,service_id,trip_id\nR1,S1,T1\n')
+    (tmp_path / 'stops.txt').write_text('stop_id,stop_lat,stop_lon\nA,43.6,3.8\nB,43.7,3.9\n')
+    (tmp_path / 'stop_times.txt').write_text(
+        'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+        'T1,08:00:00,08:01:00,A,1\n'
+        'T1,24:10:00,,B,2\n'
+    )
+    return StaticGTFS(str(tmp_path))
+
+
+def make_feed(start_date=None):
+    day_start = get_service_day_start(20250311, PARIS)
+    trip = {'start_date': start_date} if start_date else {}
+    return build_feed([trip_update('T1', [
+        # Departure 3 minutes late, matched on stop_sequence
+        stop_time_update(stop_sequence=1, time=day_start + 8 * 3600 + 240),
+        # Arrival after midnight 1 minute early, matched on stop_id
+        stop_time_update('B', time=day_start + 24 * 3600 + 540, event='arrival'),
+        # Delay given by the producer is kept
+        stop_time_update(stop_sequence=2, delay=30, time=day_start, event='arrival')
+    ], **trip)], day_start + 8 * 3600)
+
+
+@pytest.mark.parametrize('start_date', [None, '20250311'])
+def test_delays_are_computed_from_schedule(static_gtfs, start_date):
+    feed = make_feed(start_date)
+    columns = apply_schedule_delays(decode_trip_updates(feed), static_gtfs, feed.header.timestamp, PARIS)
+
+    assert columns.delay_seconds.tolist() == [180, -60, 30]
+    assert columns.delay_known.all()
+
+
+def test_unknown_trips_keep_unknown_delay(static_gtfs):
+    feed = make_feed()
+    feed.entity[0].trip_update.trip.trip_id = 'T9'
+    columns = apply_schedule_delays(decode_trip_updates(feed), static_gtfs, feed.header.timestamp, PARIS)
+
+    assert columns.delay_seconds.tolist() == [0, 0, 30]
+    assert columns.delay_known.tolist() == [False, False, True]
+
+
+def test_undated_trips_use_active_service_days(static_gtfs, tmp_path):
+    # The trip only runs on the day before the feed
+    (tmp_path / 'calendar_dates.txt').write_text('service_id,date,exception_type\nS1,20250310,1\n')
+    feed = make_feed()
+    columns = apply_schedule_delays(
+        decode_trip_updates(feed), StaticGTFS(str(tmp_path)), feed.header.timestamp, PARIS
+    )
+    assert columns.delay_seconds.tolist() == [86400 + 180, 86400 - 60, 30]
+
+    # A trip running on none of the candidate days keeps an unknown delay
+    (tmp_path / 'calendar_dates.txt').write_text('service_id,date,exception_type\nS1,20250301,1\n')
+    columns = apply_schedule_delays(
+        decode_trip_updates(feed), StaticGTFS(str(tmp_path)), feed.header.timestamp, PARIS
+    )
+    assert columns.delay_known.tolist() == [False, False, True]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api import data_routes
+from app.core import source_pollers
+from app.core.feed_archive import FeedArchive
+from app.core.feed_fetcher import FetchResult
+from app.core.feed_poller import FeedPoller
+from app.core.source_pollers import SourcePollers
+from app.utils.config_manager import get_source_id
+from app.web.routes import app
+from tests.helpers import make_feed as build_feed, vehicle
+
+
+def make_feed(timestamp, vehicle_id):
+    return build_feed([vehicle(vehicle_id, entity_id=vehicle_id)], timestamp)
+
+
+class UrlFetcher:
+    """
+    Serve a feed per URL, blocking on the URLs whose event is not set
+    """
+    def __init__(self, contents, gates=None):
+        self.contents = contents
+        self.gates = gates or {}
+
+    def forget(self, url):
+        pass
+
+    def fetch_all(self, urls, conditional=False):
+        for url in urls.values():
+            if url in self.gates:
+                self.gates[url].wait(5)
+        return {
+            feed_type: FetchResult(url, 200, content=self.contents[url])
+            for feed_type, url in urls.items()
+        }
+
+
+SOURCES = {
+    'north': {'name': 'North', 'vehicle_position_url': 'http://north/vp.pb', 'poll_interval': 5},
+    'south': {'name': 'South', 'vehicle_position_url': 'http://south/vp.pb', 'poll_interval': 60}
+}
+
+
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(source_pollers, 'SOURCES_DIR', str(tmp_path))
+    return UrlFetcher({
+        'http://north/vp.pb': make_feed(100, 'N1').SerializeToString(),
+        'http://south/vp.pb': make_feed(200, 'S1').SerializeToString()
+    })
+
+
+def test_source_id_is_derived_from_the_name():
+    assert get_source_id({'name': 'Montpellier TaM'}) == 'montpellier-tam'
+    assert get_source_id({'name': 'Bordeaux TBM', 'id': 'tbm'}) == 'tbm'
+
+
+def test_source_ids_stay_inside_their_directories(tmp_path):
+    # Ids are used as directory names, so they never escape data/
+    assert get_source_id({'name': 'X', 'id': '../../../../tmp/x'}) == 'tmp-x'
+    assert get_source_id({'name': 'Cron', 'id': '/etc/cron.d'}) == 'etc-cron-d'
+    assert get_source_id({'name': 'Dots', 'id': '..'}) == 'dots'
+
+    with pytest.raises(ValueError):
+        source_pollers.get_source_file_paths('../x')
+    with pytest.raises(ValueError):
+        FeedArchive(str(tmp_path)).get_stream_dir('/etc', 'alert')
+
+
+def test_sources_have_separate_stores(fetcher, tmp_path):
+    pollers = SourcePollers(SOURCES, fetcher=fetcher)
+    pollers.refresh()
+
+    assert pollers.get('north').store.get('vehicle_position').feed_timestamp == 100
+    assert pollers.get('south').store.get('vehicle_position').feed_timestamp == 200
+    assert pollers.get('west') is None
+    assert os.path.exists(tmp_path / 'north' / 'VehiclePosition.pb')
+
+
+def test_slow_source_does_not_block_others(fetcher):
+    gate = threading.Event()
+    fetcher.gates['http://south/vp.pb'] = gate
+    pollers = SourcePollers(SOURCES, fetcher=fetcher)
+    pollers.sync()
+    try:
+        assert pollers.poll_due(now=0) == 5
+        assert pollers.get('north').wait_until_ready(5)
+        assert not pollers.get('south').wait_until_ready(0)
+        # The source still being polled is not submitted again
+        pollers.poll_due(now=100)
+    finally:
+        gate.set()
+    assert pollers.get('south').wait_until_ready(5)
+
+
+def test_current_source_reuses_its_poller(fetcher, monkeypatch):
+    current = FeedPoller(fetcher=fetcher, source=SOURCES['south'])
+    monkeypatch.setattr(source_pollers, 'get_current_source', lambda: SOURCES['south'])
+    pollers = SourcePollers(SOURCES, fetcher=fetcher, current_poller=current)
+
+    assert pollers.get('south') is current
+    assert pollers.get('north') is not current
+    # Only the other sources are scheduled, the current-source poller polls itself
+    assert pollers.poll_due(now=0) == 5
+    assert pollers.get('north').wait_until_ready(5)
+    assert current.store.get('vehicle_position') is None
+
+    monkeypatch.setattr(source_pollers, 'get_current_source', lambda: SOURCES['north'])
+    synced = pollers.sync()
+    assert synced['north'] is current and synced['south'] is not current
+
+
+def test_source_routes(fetcher, monkeypatch):
+    pollers = SourcePollers(SOURCES, fetcher=fetcher)
+    pollers.refresh()
+    monkeypatch.setattr(data_routes, 'get_source_pollers', lambda: pollers)
+    client = app.test_client()
+
+    rows = client.get('/api/south/vehicle-positions').get_json()['vehicle_positions']
+    assert [row['vehicle_id'] for row in rows] == ['S1']
+    sources = client.get('/api/sources').get_json()['sources']
+    assert [source['id'] for source in sources] == ['north', 'south']
+    assert client.get('/api/west/vehicle-positions').status_code == 404
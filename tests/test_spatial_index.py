@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from app.core.spatial_index import GridIndex, haversine_m
+
+
+@pytest.fixture
+def points():
+    random = np.random.default_rng(1)
+    latitudes = 43.6 + random.uniform(-0.1, 0.1, 2000)
+    longitudes = 3.88 + random.uniform(-0.1, 0.1, 2000)
+    latitudes[5] = np.nan
+    return latitudes, longitudes
+
+
+def test_bbox_matches_full_scan(points):
+    latitudes, longitudes = points
+    index = GridIndex(latitudes, longitudes)
+
+    expected = np.flatnonzero((latitudes >= 43.58) & (latitudes <= 43.63) &
+                              (longitudes >= 3.85) & (longitudes <= 3.9))
+    assert index.within_bbox(43.58, 3.85, 43.63, 3.9).tolist() == expected.tolist()
+    assert len(index) == 1999
+
+
+def test_radius_and_nearest_match_full_scan(points):
+    latitudes, longitudes = points
+    index = GridIndex(latitudes, longitudes)
+    distances = haversine_m(43.61, 3.87, latitudes, longitudes)
+    distances[np.isnan(distances)] = np.inf
+
+    indices, found = index.within_radius(43.61, 3.87, 800)
+    assert sorted(indices.tolist()) == np.flatnonzero(distances <= 800).tolist()
+    assert np.all(np.diff(found) >= 0)
+
+    nearest, _ = index.nearest(43.61, 3.87, 5)
+    assert nearest.tolist() == np.argsort(distances)[:5].tolist()
+
+
+def test_empty_index():
+    index = GridIndex([], [])
+    assert len(index.within_bbox(0, 0, 1, 1)) == 0
+    assert len(index.nearest(0, 0, 3)[0]) == 0
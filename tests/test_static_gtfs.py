@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from app.core import static_gtfs
+from app.core.static_gtfs import StaticGTFS, get_static_gtfs, load_static_gtfs
+
+
+@pytest.fixture
+def gtfs_dir(tmp_path):
+    (tmp_path / 'routes.csv').write_text(
+        'route_id,agency_id,route_short_name,route_long_name,route_type,route_color,route_text_color\n'
+        '7-1,TAM,T1,Mosson - Odysseum,0,005CA9,FFFFFF\n'
+    )
+    (tmp_path / 'trips.csv').write_text(
+        'route_id,service_id,trip_id,trip_headsign,direction_id\n'
+        '7-1,06_1,T-A,MOSSON,1\n'
+        '7-1,06_1,T-B,ODYSSEUM,0\n'
+    )
+    (tmp_path / 'stops.csv').write_text(
+        'stop_id,stop_code,stop_name,stop_lat,stop_lon,location_type,parent_station\n'
+        '5,21,Gare Saint-Roch,43.604115,3.878247,,\n'
+    )
+    (tmp_path / 'calendar_dates.csv').write_text(
+        'service_id,date,exception_type\n'
+        '06_1,20250312,1\n'
+        '06_1,20250311,1\n'
+        '06_1,20250312,2\n'
+    )
+    return tmp_path
+
+
+def test_tables_are_indexed(gtfs_dir):
+    model = StaticGTFS(str(gtfs_dir))
+
+    assert model.get_counts() == {'routes': 1, 'trips': 2, 'stops': 1, 'services': 1, 'stop_times': 0}
+    assert model.trips['T-A'].route is model.routes['7-1']
+    assert model.trips['T-A'].service_id is model.trips['T-B'].service_id
+    assert model.stops['5'].latitude == 43.604115
+    assert model.routes['7-1'].color == '005CA9'
+
+
+def test_get_route_falls_back_to_trip(gtfs_dir):
+    model = StaticGTFS(str(gtfs_dir))
+
+    assert model.get_route('7-1').short_name == 'T1'
+    assert model.get_route('Unknown', 'T-B').route_id == '7-1'
+    assert model.get_route('Unknown', 'T-X') is None
+
+
+def test_service_dates(gtfs_dir):
+    model = StaticGTFS(str(gtfs_dir))
+
+    assert model.is_service_active('06_1', 20250311)
+    assert not model.is_service_active('06_1', 20250312)
+    assert not model.is_service_active('missing', 20250311)
+
+
+def test_weekly_calendar_with_exceptions(gtfs_dir):
+    (gtfs_dir / 'calendar.csv').write_text(
+        'service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n'
+        'WK,1,1,1,1,1,0,0,20250301,20250331\n'
+    )
+    with open(gtfs_dir / 'calendar_dates.csv', 'a') as f:
+        f.write('WK,20250311,2\nWK,20250315,1\n')
+
+    for model in (load_static_gtfs(str(gtfs_dir)), load_static_gtfs(str(gtfs_dir))):
+        # Monday, a removed Tuesday, an added Saturday, a Sunday, and after the end date
+        assert [model.is_service_active('WK', date) for date in (20250310, 20250311, 20250315, 20250316, 20250401)] \
+            == [True, False, True, False, False]
+        assert model.is_service_active('WK', 20250312)
+        assert model.get_counts()['services'] == 2
+
+
+def test_get_static_gtfs_reloads_on_change(gtfs_dir, monkeypatch):
+    monkeypatch.setattr(static_gtfs, 'CHANGE_CHECK_INTERVAL', 0)
+    first = get_static_gtfs(str(gtfs_dir))
+    assert get_static_gtfs(str(gtfs_dir)) is first
+
+    with open(gtfs_dir / 'routes.csv', 'a') as f:
+        f.write('7-2,TAM,T2,Jacou - Saint-Jean,0,FF0000,\n')
+    reloaded = get_static_gtfs(str(gtfs_dir))
+    assert reloaded is not first
+    assert reloaded.routes['7-2'].short_name == 'T2'
+
+
+def test_reload_does_not_block_other_callers(gtfs_dir, monkeypatch):
+    monkeypatch.setattr(static_gtfs, 'CHANGE_CHECK_INTERVAL', 0)
+    first = get_static_gtfs(str(gtfs_dir))
+    with open(gtfs_dir / 'routes.csv', 'a') as f:
+        f.write('7-2,TAM,T2,Jacou - Saint-Jean,0,FF0000,\n')
+
+    started = threading.Event()
+    release = threading.Event()
+    load = static_gtfs.load_static_gtfs
+
+    def slow_load(directory):
+        started.set()
+        release.wait(5)
+        return load(directory)
+
+    monkeypatch.setattr(static_gtfs, 'load_static_gtfs', slow_load)
+    results = []
+    reloading = threading.Thread(target=lambda: results.append(get_static_gtfs(str(gtfs_dir))))
+    reloading.start()
+    assert started.wait(5)
+    # The previous model is served while the reload runs
+    assert get_static_gtfs(str(gtfs_dir)) is first
+    release.set()
+    reloading.join(5)
+
+    assert '7-2' in results[0].routes
+    assert get_static_gtfs(str(gtfs_dir)) is results[0]
+
+
+def test_bundled_static_gtfs_loads():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    model = StaticGTFS(os.path.join(root, 'data', 'gtfs'))
+    assert model.get_counts()['trips'] > 0
+
+
+def test_binary_cache_round_trip(gtfs_dir):
+    parsed = load_static_gtfs(str(gtfs_dir))
+    cache_dirs = os.listdir(gtfs_dir / '.cache')
+    assert len(cache_dirs) == 1
+
+    cached = load_static_gtfs(str(gtfs_dir))
+    assert isinstance(cached.arrays['trip_route_codes'], np.memmap)
+    assert cached.get_counts() == parsed.get_counts()
+    assert cached.trips['T-A'].headsign == 'MOSSON'
+    assert cached.stops['5'].longitude == 3.878247
+    assert cached.is_service_active('06_1', 20250311)
+
+
+def test_binary_cache_follows_file_content(gtfs_dir):
+    load_static_gtfs(str(gtfs_dir))
+    with open(gtfs_dir / 'trips.csv', 'a') as f:
+        f.write('7-9,06_1,T-C,SAINT-JEAN,\n')
+
+    reloaded = load_static_gtfs(str(gtfs_dir))
+    assert reloaded.trips['T-C'].route.route_id == '7-9'
+    assert reloaded.trips['T-C'].direction_id is None
+    assert len(os.listdir(gtfs_dir / '.cache')) == 1
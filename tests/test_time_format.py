@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zoneinfo import ZoneInfo
+from app.core.time_format import (
+    MISSING, format_epoch, format_epochs, format_row_times, get_agency_timezone
+)
+
+PARIS = ZoneInfo('Europe/Paris')
+
+
+def test_format_epoch_formats():
+    assert format_epoch(1741687200, 'epoch') == 1741687200
+    assert format_epoch(1741687200, 'text', PARIS) == '2025-03-11 11:00:00'
+    assert format_epoch(1741687200, 'iso', PARIS) == '2025-03-11T11:00:00+01:00'
+    assert format_epoch(MISSING, 'text', PARIS) is None
+
+
+def test_format_epochs_matches_per_value_formatting():
+    values = [1741687200, MISSING, 1741687260, 1741687200]
+    assert format_epochs(values, 'text', PARIS) == [format_epoch(value, 'text', PARIS) for value in values]
+    assert format_epochs(values, 'epoch') == [1741687200, None, 1741687260, 1741687200]
+
+
+def test_format_row_times_copies_rows():
+    rows = [{'id': 'A', 'timestamp': 1741687200}, {'id': 'B', 'timestamp': None}]
+    formatted = format_row_times(rows, ['timestamp'], 'iso')
+
+    assert rows[0]['timestamp'] == 1741687200
+    assert formatted[1]['timestamp'] is None
+    assert format_row_times(rows, ['timestamp'], 'epoch') is rows
+
+
+def test_get_agency_timezone(tmp_path):
+    agency_file = tmp_path / 'agency.csv'
+    agency_file.write_text('agency_id,agency_name,agency_timezone\n1,Test,Europe/Paris\n')
+
+    assert get_agency_timezone(str(agency_file)) == PARIS
+    assert get_agency_timezone(str(tmp_path / 'missing.csv')) is None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.helpers import make_feed, stop_time_update, trip_update
+from app.core.columnar import decode_trip_updates
+from app.core.feed_cache import cached_process
+from app.core.trip_state import TripStateStore
+
+
+def make_trips_feed(timestamp, trips):
+    """
+    Build a trip update feed from {trip_id: [delay per stop]}, in order
+    """
+    return make_feed([
+        trip_update(trip_id, [
+            stop_time_update(f"{trip_id}-S{sequence}", sequence, delay) for sequence, delay in enumerate(delays, 1)
+        ], route_id=f"R-{trip_id}", start_date='20250311', timestamp=timestamp)
+        for trip_id, delays in trips.items()
+    ], timestamp)
+
+
+def assert_same_columns(columns, expected):
+    assert (columns.trip_ids, columns.route_ids, columns.stop_ids) == \
+        (expected.trip_ids, expected.route_ids, expected.stop_ids)
+    for name in expected.COLUMNS:
+        assert np.array_equal(getattr(columns, name), getattr(expected, name)), name
+
+
+def test_merge_decodes_changed_trips_only():
+    store = TripStateStore()
+    snapshots = [
+        make_trips_feed(1000, {'A': [60, 60], 'B': [0], 'C': [30, 30, 30], 'E': [10, 10, 10, 10]}),
+        # B changes, C is removed, D is added, and the order changes
+        make_trips_feed(1030, {'D': [90], 'A': [60, 60], 'B': [120], 'E': [10, 10, 10, 10]}),
+        # Only the update timestamps change
+        make_trips_feed(1060, {'D': [90], 'A': [60, 60], 'B': [120], 'E': [10, 10, 10, 10]})
+    ]
+    changes = [store.merge(feed, feed.header.timestamp) for feed in snapshots]
+
+    # The feeds are left as they were received
+    assert snapshots[2].entity[0].trip_update.timestamp == 1060
+    for feed in snapshots:
+        assert_same_columns(cached_process(decode_trip_updates, feed), decode_trip_updates(feed))
+    assert [trip_id for trip_id, _ in changes[0].added] == ['A', 'B', 'C', 'E']
+    assert (changes[1].added, changes[1].changed, changes[1].removed) == \
+        ([('D', '20250311')], [('B', '20250311')], [('C', '20250311')])
+    assert not changes[2]
+
+    stats = store.get_stats()
+    assert (stats['trips'], stats['stop_updates_decoded'], stats['stop_updates_reused']) == (4, 12, 14)
+
+
+def test_stop_changes_and_history():
+    store = TripStateStore(history_size=3)
+    for timestamp, trips in ((1000, {'A': [60, 60]}), (1030, {'A': [60, 90]}), (1060, {'A': [60, 90], 'B': [0]})):
+        store.merge(make_trips_feed(timestamp, trips), timestamp)
+        store.record_snapshot(timestamp)
+
+    trip = store.get_trips({'A'})[0]
+    assert (trip['first_seen'], trip['last_changed']) == (1000, 1030)
+    assert [stop['last_changed'] for stop in trip['stop_time_updates']] == [1000, 1030]
+    assert [trip['trip_id'] for trip in store.get_trips(since=1060)] == ['B']
+
+    assert store.changed_since(1000) == {'A', 'B'}
+    assert store.changed_since(1030) == {'B'}
+    assert store.changed_since(1060) == set()
+    store.merge(make_trips_feed(1090, {'A': [60, 90]}), 1090)
+    # The first merge is no longer remembered
+    assert store.changed_since(1000) is None